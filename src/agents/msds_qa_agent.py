@@ -13,19 +13,26 @@ from langgraph.types import Command
 
 from src.config import hp
 from src.core import ToolSet
-from src.model import GeminiClient, OllamaClient, SiliconflowClient
-from src.db import FaissDB
+from src.model import CachedEmbeddings, GeminiClient, OllamaClient, SiliconflowClient
+from src.db import FaissDB, ShardedFaissDB
 
 assert load_dotenv()
 client = GeminiClient()
 chat_model = client.get_chat_model()
 
+embed_model = CachedEmbeddings(SiliconflowClient().get_embed_model())
 tools = [
+    ToolSet.get_chem_fact_tool(),
     ToolSet.get_nrcc_chem_info_tool(),
     ToolSet.get_faiss_retriever_tool(
-        FaissDB(hp.knowledge_space, SiliconflowClient().get_embed_model()).get_db(),
+        (
+            ShardedFaissDB(hp.knowledge_space, embed_model)
+            if hp.faiss_num_shards > 1
+            else FaissDB(hp.knowledge_space, embed_model)
+        ),
         "faiss_retriever",
         "用于检索薄膜操作、磺化装置各组件维护保养方法、IKA旋转蒸发仪清洁消毒指南的检索工具等等实验室器件知识库",
+        search_mode=hp.faiss_search_mode,
     ),
 ]
 
@@ -49,7 +56,7 @@ async def chat_node(
     response = await llm_with_tool.ainvoke([system_message, *state["messages"]], config)
     if (
         isinstance(state["messages"][-1], ToolMessage)
-        and state["messages"][-1].name == "ChemInfoRetriever"
+        and state["messages"][-1].name in ("ChemFactRetriever", "ChemInfoRetriever")
     ):
         state["chem_info"] = json.loads(state["messages"][-1].content)
     if isinstance(response, AIMessage) and response.tool_calls:
@@ -21,13 +21,91 @@ class hp:
     gemini_embedding_model: str = "models/embedding-001"
 
     max_batch_size: int = 32
+    # 嵌入接口限流: 每秒请求数与突发容量, 每个批次计一次请求
+    embed_rate_limit: float = 20
+    embed_rate_burst: float = 20
+    # 构建向量库时同时在途的嵌入批次数
+    embed_concurrency: int = 4
+    # 图谱节点与边的嵌入缓存
+    embedding_cache_path: str = "/root/Documents/msds-qa/cache/embeddings.sqlite"
+    embedding_cache_size: int = 100_000
+    # 文本切分方式: section(按说明书的16个部分切分, 过长的部分按小节合并到max_section_size)
+    # | recursive(按max_chunk_size切分, 正文前加文件名). 切分方式记录在向量库中,
+    # 与已有向量库不一致时同步会重新切分全部文件
+    split_mode: str = "section"
+    max_section_size: int = 1500
     max_chunk_size: int = 256
+    # PDF解析方式: thread(线程池) | process(进程池, 每核一个进程), 文本提取受GIL限制,
+    # 大批量解析时使用进程池; 每个进程任务包含的文件数
+    parse_mode: str = "thread"
+    parse_workers: int | None = None
+    parse_chunk_size: int = 4
+    # PDF逐页文本缓存, 按文件内容哈希与解析器版本复用, None表示不缓存
+    parsed_text_cache_path: str | None = (
+        "/root/Documents/msds-qa/cache/parsed_text.sqlite"
+    )
 
     knowledge_space: str = "/root/Documents/msds-qa/kb"
+    # 以规则从说明书中抽取的化学品事实表, 按CAS号与名称直接查询
+    chem_fact_store_path: str = "/root/Documents/msds-qa/chem_facts.sqlite"
+    # FAISS索引类型: flat | hnsw | ivf_flat | ivf_pq
+    faiss_index_type: str = "flat"
+    faiss_nlist: int = 1024
+    faiss_pq_m: int = 64
+    faiss_hnsw_m: int = 32
+    faiss_train_size: int = 50000
+    faiss_nprobe: int = 16
+    faiss_ef_search: int = 64
+    # 以内存映射方式只读打开索引, 多个服务进程可共享页缓存
+    faiss_mmap: bool = True
+    # 知识库检索方式: vector | bm25 | hybrid
+    faiss_search_mode: str = "vector"
+    # 查询能解析出化学品名称或CAS号时只在该化学品的文本块中检索
+    faiss_prefilter: bool = False
+    # 分片数, 大于1时按源文件名哈希分片, 各分片独立构建并行检索
+    faiss_num_shards: int = 1
+    # 向量压缩: 标量量化方式 none | fp16 | int8, Matryoshka截断后保留的维度(None为不截断),
+    # 压缩后按 k * rescore_factor 取候选, 以全精度向量重排
+    faiss_quantization: str = "none"
+    faiss_truncate_dim: int | None = None
+    faiss_rescore_factor: int = 4
     knowledge_file_path: str = "/root/Documents/msds-qa/assets"
 
     neo4j_bolt_url: str = "bolt://192.168.215.3:7687"
     neo4j_username: str = "neo4j"
     neo4j_password: str = "password"
+    # 图检索方式: vector_index(服务端向量索引) | mirror(本地向量镜像) | scan(全图扫描)
+    neo4j_search_mode: str = "vector_index"
+    neo4j_entity_label: str = "Entity"
+    neo4j_vector_index: str = "entity_embed_index"
+    neo4j_mirror_path: str = "/root/Documents/msds-qa/graph_mirror"
+    # 本地向量镜像的压缩方式, 含义与faiss_quantization等相同
+    neo4j_mirror_quantization: str = "none"
+    neo4j_mirror_truncate_dim: int | None = None
+    neo4j_mirror_rescore_factor: int = 4
+    # 检索结果中每个节点最多展开的出边数, None表示不限制
+    neo4j_max_fanout: int | None = None
+    # 多关键词检索结果的融合方式: rrf(倒数排名融合) | max(取最高相似度)
+    neo4j_fusion_method: str = "rrf"
+    neo4j_write_batch_size: int = 1000
+    # 异步检索使用的连接池大小与超时(秒)
+    neo4j_pool_size: int = 16
+    neo4j_acquisition_timeout: float = 30.0
+    neo4j_connection_timeout: float = 15.0
+    neo4j_query_timeout: float | None = 30.0
 
     max_retry: int = 1
+
+    # 实体抽取时各服务商的限额: 最大并发文本块数, 每分钟请求数, 每分钟token数
+    siliconflow_concurrency: int = 16
+    siliconflow_rpm: int = 1000
+    siliconflow_tpm: int = 50000
+    gemini_concurrency: int = 4
+    gemini_rpm: int = 10
+    gemini_tpm: int = 250000
+    ollama_concurrency: int = 4
+    ollama_rpm: int = 600
+    ollama_tpm: int = 1000000
+    extraction_max_retry: int = 5
+    extraction_backoff: float = 2.0
+    extraction_store_path: str = "/root/Documents/msds-qa/cache/extractions.sqlite"
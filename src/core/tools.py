@@ -1,9 +1,16 @@
 from langchain.tools.retriever import create_retriever_tool
+from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import BaseTool, Tool
 from langchain_core.vectorstores import VectorStore
 
-from src.db import Neo4jDB
-from src.retriever import ChemInfoRetriever, Neo4jRetriever
+from src.config import hp
+from src.db import ChemFactStore, FaissDB, Neo4jDB, ShardedFaissDB
+from src.retriever import (
+    ChemFactRetriever,
+    ChemInfoRetriever,
+    FaissRetriever,
+    Neo4jRetriever,
+)
 
 
 class ToolSet:
@@ -12,19 +19,38 @@ class ToolSet:
 
     @staticmethod
     def get_faiss_retriever_tool(
-        db: VectorStore,
+        db: VectorStore | FaissDB | ShardedFaissDB,
         name: str,
         description: str,
+        search_mode: str = "vector",
     ) -> Tool:
-        """创建一个检索工具"""
-        retriever = db.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 10, "score_threshold": 0.15},
-        )
+        """
+        创建一个检索工具
+
+        :param db: 向量库, BM25与混合检索需传入FaissDB或ShardedFaissDB
+        :param search_mode: vector | bm25 | hybrid
+        """
+        if isinstance(db, (FaissDB, ShardedFaissDB)):
+            retriever = FaissRetriever(
+                db=db, search_mode=search_mode, k=10, score_threshold=0.15
+            )
+            # 化学品名称与所属部分记录在元数据中, 展示给模型时放在正文前
+            document_prompt = PromptTemplate.from_template(
+                "<{chemical}> {section}\n{page_content}"
+            )
+        elif search_mode == "vector":
+            retriever = db.as_retriever(
+                search_type="similarity_score_threshold",
+                search_kwargs={"k": 10, "score_threshold": 0.15},
+            )
+            document_prompt = None
+        else:
+            raise ValueError(f"{search_mode} 检索需要传入FaissDB")
         retriever = create_retriever_tool(
             retriever=retriever,
             name=name,
             description=description,
+            document_prompt=document_prompt,
         )
         return retriever
 
@@ -42,6 +68,11 @@ class ToolSet:
         """nrcc化学品信息检索工具"""
         return ChemInfoRetriever()
 
+    @staticmethod
+    def get_chem_fact_tool(store_path: str = hp.chem_fact_store_path) -> BaseTool:
+        """本地化学品事实表查询工具"""
+        return ChemFactRetriever(store=ChemFactStore(store_path))
+
 
 if __name__ == "__main__":
     search_tool: BaseTool = ToolSet.get_nrcc_chem_info_tool()
@@ -1,2 +1,5 @@
+from .chem_fact_store import ChemFactStore
+from .extraction_store import ExtractionStore
 from .faiss_db import FaissDB
 from .neo4j_db import Neo4jDB
+from .sharded_faiss_db import ShardedFaissDB
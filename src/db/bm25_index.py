@@ -0,0 +1,202 @@
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+from src.parser import CAS_PATTERN
+
+# CAS号与UN编号作为整体词项, 不参与字符切分
+UN_PATTERN = re.compile(r"(?<![a-z])UN\s*(\d{4})(?!\d)", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿]+")
+# 分词方式变化时递增, 旧版本的索引在打开时清空, 由FaissDB.sync重建
+TOKENIZER_VERSION = 2
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    面向中文MSDS文本的分词: 汉字按相邻双字切分(单个汉字保留为一个词项), 英文与数字按词切分,
+    CAS号与UN编号保持完整. 不切分单字, 否则 "的"、"性" 等高频字的倒排表接近整个语料
+
+    :param text: 文本
+    :return: 词项列表
+    """
+    tokens = CAS_PATTERN.findall(text)
+    # "UN1090"同时记为编号本身, 以匹配"UN编号: 1090"的写法
+    for number in UN_PATTERN.findall(text):
+        tokens += [f"un{number}", number]
+    rest = UN_PATTERN.sub(" ", CAS_PATTERN.sub(" ", text)).lower()
+
+    tokens += WORD_PATTERN.findall(rest)
+    for run in CJK_PATTERN.findall(rest):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[idx : idx + 2] for idx in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25词法索引
+
+    倒排表与文档长度保存在SQLite中, 与FAISS索引位于同一目录, 文档id与向量库中的id一致.
+    与SqliteDocstore相同, 写入在事务中累积, 调用commit后生效.
+    """
+
+    def __init__(self, index_path: str, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        :param index_path: SQLite文件路径
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        """
+        self.index_path: str = index_path
+        self.k1: float = k1
+        self.b: float = b
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != TOKENIZER_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS postings")
+            self.conn.execute("DROP TABLE IF EXISTS docs")
+            self.conn.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, length INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_id TEXT, tf INTEGER)"
+        )
+        # (term, doc_id)上的覆盖索引: 统计文档频率与按候选文档取倒排项都不需回表
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS postings_term ON postings (term, doc_id, tf)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+        self.conn.commit()
+
+    def add(self, ids: list[str], texts: list[str]) -> None:
+        """
+        添加文档
+
+        :param ids: 文档id
+        :param texts: 与id一一对应的文本
+        """
+        docs, postings = [], []
+        for doc_id, text in zip(ids, texts):
+            tokens = tokenize(text)
+            docs.append((doc_id, len(tokens)))
+            postings.extend((term, doc_id, tf) for term, tf in Counter(tokens).items())
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO docs (doc_id, length) VALUES (?, ?)", docs
+            )
+            self.conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings
+            )
+
+    def delete(self, ids: list[str]) -> None:
+        """
+        删除文档
+
+        :param ids: 文档id
+        """
+        rows = [(doc_id,) for doc_id in ids]
+        with self.lock:
+            self.conn.executemany("DELETE FROM postings WHERE doc_id = ?", rows)
+            self.conn.executemany("DELETE FROM docs WHERE doc_id = ?", rows)
+
+    def get_stats(self, query: str) -> tuple[int, int, dict[str, int]]:
+        """
+        计算BM25得分所需的语料统计. 分片检索时将各分片的统计相加, 得到全局的统计
+
+        :param query: 查询文本
+        :return: 文档数, 文档总长度, 查询中各词项的文档频率
+        """
+        terms = set(tokenize(query))
+        with self.lock:
+            num_docs, total_length = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+            ).fetchone()
+            df = {
+                term: self.conn.execute(
+                    "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+                ).fetchone()[0]
+                for term in terms
+            }
+        return num_docs, total_length, df
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        doc_ids: list[str] | None = None,
+        stats: tuple[int, int, dict[str, int]] | None = None,
+    ) -> list[tuple[str, float]]:
+        """
+        按BM25得分检索. 文档频率与平均长度按全部文档统计, 给定候选文档时只读取
+        候选文档的倒排项
+
+        :param query: 查询文本
+        :param k: 返回的文档数
+        :param doc_ids: 候选文档id, None表示检索全部文档
+        :param stats: get_stats格式的语料统计, None时使用本索引的统计;
+            分片检索时传入全部分片的统计之和, 各分片的得分才可比较
+        :return: 按得分降序排列的(文档id, 得分)
+        """
+        terms = set(tokenize(query))
+        if not terms or (doc_ids is not None and not doc_ids):
+            return []
+        num_docs, total_length, df = stats or self.get_stats(query)
+        if not num_docs:
+            return []
+        avg_length = total_length / num_docs or 1.0
+
+        if doc_ids is None:
+            postings_sql = (
+                "SELECT p.doc_id, p.tf, d.length FROM postings p "
+                "JOIN docs d ON p.doc_id = d.doc_id WHERE p.term = ?"
+            )
+            candidates = ()
+        else:
+            # 候选文档id以JSON数组传入, 不受SQL参数个数的限制
+            postings_sql = (
+                "SELECT p.doc_id, p.tf, d.length FROM json_each(?) c CROSS "
+                "JOIN postings p ON p.term = ? AND p.doc_id = c.value "
+                "JOIN docs d ON p.doc_id = d.doc_id"
+            )
+            candidates = (json.dumps(doc_ids),)
+
+        scores = defaultdict(float)
+        with self.lock:
+            for term in terms:
+                if not df.get(term):
+                    continue
+                idf = math.log(1 + (num_docs - df[term] + 0.5) / (df[term] + 0.5))
+                rows = self.conn.execute(postings_sql, (*candidates, term))
+                for doc_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def count(self) -> int:
+        """已索引的文档数"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def commit(self) -> None:
+        """提交累积的写入"""
+        with self.lock:
+            self.conn.commit()
+
+    def clear(self) -> None:
+        """清空索引"""
+        with self.lock:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.execute("DELETE FROM docs")
+            self.conn.commit()
@@ -0,0 +1,166 @@
+import logging
+import os
+import sqlite3
+import threading
+
+from src.parser import CAS_PATTERN, MsdsFieldExtractor, MsdsParser
+from src.toolkits import ChemInfoModel, get_file_hash
+
+# 与ChemInfoModel字段一一对应的列
+FACT_FIELDS = list(ChemInfoModel.model_fields)
+
+
+class ChemFactStore:
+    """
+    化学品事实表
+
+    以确定性规则从说明书中抽取ChemInfoModel的字段, 每个源文件一行、每个字段一列保存在
+    SQLite中, 并按CAS号与化学品名称建立索引. 闪点、爆炸极限等事实性问题可直接查表,
+    不需要向量检索与大模型. 按文件内容哈希增量同步.
+    """
+
+    def __init__(self, store_path: str) -> None:
+        """
+        :param store_path: SQLite文件路径
+        """
+        self.store_path: str = store_path
+        self.extractor = MsdsFieldExtractor()
+        self.names: list[str] | None = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(store_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS facts (source TEXT PRIMARY KEY, "
+            f"file_hash TEXT, {', '.join(f'{field} TEXT' for field in FACT_FIELDS)})"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS facts_cas ON facts (chemCas)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS facts_name ON facts (chemName)")
+        self.conn.commit()
+
+    def get_hashes(self) -> dict[str, str]:
+        """已入库的源文件 -> 文件内容哈希"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT source, file_hash FROM facts"))
+
+    def put(self, source: str, file_hash: str, fields: dict[str, str]) -> None:
+        """
+        写入一个源文件的字段, 已存在时覆盖
+
+        :param source: 源文件
+        :param file_hash: 文件内容哈希
+        :param fields: ChemInfoModel字段 -> 取值
+        """
+        columns = ["source", "file_hash", *FACT_FIELDS]
+        values = [source, file_hash, *(fields.get(field, "") for field in FACT_FIELDS)]
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO facts ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                values,
+            )
+            self.names = None
+
+    def delete(self, sources: list[str]) -> None:
+        """
+        删除源文件的字段
+
+        :param sources: 源文件
+        """
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM facts WHERE source = ?", [(source,) for source in sources]
+            )
+            self.names = None
+
+    def commit(self) -> None:
+        """提交累积的写入"""
+        with self.lock:
+            self.conn.commit()
+
+    def sync(self, files: list[str]) -> dict[str, int]:
+        """
+        按文件清单增量同步: 解析并抽取新增与内容变化的文件, 删除已不存在的文件
+
+        :param files: 当前知识库中的全部源文件
+        :return: 新增、修改、删除的文件数
+        """
+        stored = self.get_hashes()
+        hashes = {file: get_file_hash(file) for file in files}
+        changed = [file for file in files if stored.get(file) != hashes[file]]
+        removed = [source for source in stored if source not in hashes]
+
+        self.delete(removed)
+        if changed:
+            # 逐页文本缓存命中时不需要重新解码PDF
+            parser = MsdsParser(changed, split_mode="section")
+            for file, docs in zip(changed, parser.map_files()):
+                self.put(file, hashes[file], self.extractor.extract(docs))
+        self.commit()
+
+        stats = {
+            "added": sum(file not in stored for file in changed),
+            "modified": sum(file in stored for file in changed),
+            "removed": len(removed),
+        }
+        logging.info(f"化学品事实表已同步: {stats}")
+        return stats
+
+    def get_names(self) -> list[str]:
+        """全部化学品名称, 按长度降序排列, 以便优先匹配较长的名称"""
+        with self.lock:
+            if self.names is None:
+                rows = self.conn.execute(
+                    "SELECT DISTINCT chemName FROM facts WHERE chemName != ''"
+                ).fetchall()
+                self.names = sorted((row[0] for row in rows), key=len, reverse=True)
+            return self.names
+
+    def lookup(
+        self, cas: str | None = None, name: str | None = None
+    ) -> dict[str, str] | None:
+        """
+        按CAS号或化学品名称查询, 同时给出时优先CAS号
+
+        :param cas: CAS号
+        :param name: 化学品名称
+        :return: ChemInfoModel字段 -> 取值, 不存在时返回None
+        """
+        if cas:
+            sql, params = "SELECT * FROM facts WHERE chemCas = ?", (cas,)
+        elif name:
+            sql, params = "SELECT * FROM facts WHERE chemName = ?", (name,)
+        else:
+            return None
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        return {
+            column: value
+            for column, value in zip(columns, row)
+            if column in FACT_FIELDS
+        }
+
+    def resolve(self, query: str) -> dict[str, str] | None:
+        """
+        从查询文本中解析化学品并查询: 优先匹配CAS号, 其次匹配最长的已知化学品名称
+
+        :param query: 查询文本, 如 "甲苯的闪点" 或 "108-88-3"
+        :return: ChemInfoModel字段 -> 取值, 无法解析时返回None
+        """
+        match = CAS_PATTERN.search(query)
+        if match and (fields := self.lookup(cas=match.group())):
+            return fields
+        for name in self.get_names():
+            if name in query:
+                return self.lookup(name=name)
+        return None
+
+    def count(self) -> int:
+        """已入库的源文件数"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
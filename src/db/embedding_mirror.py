@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# 镜像中向量的存储类型
+MIRROR_DTYPES = {"none": np.float32, "fp16": np.float16, "int8": np.int8}
+# 计算相似度时每次反量化的行数, 避免一次性展开整个镜像
+SCORE_CHUNK_SIZE = 65536
+
+
+class EmbeddingMirror:
+    """
+    图数据库节点嵌入向量的本地镜像
+
+    归一化后的嵌入向量以float32连续矩阵的形式保存在磁盘上并通过内存映射读取,
+    节点id按升序保存在等长的id数组中, 通过节点的updated_at属性进行增量同步.
+    可选地只保留前若干维(Matryoshka截断)并以fp16或int8保存, int8按行对称量化,
+    每行的缩放系数保存在scales.npy中. 压缩后的得分只用于粗排, 由调用方以全精度向量重排.
+
+    每次保存写入新的版本目录, 再以一次rename替换state.json发布, 读取方总是看到
+    同一版本的向量与id. 上一个版本保留到下次保存, 供已读取state.json的进程打开.
+    """
+
+    def __init__(
+        self,
+        mirror_path: str,
+        quantization: str = "none",
+        truncate_dim: int | None = None,
+    ) -> None:
+        """
+        :param mirror_path: 镜像目录
+        :param quantization: none | fp16 | int8
+        :param truncate_dim: 保留的向量维度, None表示不截断
+        """
+        if quantization not in MIRROR_DTYPES:
+            raise ValueError(
+                f"不支持的量化方式: {quantization}, 可选: {list(MIRROR_DTYPES)}"
+            )
+        self.mirror_path: str = mirror_path
+        self.quantization: str = quantization
+        self.truncate_dim: int | None = truncate_dim
+        self.state_path: str = os.path.join(mirror_path, "state.json")
+        # 保存时在锁内整体替换内存中的镜像, 检索线程读取到的id与向量始终属于同一版本
+        self.lock = threading.Lock()
+
+        self.version: str | None = None
+        self.watermark: float | None = None
+        self.ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self.stamps: np.ndarray = np.empty(0, dtype=np.float64)
+        self.embeds: np.ndarray = np.empty((0, 0), dtype=MIRROR_DTYPES[quantization])
+        self.scales: np.ndarray = np.empty(0, dtype=np.float32)
+        self.load()
+
+    @property
+    def compact(self) -> bool:
+        """镜像中的向量是否经过量化或截断, 此时得分需以全精度向量重排"""
+        return self.quantization != "none" or self.truncate_dim is not None
+
+    def is_mirror_exists(self) -> bool:
+        """检查本地镜像是否存在"""
+        return os.path.exists(self.state_path)
+
+    def load(self) -> None:
+        """加载本地镜像"""
+        if not self.is_mirror_exists():
+            return
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if "version" not in state:
+            logging.warning("本地向量镜像为旧版格式，将全量重建")
+            return
+        stored = (state.get("quantization", "none"), state.get("truncate_dim"))
+        if stored != (self.quantization, self.truncate_dim):
+            # 压缩方式变化时视为没有镜像, 下次同步时全量重建
+            logging.warning(
+                f"本地向量镜像的压缩方式 {stored} 与当前配置不一致，将全量重建"
+            )
+            return
+        version_path = os.path.join(self.mirror_path, state["version"])
+        self.version = state["version"]
+        self.watermark = state["watermark"]
+        self.ids = np.load(os.path.join(version_path, "ids.npy"))
+        self.stamps = np.load(os.path.join(version_path, "stamps.npy"))
+        self.embeds = np.load(os.path.join(version_path, "embeds.npy"), mmap_mode="r")
+        if self.quantization == "int8":
+            self.scales = np.load(os.path.join(version_path, "scales.npy"))
+
+    def save(
+        self,
+        ids: np.ndarray,
+        stamps: np.ndarray,
+        embeds: np.ndarray,
+        scales: np.ndarray,
+        watermark: float | None,
+    ) -> None:
+        """写入新的版本目录, 再以一次rename替换state.json发布该版本"""
+        version = f"v{time.time_ns()}"
+        version_path = os.path.join(self.mirror_path, version)
+        os.makedirs(version_path)
+
+        out = np.lib.format.open_memmap(
+            os.path.join(version_path, "embeds.npy"),
+            mode="w+",
+            dtype=embeds.dtype,
+            shape=embeds.shape,
+        )
+        out[:] = embeds
+        out.flush()
+        del out
+        np.save(os.path.join(version_path, "ids.npy"), ids)
+        np.save(os.path.join(version_path, "stamps.npy"), stamps)
+        if self.quantization == "int8":
+            np.save(os.path.join(version_path, "scales.npy"), scales)
+
+        tmp_state_path = self.state_path + ".tmp"
+        with open(tmp_state_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": version,
+                    "watermark": watermark,
+                    "size": int(len(ids)),
+                    "quantization": self.quantization,
+                    "truncate_dim": self.truncate_dim,
+                },
+                f,
+            )
+        os.replace(tmp_state_path, self.state_path)
+        self.remove_stale_versions(keep={version, self.version})
+
+        embeds = np.load(os.path.join(version_path, "embeds.npy"), mmap_mode="r")
+        with self.lock:
+            self.version = version
+            self.watermark = watermark
+            self.ids = ids
+            self.stamps = stamps
+            self.embeds = embeds
+            self.scales = scales
+
+    def remove_stale_versions(self, keep: set[str | None]) -> None:
+        """删除当前与上一个版本之外的版本目录及旧版格式的文件"""
+        for name in os.listdir(self.mirror_path):
+            path = os.path.join(self.mirror_path, name)
+            if name in keep or name == "state.json":
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith(".npy"):
+                os.remove(path)
+
+    @staticmethod
+    def normalize(embeds: np.ndarray) -> np.ndarray:
+        """按行L2归一化, 使点积等价于余弦相似度"""
+        norms = np.linalg.norm(embeds, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeds / norms
+
+    def prepare(self, embeds: np.ndarray) -> np.ndarray:
+        """截断到镜像维度并归一化"""
+        if self.truncate_dim is not None:
+            embeds = embeds[:, : self.truncate_dim]
+        return self.normalize(np.asarray(embeds, dtype=np.float32))
+
+    def encode(self, embeds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        按镜像的量化方式编码归一化后的向量
+
+        :return: 编码后的向量, int8量化时每行的缩放系数(其他情况为空数组)
+        """
+        if self.quantization != "int8":
+            return embeds.astype(MIRROR_DTYPES[self.quantization]), np.empty(
+                0, dtype=np.float32
+            )
+        scales = np.abs(embeds).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.round(embeds / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def get_changed(self, records: list[dict]) -> list[dict]:
+        """
+        过滤掉镜像中已有且updated_at未变化的记录. 增量同步按 >= 水位线查询,
+        水位线附近的节点会被重复拉取, 以节点id与updated_at去重
+
+        :param records: 包含id, embed, updated_at的节点记录
+        """
+        if not len(self.ids):
+            return records
+        stamps = dict(zip(self.ids.tolist(), self.stamps.tolist()))
+        return [
+            record
+            for record in records
+            if record["updated_at"] is None
+            or stamps.get(record["id"]) != record["updated_at"]
+        ]
+
+    def get_merged_size(self, records: list[dict]) -> int:
+        """合并记录后镜像中的节点数, 与图数据库中的节点数不一致时说明有节点被删除"""
+        new_ids = np.array([record["id"] for record in records], dtype=np.int64)
+        return len(np.union1d(self.ids, new_ids))
+
+    def apply(self, records: list[dict], live_ids: list[int] | None = None) -> int:
+        """
+        合并增量记录, 已存在的节点覆盖原向量, 新节点追加到镜像中
+
+        :param records: 包含id, embed, updated_at的节点记录
+        :param live_ids: 图数据库中现存的全部节点id, 给出时删除镜像中不在其中的节点
+        :return: 合并与删除的节点数
+        """
+        records = self.get_changed(records)
+        removed = (
+            np.empty(0, dtype=np.int64)
+            if live_ids is None
+            else np.setdiff1d(self.ids, np.asarray(live_ids, dtype=np.int64))
+        )
+        if not records and not len(removed):
+            return 0
+
+        all_ids, all_stamps = self.ids, self.stamps
+        all_embeds, all_scales = self.embeds, self.scales
+        timestamps = [] if self.watermark is None else [self.watermark]
+        if records:
+            new_ids = np.array([record["id"] for record in records], dtype=np.int64)
+            new_stamps = np.array(
+                [record["updated_at"] or 0.0 for record in records], dtype=np.float64
+            )
+            new_embeds, new_scales = self.encode(
+                self.prepare(np.array([record["embed"] for record in records]))
+            )
+            timestamps += [
+                record["updated_at"]
+                for record in records
+                if record["updated_at"] is not None
+            ]
+            if len(self.ids) and self.embeds.shape[1] == new_embeds.shape[1]:
+                all_ids = np.concatenate([self.ids, new_ids])
+                all_stamps = np.concatenate([self.stamps, new_stamps])
+                all_embeds = np.concatenate([self.embeds, new_embeds])
+                all_scales = np.concatenate([self.scales, new_scales])
+            else:
+                # 首次同步或嵌入维度变化时以增量记录重建镜像
+                all_ids, all_stamps = new_ids, new_stamps
+                all_embeds, all_scales = new_embeds, new_scales
+
+        # 重复id保留最后一次出现的向量, 结果按id升序排列, 再去掉已删除的节点
+        _, reversed_index = np.unique(all_ids[::-1], return_index=True)
+        keep = len(all_ids) - 1 - reversed_index
+        keep = keep[~np.isin(all_ids[keep], removed)]
+
+        scales = all_scales[keep] if self.quantization == "int8" else all_scales
+        self.save(
+            all_ids[keep],
+            all_stamps[keep],
+            all_embeds[keep],
+            scales,
+            max(timestamps, default=None),
+        )
+        return len(records) + len(removed)
+
+    def score(
+        self, query_embedding: list[list[float]]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        计算查询向量与镜像中所有节点的余弦相似度, 量化时为近似值
+
+        :param query_embedding: 查询向量
+        :return: 节点id, 形状为(查询数, 节点数)的相似度矩阵
+        """
+        with self.lock:
+            ids, embeds, scales = self.ids, self.embeds, self.scales
+        query = self.prepare(np.asarray(query_embedding, dtype=np.float32))
+        if self.quantization == "none":
+            return ids, query @ embeds.T
+
+        scores = np.empty((len(query), len(ids)), dtype=np.float32)
+        for start in range(0, len(ids), SCORE_CHUNK_SIZE):
+            chunk = np.asarray(embeds[start : start + SCORE_CHUNK_SIZE], dtype=np.float32)
+            scores[:, start : start + len(chunk)] = query @ chunk.T
+        if self.quantization == "int8":
+            scores *= scales
+        return ids, scores
+
+    def clear(self) -> None:
+        """删除本地镜像"""
+        if os.path.exists(self.mirror_path):
+            shutil.rmtree(self.mirror_path)
+        with self.lock:
+            self.version = None
+            self.watermark = None
+            self.ids = np.empty(0, dtype=np.int64)
+            self.stamps = np.empty(0, dtype=np.float64)
+            self.embeds = np.empty((0, 0), dtype=MIRROR_DTYPES[self.quantization])
+            self.scales = np.empty(0, dtype=np.float32)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator
+
+
+class ExtractionStore:
+    """
+    实体抽取结果存储
+
+    以 (文本块哈希, 提示词版本, 模型名称) 为键在SQLite中保存每个文本块解析出的
+    (maybe_nodes, maybe_edges), 中断后重跑或语料更新时只需处理新增或变化的文本块.
+    """
+
+    def __init__(self, store_path: str, prompt_version: str, model_name: str) -> None:
+        """
+        :param store_path: SQLite文件路径
+        :param prompt_version: 实体抽取提示词版本
+        :param model_name: 抽取所用的模型名称
+        """
+        self.store_path: str = store_path
+        self.prompt_version: str = prompt_version
+        self.model_name: str = model_name
+
+        os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(store_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "chunk_hash TEXT, prompt_version TEXT, model_name TEXT, "
+            "nodes TEXT, edges TEXT, created_at REAL, "
+            "PRIMARY KEY (chunk_hash, prompt_version, model_name))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def get_chunk_hash(content: str) -> str:
+        """计算文本块的内容哈希"""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def dump_result(
+        maybe_nodes: dict[str, list[dict]], maybe_edges: dict[tuple, list[dict]]
+    ) -> tuple[str, str]:
+        """序列化抽取结果, 边的键为元组, 以列表形式保存"""
+        return (
+            json.dumps(maybe_nodes, ensure_ascii=False),
+            json.dumps([[list(k), v] for k, v in maybe_edges.items()], ensure_ascii=False),
+        )
+
+    @staticmethod
+    def load_result(nodes: str, edges: str) -> tuple[dict, dict]:
+        """反序列化抽取结果"""
+        return json.loads(nodes), {tuple(k): v for k, v in json.loads(edges)}
+
+    def get(self, content: str) -> tuple[dict, dict] | None:
+        """
+        查询文本块的抽取结果
+
+        :param content: 文本块内容
+        :return: (maybe_nodes, maybe_edges), 不存在时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT nodes, edges FROM extractions "
+                "WHERE chunk_hash = ? AND prompt_version = ? AND model_name = ?",
+                (self.get_chunk_hash(content), self.prompt_version, self.model_name),
+            ).fetchone()
+        return None if row is None else self.load_result(*row)
+
+    def put(
+        self,
+        content: str,
+        maybe_nodes: dict[str, list[dict]],
+        maybe_edges: dict[tuple, list[dict]],
+    ) -> None:
+        """
+        保存文本块的抽取结果
+
+        :param content: 文本块内容
+        :param maybe_nodes: 解析出的节点
+        :param maybe_edges: 解析出的边
+        """
+        nodes, edges = self.dump_result(maybe_nodes, maybe_edges)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.get_chunk_hash(content),
+                    self.prompt_version,
+                    self.model_name,
+                    nodes,
+                    edges,
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def iter_results(self) -> Iterator[tuple[dict, dict]]:
+        """按写入顺序遍历当前提示词版本与模型下的全部抽取结果"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT nodes, edges FROM extractions "
+                "WHERE prompt_version = ? AND model_name = ? ORDER BY created_at",
+                (self.prompt_version, self.model_name),
+            ).fetchall()
+        for row in rows:
+            yield self.load_result(*row)
+
+    def count(self) -> int:
+        """当前提示词版本与模型下已保存的文本块数"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM extractions "
+                "WHERE prompt_version = ? AND model_name = ?",
+                (self.prompt_version, self.model_name),
+            ).fetchone()[0]
@@ -1,76 +1,669 @@
+import itertools
+import json
 import logging
 import os
 import shutil
-from typing import Optional
+import uuid
+from collections import defaultdict
+from collections.abc import Sized
+from typing import Iterable, Iterator, Optional
 
+import faiss
+import numpy as np
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores.base import VectorStoreRetriever
+from tqdm import tqdm
 
 from src.config import hp
-from src.toolkits import check_db_exists, parallel_map
+from src.db.bm25_index import BM25Index
+from src.db.faiss_index import (
+    TruncatedEmbeddings,
+    create_index,
+    get_quantization,
+    get_recall_report,
+    rescore,
+    search_subset,
+    supports_mmap,
+    supports_removal,
+    set_search_params,
+    train_index,
+    truncate_vectors,
+)
+from src.db.metadata_index import MetadataIndex
+from src.db.sqlite_docstore import SqliteDocstore, SqliteIndexMap
+from src.parser import MsdsParser
+from src.toolkits import (
+    TokenBucket,
+    check_db_exists,
+    file_lock,
+    fuse_rankings,
+    get_file_hash,
+    parallel_map,
+    pipelined_map,
+)
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+# 旧版数据库以pickle保存的文档库
+LEGACY_DOCSTORE_FILE = "index.pkl"
+LEXICAL_INDEX_FILE = "bm25.sqlite"
+METADATA_INDEX_FILE = "metadata.sqlite"
+# 多个进程加载同一数据库时, 迁移旧版文档库与重建词法索引、元数据索引均在该锁内进行
+LOCK_FILE = "db.lock"
+# 索引经过量化或截断时保存的全精度向量, 行号与索引中的向量位置一致
+FULL_VECTORS_FILE = "vectors.npy"
+# 尚未合并到FULL_VECTORS_FILE的新增全精度向量, 以原始float32追加写入
+PENDING_VECTORS_FILE = "vectors.pending"
+# 构建数据库时的参数, 目前只记录文本切分方式
+BUILD_INFO_FILE = "build_info.json"
 
 
 class FaissDB:
 
     def __init__(self, db_path: str, embed_model: Embeddings, **kwargs) -> None:
         self.db_path: str = db_path
+        self.manifest_path: str = os.path.join(db_path, "manifest.json")
         self.embed_model: Embeddings = embed_model
-        self.documents: list[Document] = kwargs.get("documents", [])
+        # 同时在途的嵌入批次数与嵌入接口限流器
+        self.embed_concurrency: int = kwargs.get(
+            "embed_concurrency", hp.embed_concurrency
+        )
+        self.embed_limiter: TokenBucket = kwargs.get("embed_limiter") or TokenBucket(
+            hp.embed_rate_limit, hp.embed_rate_burst
+        )
+        # 新建数据库时使用的索引类型及参数, 加载已有数据库时以磁盘上的索引为准
+        self.index_type: str = kwargs.get("index_type", hp.faiss_index_type)
+        self.index_params: dict = {
+            "nlist": kwargs.get("nlist", hp.faiss_nlist),
+            "pq_m": kwargs.get("pq_m", hp.faiss_pq_m),
+            "hnsw_m": kwargs.get("hnsw_m", hp.faiss_hnsw_m),
+        }
+        self.quantization: str = kwargs.get("quantization", hp.faiss_quantization)
+        self.truncate_dim: Optional[int] = kwargs.get(
+            "truncate_dim", hp.faiss_truncate_dim
+        )
+        self.rescore_factor: int = kwargs.get("rescore_factor", hp.faiss_rescore_factor)
+        self.store_full_vectors: bool = (
+            self.quantization != "none" or self.truncate_dim is not None
+        )
+        # 全精度向量, 以及尚未合并的新增向量数与待删除的行
+        self.full_vectors: Optional[np.ndarray] = None
+        self.pending_path: str = os.path.join(db_path, PENDING_VECTORS_FILE)
+        self.num_pending: int = 0
+        self.removed_positions: list[int] = []
+        self.train_size: int = kwargs.get("train_size", hp.faiss_train_size)
+        self.nprobe: int = kwargs.get("nprobe", hp.faiss_nprobe)
+        self.ef_search: int = kwargs.get("ef_search", hp.faiss_ef_search)
+        self.mmap: bool = kwargs.get("mmap", hp.faiss_mmap)
+        self.prefilter: bool = kwargs.get("prefilter", hp.faiss_prefilter)
+        # 增量同步时解析文件的最大进程数, 分片构建时由各分片分摊CPU核数
+        self.parse_workers: Optional[int] = kwargs.get(
+            "parse_workers", hp.parse_workers
+        )
+        # 文本切分方式, 创建时记录在数据库中, 与已有数据库不一致时同步会重新切分全部文件
+        self.split_mode: str = kwargs.get("split_mode", hp.split_mode)
+        self.index_mapped: bool = False
         self.db_exists = self.is_db_exists()
-        self.db: FAISS = self.load_db()
 
-    def __post_init__(self):
-        del self.documents
+        # 新建数据库时documents可以是生成器, 边解析边嵌入写入, 不在内存中保留整个语料
+        documents: Optional[Iterable[Document]] = kwargs.get("documents")
+        # 解析出documents的全部源文件, 未切分出文档的文件(如扫描版PDF)也记录到文件清单,
+        # 同步时不再重复解析; 未提供时只记录切分出文档的文件
+        self.source_files: list[str] = kwargs.get("files") or []
+        if not self.db_exists and not documents:
+            raise ValueError("数据库不存在且未提供文档，无法创建FAISS数据库。")
+        # 新建时由create_db打开, 文本块在嵌入的同时写入; 加载已有数据库时在加载成功后打开
+        self.lexical_index: Optional[BM25Index] = None
+        self.metadata_index: Optional[MetadataIndex] = None
+        self.db: FAISS = self.load_db(documents)
+        # 加载时只检查不重建, 不一致时词法检索与预过滤不可用, 由sync重建
+        self.indexes_ready: bool = True
+        if self.lexical_index is None:
+            self.lexical_index, self.metadata_index = self.open_indexes()
+            self.indexes_ready = self.check_indexes()
+            if not self.indexes_ready:
+                logging.warning(
+                    f"{self.db_path} 的词法索引与元数据索引与向量库不一致, "
+                    "同步数据库前只使用向量检索"
+                )
+        if self.db_exists:
+            stored_mode = self.load_split_mode()
+            if stored_mode != self.split_mode:
+                logging.warning(
+                    f"{self.db_path} 的文本切分方式为 {stored_mode or '未知'}, "
+                    f"与当前的 {self.split_mode} 不一致, 同步数据库时重新切分全部文件"
+                )
 
     def is_db_exists(self) -> bool:
         """检查FAISS数据库是否存在"""
         return os.path.exists(self.db_path) and os.path.isdir(self.db_path)
 
-    def create_db(self, documents: list[Document]) -> FAISS:
-        """创建FAISS数据库"""
+    def create_db(self, documents: Iterable[Document]) -> FAISS:
+        """创建FAISS数据库, 文档流式地解析、嵌入并写入索引"""
+        # 文档流为空时在写入任何文件之前报错, 生成器先取出第一个文档再放回
+        if isinstance(documents, Sized):
+            is_empty = not len(documents)
+        else:
+            iterator = iter(documents)
+            first = next(iterator, None)
+            is_empty = first is None
+            documents = itertools.chain([first], iterator)
+        if is_empty:
+            raise ValueError("未解析出任何文档，无法创建FAISS数据库。")
+
         try:
-            for idx in range(0, len(documents), hp.max_batch_size):
-                if idx == 0:
-                    db = FAISS.from_documents(
-                        documents[idx : idx + hp.max_batch_size], self.embed_model
-                    )
-                else:
-                    db.add_documents(documents[idx : idx + hp.max_batch_size])
-            db.save_local(self.db_path)
-
-            os.makedirs(os.path.join(self.db_path, "files"), exist_ok=True)
-
-            parallel_map(
-                lambda file: shutil.copy(
-                    file, os.path.join(self.db_path, "files", os.path.basename(file))
-                ),
-                set([doc.metadata["source"] for doc in documents]),
-                max_workers=10,
-                enable_tqdm=True,
-            )
+            self.lexical_index, self.metadata_index = self.open_indexes()
+            db, file_ids = self.embed_and_add(documents)
+            self.write_full_vectors(self.db_path)
+            self.write_db(db, self.db_path)
+            self.commit_indexes()
+
+            sources = list(dict.fromkeys([*self.source_files, *file_ids]))
+            self.copy_files(sources)
+            self.save_manifest(self.get_manifest_entries(sources, file_ids))
+            self.save_split_mode()
 
             logging.info(f"FAISS数据库已创建并保存到 {self.db_path}")
         except Exception:
+            # 不保留创建了一半的数据库, 否则下次启动时会被当作已有数据库加载
+            shutil.rmtree(self.db_path, ignore_errors=True)
             raise ValueError("无法创建FAISS数据库，请检查文档和嵌入模型是否正确")
+        return self.read_db()
+
+    def embed_batches(
+        self, documents: Iterable[Document]
+    ) -> Iterator[tuple[list[Document], list[list[float]]]]:
+        """
+        流水线嵌入: 多个批次同时在途, 受限流器约束, 结果按输入顺序产出.
+        输入可以是生成器, 只在需要时取出下一批文档
+
+        :param documents: 待嵌入的文档
+        :return: (文档批次, 嵌入向量) 的迭代器
+        """
+
+        def embed(batch: list[Document]) -> tuple[list[Document], list[list[float]]]:
+            self.embed_limiter.acquire()
+            texts = [doc.page_content for doc in batch]
+            return batch, self.embed_model.embed_documents(texts)
+
+        iterator = iter(documents)
+        batches = iter(lambda: list(itertools.islice(iterator, hp.max_batch_size)), [])
+        yield from pipelined_map(embed, batches, max_workers=self.embed_concurrency)
+
+    def embed_and_add(
+        self, documents: Iterable[Document], db: Optional[FAISS] = None
+    ) -> tuple[FAISS, dict[str, list[str]]]:
+        """
+        并发嵌入文档并按顺序追加到向量索引、词法索引与元数据索引中,
+        只保留文档id, 已写入的文档不在内存中保留
+
+        :param documents: 待添加的文档, 可以是生成器
+        :param db: 目标索引, 为None时新建
+        :return: 索引及源文件到向量id的映射
+        """
+        file_ids: dict[str, list[str]] = defaultdict(list)
+        # 新建非平面索引或量化索引时先缓存足够的向量, 在这部分样本上训练
+        pending: list[tuple[list[Document], list[list[float]], list[str]]] = []
+        needs_training = self.index_type != "flat" or self.quantization != "none"
+        train_size = self.train_size if needs_training else 0
+
+        total = len(documents) if isinstance(documents, Sized) else None
+        progress = tqdm(total=total, desc="Embedding", colour="green")
+        for batch, embeds in self.embed_batches(documents):
+            batch_ids = [str(uuid.uuid4()) for _ in batch]
+            for doc, doc_id in zip(batch, batch_ids):
+                file_ids[doc.metadata["source"]].append(doc_id)
+            self.add_to_indexes(batch_ids, batch)
+            progress.update(len(batch))
+
+            if db is not None:
+                self.add_embeddings(db, batch, embeds, batch_ids)
+                continue
+            pending.append((batch, embeds, batch_ids))
+            if sum(len(item[0]) for item in pending) >= train_size:
+                db = self.new_db(pending)
+                pending = []
+        progress.close()
+
+        if db is None and pending:
+            db = self.new_db(pending)
+        return db, dict(file_ids)
+
+    def add_embeddings(
+        self,
+        db: FAISS,
+        documents: list[Document],
+        embeds: list[list[float]],
+        ids: list[str],
+    ) -> None:
+        """将已嵌入的文档追加到索引, 需要重排时同时记录全精度向量"""
+        vectors = np.array(embeds, dtype=np.float32)
+        if self.store_full_vectors:
+            with open(self.pending_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self.num_pending += len(vectors)
+        db.add_embeddings(
+            list(zip([doc.page_content for doc in documents], self.truncate(vectors))),
+            metadatas=[doc.metadata for doc in documents],
+            ids=ids,
+        )
+
+    def truncate(self, vectors: np.ndarray) -> np.ndarray:
+        """按截断维度处理向量, 未设置截断时原样返回"""
+        if self.truncate_dim is None:
+            return vectors
+        return truncate_vectors(vectors, self.truncate_dim)
+
+    def get_embedding_function(self) -> Embeddings:
+        """LangChain FAISS使用的嵌入函数, 截断索引上输出截断后的查询向量"""
+        if self.truncate_dim is None:
+            return self.embed_model
+        return TruncatedEmbeddings(self.embed_model, self.truncate_dim)
+
+    def new_db(
+        self, pending: list[tuple[list[Document], list[list[float]], list[str]]]
+    ) -> FAISS:
+        """
+        按索引类型新建索引, 在缓存的向量上训练后写入. 文档库直接建在数据库目录下的
+        SQLite中, 写入的文档不驻留内存
+
+        :param pending: 缓存的 (文档批次, 嵌入向量, 向量id)
+        :return: 新建的FAISS数据库
+        """
+        vectors = self.truncate(
+            np.array(
+                [embed for _, embeds, _ in pending for embed in embeds],
+                dtype=np.float32,
+            )
+        )
+        index = create_index(
+            self.index_type,
+            vectors.shape[1],
+            num_vectors=len(vectors),
+            quantization=self.quantization,
+            **self.index_params,
+        )
+        train_index(index, vectors, self.train_size)
+        set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+
+        docstore = SqliteDocstore(os.path.join(self.db_path, DOCSTORE_FILE))
+        db = FAISS(
+            self.get_embedding_function(), index, docstore, SqliteIndexMap(docstore)
+        )
+        for batch, embeds, batch_ids in pending:
+            self.add_embeddings(db, batch, embeds, batch_ids)
         return db
 
-    def load_db(self) -> FAISS:
-        """加载FAISS数据库"""
+    def set_search_params(
+        self, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+    ) -> None:
+        """
+        调整查询时参数, 用于在延迟与召回率之间取舍
+
+        :param nprobe: IVF查询时访问的聚类数
+        :param ef_search: HNSW查询时的候选队列长度
+        """
+        self.nprobe = nprobe or self.nprobe
+        self.ef_search = ef_search or self.ef_search
+        set_search_params(self.db.index, nprobe=self.nprobe, ef_search=self.ef_search)
+
+    def get_recall_report(
+        self,
+        configs: list[dict],
+        queries: Optional[list[str]] = None,
+        k: int = 10,
+        num_queries: int = 100,
+    ) -> list[dict]:
+        """
+        以当前数据库中的向量评估不同索引配置相对平面索引的召回率与延迟,
+        当前索引需保存了全精度向量或支持向量还原(平面索引或HNSW)
+
+        :param configs: 索引配置, 如 {"index_type": "hnsw", "hnsw_m": 32, "ef_search": 64},
+            {"quantization": "int8", "truncate_dim": 256, "rescore_factor": 4}
+        :param queries: 查询文本, 为None时从库中抽样向量作为查询
+        :param k: 召回率计算的top-k
+        :param num_queries: 抽样查询数
+        :return: 每个配置的评估结果
+        """
+        if self.full_vectors is not None:
+            vectors = np.asarray(self.full_vectors)
+        elif self.truncate_dim is not None or self.quantization != "none":
+            raise ValueError("压缩索引缺少全精度向量，无法评估")
+        else:
+            try:
+                vectors = self.db.index.reconstruct_n(0, self.db.index.ntotal)
+            except RuntimeError:
+                raise ValueError("当前索引不支持向量还原，请在平面索引或HNSW索引上评估")
+
+        if queries is None:
+            num_queries = min(num_queries, len(vectors))
+            rng = np.random.default_rng(0)
+            query_vectors = vectors[rng.choice(len(vectors), num_queries, replace=False)]
+        else:
+            query_vectors = np.array(self.embed_model.embed_documents(queries))
+
+        return get_recall_report(
+            vectors, query_vectors, configs, k=k, train_size=self.train_size
+        )
+
+    def copy_files(self, files: list[str]) -> None:
+        """将源文件复制到数据库目录下"""
+        os.makedirs(os.path.join(self.db_path, "files"), exist_ok=True)
+
+        parallel_map(
+            lambda file: shutil.copy(
+                file, os.path.join(self.db_path, "files", os.path.basename(file))
+            ),
+            files,
+            max_workers=10,
+            enable_tqdm=True,
+        )
+
+    def get_manifest_entries(
+        self,
+        files: list[str],
+        file_ids: dict[str, list[str]],
+        hashes: Optional[dict[str, str]] = None,
+    ) -> dict[str, dict]:
+        """
+        生成文件清单条目: 源文件路径 -> {hash: 内容哈希, ids: 向量id}
+
+        :param files: 源文件, 未切分出文档的文件也会记录, 避免重复解析
+        :param file_ids: 源文件 -> 切分得到的文档的向量id
+        :param hashes: 已计算好的文件哈希
+        """
+        hashes = hashes or {}
+        return {
+            file: {
+                "hash": hashes.get(file) or get_file_hash(file),
+                "ids": file_ids.get(file, []),
+            }
+            for file in files
+        }
+
+    def load_manifest(self) -> dict[str, dict]:
+        """
+        加载文件清单, 旧版数据库没有清单时根据文档库中的source元数据重建
+        """
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        file_ids = defaultdict(list)
+        for doc_id in self.db.index_to_docstore_id.values():
+            doc = self.db.docstore.search(doc_id)
+            file_ids[doc.metadata["source"]].append(doc_id)
+        return {
+            file: {
+                "hash": get_file_hash(file) if os.path.exists(file) else "",
+                "ids": ids,
+            }
+            for file, ids in file_ids.items()
+        }
+
+    def save_manifest(self, manifest: dict[str, dict]) -> None:
+        """保存文件清单"""
+        os.makedirs(self.db_path, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_split_mode(self) -> Optional[str]:
+        """读取创建数据库时的文本切分方式, 旧版数据库没有记录时返回None"""
+        build_info_path = os.path.join(self.db_path, BUILD_INFO_FILE)
+        if not os.path.exists(build_info_path):
+            return None
+        with open(build_info_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("split_mode")
+
+    def save_split_mode(self) -> None:
+        """记录数据库当前的文本切分方式"""
+        build_info_path = os.path.join(self.db_path, BUILD_INFO_FILE)
+        with open(build_info_path, "w", encoding="utf-8") as f:
+            json.dump({"split_mode": self.split_mode}, f)
+
+    def sync(self, files: list[str]) -> dict[str, int]:
+        """
+        按文件清单增量同步: 只解析和嵌入新增或内容变化的文件, 删除已移除文件的向量.
+        数据库的文本切分方式与当前配置不一致(或旧版数据库没有记录)时, 全部文件视为修改
+
+        :param files: 当前知识库中的全部源文件
+        :return: 新增、修改、删除的文件数
+        """
+        self.rebuild_indexes()
+        manifest = self.load_manifest()
+        hashes = dict(zip(files, parallel_map(get_file_hash, files, max_workers=10)))
+        resplit = self.load_split_mode() != self.split_mode
+
+        added = [file for file in files if file not in manifest]
+        modified = [
+            file
+            for file in files
+            if file in manifest
+            and (resplit or manifest[file]["hash"] != hashes[file])
+        ]
+        removed = [file for file in manifest if file not in hashes]
+
+        stale_ids = [i for file in modified + removed for i in manifest[file]["ids"]]
+        if stale_ids or added:
+            self.ensure_writable()
+        if stale_ids:
+            if not supports_removal(self.db.index):
+                raise ValueError("当前索引类型不支持删除向量(如HNSW、IVF)，请重建数据库")
+            if self.store_full_vectors:
+                self.removed_positions.extend(self.get_positions(stale_ids))
+            self.db.delete(stale_ids)
+            self.delete_from_indexes(stale_ids)
+        for file in modified + removed:
+            del manifest[file]
+        for file in removed:
+            copied = os.path.join(self.db_path, "files", os.path.basename(file))
+            if os.path.exists(copied):
+                os.remove(copied)
+
+        changed = added + modified
+        if changed:
+            self.db, file_ids = self.embed_and_add(
+                MsdsParser(
+                    changed, max_workers=self.parse_workers, split_mode=self.split_mode
+                ).iter_documents(),
+                self.db,
+            )
+            self.copy_files(changed)
+            manifest.update(self.get_manifest_entries(changed, file_ids, hashes))
+
+        if changed or removed:
+            self.save_db()
+            self.save_manifest(manifest)
+        if resplit:
+            self.save_split_mode()
+
+        stats = {"added": len(added), "modified": len(modified), "removed": len(removed)}
+        logging.info(f"FAISS数据库已同步: {stats}")
+        return stats
+
+    def read_index(self, mmap: bool) -> faiss.Index:
+        """
+        读取向量索引
+
+        :param mmap: 是否以内存映射方式只读打开, 不支持映射的索引类型仍完整读入内存
+        """
+        flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(self.db_path, INDEX_FILE), flags)
+        set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        self.index_mapped = mmap and supports_mmap(index)
+        if mmap and not self.index_mapped:
+            logging.info(
+                f"索引类型 {type(faiss.downcast_index(index)).__name__} 不支持内存映射, "
+                "已完整读入内存"
+            )
+        return index
+
+    def read_db(self) -> FAISS:
+        """读取数据库: 索引按需映射, 文档在命中时才从SQLite中读取"""
+        docstore = SqliteDocstore(os.path.join(self.db_path, DOCSTORE_FILE))
+        index = self.read_index(self.mmap)
+        self.load_full_vectors(index)
+        return FAISS(
+            self.get_embedding_function(), index, docstore, SqliteIndexMap(docstore)
+        )
+
+    def load_full_vectors(self, index: faiss.Index) -> None:
+        """
+        加载全精度向量, 并以磁盘上的索引为准确定量化方式与截断维度
+
+        :param index: 已读取的向量索引
+        """
+        path = os.path.join(self.db_path, FULL_VECTORS_FILE)
+        self.full_vectors = (
+            np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        )
+        self.store_full_vectors = self.full_vectors is not None
+        self.truncate_dim = (
+            index.d
+            if self.full_vectors is not None and index.d < self.full_vectors.shape[1]
+            else None
+        )
+        self.quantization = get_quantization(index)
+        self.discard_pending_vectors()
+
+    def discard_pending_vectors(self) -> None:
+        """丢弃未合并的新增向量, 如上次写入中断时遗留的文件"""
+        if os.path.exists(self.pending_path):
+            os.remove(self.pending_path)
+        self.num_pending, self.removed_positions = 0, []
+
+    def write_full_vectors(self, db_path: str) -> None:
+        """
+        将全精度向量写入数据库目录: 按删除的行压缩已有向量并追加新增向量,
+        逐块写入临时文件后替换, 已映射旧文件的进程不受影响
+
+        :param db_path: 保存路径
+        """
+        if not self.store_full_vectors:
+            return
+        new_vectors = None
+        if self.num_pending:
+            new_vectors = np.memmap(self.pending_path, dtype=np.float32, mode="r")
+            new_vectors = new_vectors.reshape(self.num_pending, -1)
+        old_vectors = self.full_vectors
+        if old_vectors is None and new_vectors is None:
+            return
+        dimensions = (old_vectors if old_vectors is not None else new_vectors).shape[1]
+        keep = np.ones(0 if old_vectors is None else len(old_vectors), dtype=bool)
+        keep[self.removed_positions] = False
+        total = int(keep.sum()) + (0 if new_vectors is None else len(new_vectors))
+
+        os.makedirs(db_path, exist_ok=True)
+        path = os.path.join(db_path, FULL_VECTORS_FILE)
+        out = np.lib.format.open_memmap(
+            path + ".tmp.npy", mode="w+", dtype=np.float32, shape=(total, dimensions)
+        )
+        row, block_size = 0, hp.max_batch_size * 64
+        for start in range(0, len(keep), block_size):
+            block = old_vectors[start : start + block_size]
+            block = block[keep[start : start + len(block)]]
+            out[row : row + len(block)] = block
+            row += len(block)
+        num_new = 0 if new_vectors is None else len(new_vectors)
+        for start in range(0, num_new, block_size):
+            block = new_vectors[start : start + block_size]
+            out[row : row + len(block)] = block
+            row += len(block)
+        out.flush()
+        del out, new_vectors
+        os.replace(path + ".tmp.npy", path)
+
+        if db_path == self.db_path:
+            self.full_vectors = np.load(path, mmap_mode="r")
+            self.discard_pending_vectors()
+
+    def ensure_writable(self) -> None:
+        """内存映射打开的索引为只读, 写入前完整读入内存"""
+        if self.index_mapped:
+            self.db.index = self.read_index(mmap=False)
+
+    @staticmethod
+    def write_db(db: FAISS, db_path: str) -> None:
+        """
+        以 索引文件 + SQLite文档库 的格式保存数据库
+
+        索引先写入临时文件再替换, 已映射旧文件的进程不受影响; 文档库若已位于目标路径,
+        只需提交累积的写入, 否则完整写出一份新的文档库.
+
+        :param db: FAISS数据库
+        :param db_path: 保存路径
+        """
+        os.makedirs(db_path, exist_ok=True)
+        index_path = os.path.join(db_path, INDEX_FILE)
+        docstore_path = os.path.join(db_path, DOCSTORE_FILE)
+        faiss.write_index(db.index, index_path + ".tmp")
+
+        docstore = db.docstore
+        if isinstance(docstore, SqliteDocstore) and os.path.abspath(
+            docstore.store_path
+        ) == os.path.abspath(docstore_path):
+            # 删除向量后LangChain会以普通字典重建位置映射
+            if not isinstance(db.index_to_docstore_id, SqliteIndexMap):
+                docstore.set_positions(db.index_to_docstore_id)
+                db.index_to_docstore_id = SqliteIndexMap(docstore)
+            os.replace(index_path + ".tmp", index_path)
+            docstore.commit()
+        else:
+            tmp_path = docstore_path + ".tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            store = SqliteDocstore(tmp_path)
+            store.add(
+                {
+                    doc_id: docstore.search(doc_id)
+                    for doc_id in db.index_to_docstore_id.values()
+                }
+            )
+            store.set_positions(dict(db.index_to_docstore_id.items()))
+            store.commit()
+            store.close()
+            os.replace(index_path + ".tmp", index_path)
+            os.replace(tmp_path, docstore_path)
+
+        legacy_path = os.path.join(db_path, LEGACY_DOCSTORE_FILE)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def load_db(self, documents: Optional[Iterable[Document]] = None) -> FAISS:
+        """
+        加载FAISS数据库, 以pickle保存文档库的旧版格式先转为新格式, 不存在时以documents创建
+
+        :param documents: 新建数据库使用的文档, 可以是生成器
+        """
         if self.db_exists:
             try:
-                db = FAISS.load_local(
-                    self.db_path, self.embed_model, allow_dangerous_deserialization=True
-                )
-                return db
+                self.migrate_legacy_db()
+                return self.read_db()
             except Exception:
                 raise ValueError(f"无法加载路径位于 {self.db_path} 的FAISS数据库")
         else:
-            if not self.documents:
+            if not documents:
                 raise ValueError("数据库不存在且未提供文档，无法创建FAISS数据库。")
             else:
-                return self.create_db(self.documents)
+                return self.create_db(documents)
+
+    def migrate_legacy_db(self) -> None:
+        """
+        将以pickle保存文档库的旧版数据库转为SQLite文档库, 转换在文件锁内进行,
+        多个进程同时加载时只转换一次
+        """
+        with file_lock(os.path.join(self.db_path, LOCK_FILE)):
+            if os.path.exists(os.path.join(self.db_path, DOCSTORE_FILE)):
+                return
+            db = FAISS.load_local(
+                self.db_path, self.embed_model, allow_dangerous_deserialization=True
+            )
+            self.write_db(db, self.db_path)
+        logging.info(f"旧版FAISS数据库 {self.db_path} 已转为SQLite文档库")
 
     def get_db(self) -> FAISS:
         """获取FAISS数据库实例"""
@@ -80,7 +673,10 @@ class FaissDB:
         """保存FAISS数据库"""
         db_path = db_path if db_path else self.db_path
         try:
-            self.db.save_local(db_path)
+            self.write_full_vectors(db_path)
+            self.write_db(self.db, db_path)
+            if db_path == self.db_path:
+                self.commit_indexes()
         except Exception:
             raise ValueError(f"无法保存FAISS数据库到路径 {db_path}")
 
@@ -94,14 +690,247 @@ class FaissDB:
         except Exception:
             raise ValueError(f"无法删除FAISS数据库文件 {self.db_path}")
 
-    def add_to_db(self, documents: list[Document]) -> None:
+    def add_to_db(self, documents: Iterable[Document]) -> None:
         """将文档添加到FAISS数据库"""
         try:
-            self.db.add_documents(documents)
-            self.save_db(self.db)
+            self.ensure_writable()
+            self.db, file_ids = self.embed_and_add(documents, self.db)
+            self.save_db()
+
+            manifest = self.load_manifest()
+            entries = self.get_manifest_entries(list(file_ids), file_ids)
+            for file, entry in entries.items():
+                if file in manifest:
+                    entry["ids"] = manifest[file]["ids"] + entry["ids"]
+                manifest[file] = entry
+            self.save_manifest(manifest)
         except Exception:
             raise ValueError("无法将文档向量化并添加到FAISS数据库")
 
+    def open_indexes(self) -> tuple[BM25Index, MetadataIndex]:
+        """打开词法索引与元数据索引"""
+        return (
+            BM25Index(os.path.join(self.db_path, LEXICAL_INDEX_FILE)),
+            MetadataIndex(os.path.join(self.db_path, METADATA_INDEX_FILE)),
+        )
+
+    def check_indexes(self) -> bool:
+        """词法索引与元数据索引是否与向量库一致"""
+        ntotal = self.db.index.ntotal
+        return (
+            self.lexical_index.count() == ntotal
+            and self.metadata_index.count() == ntotal
+        )
+
+    def rebuild_indexes(self) -> None:
+        """
+        词法索引与元数据索引不存在或与向量库不一致时根据文档库重建. 重建在文件锁内进行,
+        并在取得锁后再次检查, 多个进程同时同步时只重建一次
+        """
+        with file_lock(os.path.join(self.db_path, LOCK_FILE)):
+            if self.check_indexes():
+                self.indexes_ready = True
+                return
+
+            self.lexical_index.clear()
+            self.metadata_index.clear()
+            ids = list(self.db.index_to_docstore_id.values())
+            for idx in range(0, len(ids), hp.max_batch_size):
+                batch = ids[idx : idx + hp.max_batch_size]
+                documents = [self.db.docstore.search(doc_id) for doc_id in batch]
+                self.add_to_indexes(batch, documents)
+            self.commit_indexes()
+        self.indexes_ready = True
+        logging.info(f"词法索引与元数据索引已重建, 共 {len(ids)} 个文本块")
+
+    def add_to_indexes(self, ids: list[str], documents: list[Document]) -> None:
+        """将文档写入词法索引与元数据索引"""
+        self.lexical_index.add(ids, [doc.page_content for doc in documents])
+        self.metadata_index.add(ids, documents)
+
+    def delete_from_indexes(self, ids: list[str]) -> None:
+        """从词法索引与元数据索引中删除文档"""
+        self.lexical_index.delete(ids)
+        self.metadata_index.delete(ids)
+
+    def commit_indexes(self) -> None:
+        """提交词法索引与元数据索引的写入"""
+        self.lexical_index.commit()
+        self.metadata_index.commit()
+
+    def get_positions(self, doc_ids: list[str]) -> list[int]:
+        """文档id对应的向量位置"""
+        mapping = self.db.index_to_docstore_id
+        if isinstance(mapping, SqliteIndexMap):
+            return mapping.get_positions(doc_ids)
+        wanted = set(doc_ids)
+        return [position for position, doc_id in mapping.items() if doc_id in wanted]
+
+    def dense_search(
+        self, query: str, k: int = 10, doc_ids: Optional[list[str]] = None
+    ) -> list[tuple[Document, float]]:
+        """
+        向量检索
+
+        :param query: 查询文本
+        :param k: 返回的文档数
+        :param doc_ids: 候选文档id, None表示检索全部文档
+        :return: (文档, L2距离), 按距离升序排列
+        """
+        return self.dense_search_by_vector(
+            self.embed_model.embed_query(query), k, doc_ids
+        )
+
+    def dense_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 10,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        以查询向量检索, 分片检索时查询只需嵌入一次
+
+        :param embedding: 查询向量
+        :param k: 返回的文档数
+        :param doc_ids: 候选文档id, None表示检索全部文档
+        :return: (文档, L2距离), 按距离升序排列
+        """
+        query = np.array([embedding], dtype=np.float32)
+        # 压缩索引上多取候选, 再以全精度向量重排
+        fetch_k = k * self.rescore_factor if self.full_vectors is not None else k
+        if doc_ids is None:
+            distances, found = self.db.index.search(self.truncate(query), fetch_k)
+            distances, found = distances[0], found[0]
+            distances, found = distances[found != -1], found[found != -1]
+        else:
+            positions = self.get_positions(doc_ids)
+            if not positions:
+                return []
+            distances, found = search_subset(
+                self.db.index,
+                self.truncate(query)[0],
+                positions,
+                fetch_k,
+                nprobe=self.nprobe,
+                ef_search=self.ef_search,
+            )
+        if self.full_vectors is not None and len(found):
+            distances, found = rescore(query[0], found, self.full_vectors, k)
+
+        doc_ids = [self.db.index_to_docstore_id[int(position)] for position in found]
+        return [
+            (self.db.docstore.search(doc_id), float(distance))
+            for doc_id, distance in zip(doc_ids, distances)
+        ]
+
+    def lexical_search(
+        self,
+        query: str,
+        k: int = 10,
+        doc_ids: Optional[list[str]] = None,
+        stats: Optional[tuple[int, int, dict[str, int]]] = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        BM25检索
+
+        :param query: 查询文本
+        :param k: 返回的文档数
+        :param doc_ids: 候选文档id, None表示检索全部文档
+        :param stats: 语料统计, 见BM25Index.get_stats, None时使用本库的统计
+        :return: (文档, BM25得分)
+        """
+        return [
+            (self.db.docstore.search(doc_id), score)
+            for doc_id, score in self.lexical_index.search(query, k, doc_ids, stats)
+        ]
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 10,
+        fetch_k: Optional[int] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[tuple[Document, float]]:
+        """
+        融合BM25与向量检索的结果, 两路得分尺度不同, 按倒数排名融合
+
+        :param query: 查询文本
+        :param k: 返回的文档数
+        :param fetch_k: 每一路的候选数, 默认为2k
+        :param doc_ids: 候选文档id, None表示检索全部文档
+        :return: (文档, 融合得分)
+        """
+        fetch_k = fetch_k or 2 * k
+        return self.fuse_hits(
+            self.dense_search(query, fetch_k, doc_ids),
+            self.lexical_search(query, fetch_k, doc_ids),
+            k,
+        )
+
+    @staticmethod
+    def fuse_hits(
+        dense: list[tuple[Document, float]],
+        lexical: list[tuple[Document, float]],
+        k: int,
+    ) -> list[tuple[Document, float]]:
+        """
+        按倒数排名融合向量检索与BM25检索的结果
+
+        :param dense: (文档, L2距离), 按距离升序排列
+        :param lexical: (文档, BM25得分), 按得分降序排列
+        :param k: 返回的文档数
+        :return: (文档, 融合得分)
+        """
+        # 向量检索只需排名, 以负距离作为得分
+        ids, scores = fuse_rankings(
+            [[doc.id for doc, _ in dense], [doc.id for doc, _ in lexical]],
+            [[-distance for _, distance in dense], [score for _, score in lexical]],
+            k,
+            method="rrf",
+        )
+        found = {doc.id: doc for doc, _ in dense + lexical}
+        return [(found[doc_id], float(score)) for doc_id, score in zip(ids.tolist(), scores)]
+
+    def search(
+        self,
+        query: str,
+        search_mode: str = "vector",
+        k: int = 10,
+        score_threshold: float = 0.15,
+        filters: Optional[dict[str, str]] = None,
+    ) -> list[Document]:
+        """
+        按检索方式检索知识库, 查询能解析出化学品时只在该化学品的文本块中检索
+
+        :param query: 查询文本
+        :param search_mode: vector | bm25 | hybrid
+        :param k: 返回的文档数
+        :param score_threshold: 向量检索的相关度阈值
+        :param filters: 元数据过滤条件, 如 {"chemical": "氢化钙", "section": "急救措施"},
+            None时从查询中解析
+        :return: 文档列表
+        """
+        if not self.indexes_ready:
+            filters, search_mode = {}, "vector"
+        if filters is None and self.prefilter:
+            filters = self.metadata_index.resolve_filters(query)
+        doc_ids = self.metadata_index.get_ids(filters) if filters else None
+
+        if search_mode == "vector":
+            relevance_score_fn = self.db._select_relevance_score_fn()
+            hits = [
+                (doc, relevance_score_fn(distance))
+                for doc, distance in self.dense_search(query, k, doc_ids)
+            ]
+            hits = [(doc, score) for doc, score in hits if score >= score_threshold]
+        elif search_mode == "bm25":
+            hits = self.lexical_search(query, k, doc_ids)
+        elif search_mode == "hybrid":
+            hits = self.hybrid_search(query, k, doc_ids=doc_ids)
+        else:
+            raise ValueError(f"不支持的检索方式: {search_mode}")
+        return [doc for doc, _ in hits]
+
     def get_retriever(self, k: int = 5) -> VectorStoreRetriever:
         """获取检索器"""
         return self.db.as_retriever(
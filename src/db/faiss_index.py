@@ -0,0 +1,314 @@
+import logging
+import time
+from typing import Optional
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+INDEX_TYPES = ["flat", "hnsw", "ivf_flat", "ivf_pq"]
+# 标量量化方式, 每维分别占2字节与1字节
+QUANTIZATIONS = {
+    "none": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def create_index(
+    index_type: str,
+    dimensions: int,
+    nlist: int = 1024,
+    pq_m: int = 64,
+    hnsw_m: int = 32,
+    num_vectors: Optional[int] = None,
+    quantization: str = "none",
+) -> faiss.Index:
+    """
+    创建FAISS索引, 均使用L2距离, 与LangChain默认的平面索引保持一致
+
+    :param index_type: flat | hnsw | ivf_flat | ivf_pq
+    :param dimensions: 向量维度
+    :param nlist: IVF聚类中心数
+    :param pq_m: PQ子空间数, 需整除向量维度, 否则取不超过该值的最大约数
+    :param hnsw_m: HNSW每个节点的邻居数
+    :param num_vectors: 训练向量数, 用于在样本不足时缩小nlist与PQ码本
+    :param quantization: none | fp16 | int8, 对flat、hnsw、ivf_flat以标量量化保存向量,
+        ivf_pq本身已压缩, 忽略该参数
+    :return: 未训练的索引
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"不支持的量化方式: {quantization}, 可选: {list(QUANTIZATIONS)}")
+    qtype = QUANTIZATIONS[quantization]
+
+    if index_type == "flat":
+        if qtype is not None:
+            return faiss.IndexScalarQuantizer(dimensions, qtype, faiss.METRIC_L2)
+        return faiss.IndexFlatL2(dimensions)
+    if index_type == "hnsw":
+        if qtype is not None:
+            return faiss.IndexHNSWSQ(dimensions, qtype, hnsw_m)
+        return faiss.IndexHNSWFlat(dimensions, hnsw_m)
+
+    if num_vectors is not None:
+        # faiss建议每个聚类中心至少39个训练样本
+        nlist = max(1, min(nlist, num_vectors // 39))
+    quantizer = faiss.IndexFlatL2(dimensions)
+    if index_type == "ivf_flat":
+        if qtype is not None:
+            return faiss.IndexIVFScalarQuantizer(
+                quantizer, dimensions, nlist, qtype, faiss.METRIC_L2
+            )
+        return faiss.IndexIVFFlat(quantizer, dimensions, nlist)
+    if index_type == "ivf_pq":
+        pq_m = min(pq_m, dimensions)
+        while dimensions % pq_m:
+            pq_m -= 1
+        # 每个子空间的码本大小为2^nbits, 训练样本不少于码本大小
+        nbits = 8 if num_vectors is None else max(1, min(8, int(np.log2(num_vectors))))
+        return faiss.IndexIVFPQ(quantizer, dimensions, nlist, pq_m, nbits)
+
+    raise ValueError(f"不支持的索引类型: {index_type}, 可选: {INDEX_TYPES}")
+
+
+def train_index(
+    index: faiss.Index, vectors: np.ndarray, train_size: Optional[int] = None
+) -> None:
+    """
+    在向量样本上训练索引, 平面索引与HNSW无需训练
+
+    :param index: 索引
+    :param vectors: 候选训练向量
+    :param train_size: 最大训练样本数
+    """
+    if index.is_trained:
+        return
+    if train_size is not None and len(vectors) > train_size:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(len(vectors), train_size, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def set_search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> None:
+    """
+    设置查询时参数, 对不支持该参数的索引类型忽略
+
+    :param index: 索引
+    :param nprobe: IVF查询时访问的聚类数
+    :param ef_search: HNSW查询时的候选队列长度
+    """
+    params = faiss.ParameterSpace()
+    for name, value in [("nprobe", nprobe), ("efSearch", ef_search)]:
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+def get_quantization(index: faiss.Index) -> str:
+    """读取索引使用的标量量化方式, 未量化时返回none"""
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    sq = getattr(index, "sq", None)
+    for name, qtype in QUANTIZATIONS.items():
+        if sq is not None and qtype == sq.qtype:
+            return name
+    return "none"
+
+
+def supports_mmap(index: faiss.Index) -> bool:
+    """
+    以IO_FLAG_MMAP_IFC读取时索引的向量是否映射到文件, 而非完整读入内存
+
+    平面索引与标量量化索引的编码直接映射, HNSW映射其存储的向量, 图结构仍读入内存;
+    IVF的倒排表不支持映射.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return isinstance(index, faiss.IndexFlatCodes)
+
+
+def truncate_vectors(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Matryoshka式截断: 保留前若干维并重新L2归一化
+
+    :param vectors: 形状为(向量数, 维度)的向量
+    :param dimensions: 保留的维度
+    :return: 截断后的向量
+    """
+    vectors = np.ascontiguousarray(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class TruncatedEmbeddings(Embeddings):
+    """输出截断向量的嵌入模型, 作为截断索引上LangChain FAISS的嵌入函数"""
+
+    def __init__(self, embed_model: Embeddings, dimensions: int) -> None:
+        self.embed_model: Embeddings = embed_model
+        self.dimensions: int = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        embeds = np.array(self.embed_model.embed_documents(texts), dtype=np.float32)
+        return truncate_vectors(embeds, self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        embed = np.array([self.embed_model.embed_query(text)], dtype=np.float32)
+        return truncate_vectors(embed, self.dimensions)[0].tolist()
+
+
+def rescore(
+    query: np.ndarray, ids: np.ndarray, vectors: np.ndarray, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    以全精度向量重新计算候选的L2距离并取top-k
+
+    :param query: 全精度查询向量
+    :param ids: 候选向量id
+    :param vectors: 全精度向量, 可以是内存映射数组
+    :param k: 返回的结果数
+    :return: 按距离升序排列的(距离, 向量id)
+    """
+    # 按id顺序读取, 内存映射时顺序访问磁盘
+    ids = np.sort(np.asarray(ids, dtype=np.int64))
+    candidates = np.asarray(vectors[ids], dtype=np.float32)
+    distances = ((candidates - np.asarray(query, dtype=np.float32)) ** 2).sum(axis=1)
+    top = np.argsort(distances)[:k]
+    return distances[top], ids[top]
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """
+    索引删除向量后是否将后续向量的id前移
+
+    LangChain删除向量后按前移重排位置映射, 只有平面编码索引满足这一点;
+    IVF删除后保留原id, HNSW不支持删除.
+    """
+    return isinstance(index, faiss.IndexFlatCodes)
+
+
+def search_subset(
+    index: faiss.Index,
+    query: np.ndarray,
+    ids: list[int],
+    k: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    只在给定的向量id范围内检索
+
+    平面索引与IVF通过IDSelectorBatch在检索时过滤; HNSW的图搜索在过滤后可能提前终止,
+    候选集通常只有单个化学品的几十个文本块, 直接还原向量精确计算距离.
+
+    :param index: 索引
+    :param query: 单个查询向量
+    :param ids: 候选向量id
+    :param k: 返回的结果数
+    :param nprobe: IVF查询时访问的聚类数
+    :param ef_search: HNSW查询时的候选队列长度
+    :return: 按距离升序排列的(距离, 向量id)
+    """
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    ids = np.asarray(ids, dtype=np.int64)
+
+    if isinstance(index, faiss.IndexHNSW):
+        vectors = np.vstack([index.reconstruct(int(i)) for i in ids])
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argsort(distances)[:k]
+        return distances[top], ids[top]
+
+    selector = faiss.IDSelectorBatch(ids)
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or index.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    distances, found = index.search(query, min(k, len(ids)), params=params)
+    keep = found[0] != -1
+    return distances[0][keep], found[0][keep]
+
+
+def get_recall_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    configs: list[dict],
+    k: int = 10,
+    train_size: Optional[int] = None,
+) -> list[dict]:
+    """
+    以平面索引的精确结果为基准, 评估各索引配置的召回率、查询延迟与索引大小
+
+    :param vectors: 库中的全部向量
+    :param queries: 查询向量
+    :param configs: 索引配置, 如 {"index_type": "ivf_pq", "nlist": 256, "nprobe": 16},
+        可指定quantization、truncate_dim, 以及rescore_factor(以全精度向量重排
+        k * rescore_factor个候选, 缺省时不重排)
+    :param k: 召回率计算的top-k
+    :param train_size: 最大训练样本数
+    :return: 每个配置的召回率、单次查询延迟、构建耗时与索引大小
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    report = []
+    for config in configs:
+        config = dict(config)
+        index_type = config.pop("index_type", "flat")
+        nprobe = config.pop("nprobe", None)
+        ef_search = config.pop("ef_search", None)
+        truncate_dim = config.pop("truncate_dim", None)
+        rescore_factor = config.pop("rescore_factor", None)
+        index_vectors, index_queries = vectors, queries
+        if truncate_dim is not None:
+            index_vectors = truncate_vectors(vectors, truncate_dim)
+            index_queries = truncate_vectors(queries, truncate_dim)
+
+        start = time.perf_counter()
+        index = create_index(
+            index_type, index_vectors.shape[1], num_vectors=len(vectors), **config
+        )
+        train_index(index, index_vectors, train_size)
+        index.add(index_vectors)
+        build_time = time.perf_counter() - start
+
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+        start = time.perf_counter()
+        _, found = index.search(index_queries, k * (rescore_factor or 1))
+        if rescore_factor:
+            found = [
+                rescore(query, row[row != -1], vectors, k)[1]
+                for query, row in zip(queries, found)
+            ]
+        latency = (time.perf_counter() - start) / len(queries)
+
+        hits = sum(
+            len(set(row_truth) & set(row_found))
+            for row_truth, row_found in zip(truth, found)
+        )
+        report.append(
+            {
+                "index_type": index_type,
+                **config,
+                "nprobe": nprobe,
+                "ef_search": ef_search,
+                "truncate_dim": truncate_dim,
+                "rescore_factor": rescore_factor,
+                f"recall@{k}": hits / truth.size,
+                "latency_ms": latency * 1000,
+                "build_s": build_time,
+                "index_mb": faiss.serialize_index(index).nbytes / 2**20,
+            }
+        )
+        logging.info(f"索引评估: {report[-1]}")
+    return report
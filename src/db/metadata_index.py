@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+
+from langchain.schema import Document
+
+from src.parser import CAS_PATTERN
+
+# 参与预过滤的元数据字段
+METADATA_KEYS = ["chemical", "cas", "section"]
+
+
+class MetadataIndex:
+    """
+    元数据倒排索引
+
+    以 (字段, 取值) 为键记录对应的文档id, 与FAISS索引位于同一目录, 用于在检索前
+    将候选范围限定到某一化学品. 与BM25Index相同, 写入在事务中累积, 调用commit后生效.
+    """
+
+    def __init__(self, index_path: str) -> None:
+        """
+        :param index_path: SQLite文件路径
+        """
+        self.index_path: str = index_path
+        self.chemicals: list[str] | None = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tags (key TEXT, value TEXT, doc_id TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tags_key ON tags (key, value)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tags_doc ON tags (doc_id)")
+        self.conn.commit()
+
+    @staticmethod
+    def get_tags(doc: Document) -> dict[str, str]:
+        """
+        获取文档的元数据标签, 旧版数据库的文档没有标注时以源文件名作为化学品名称,
+        以文本中的CAS号作为CAS
+
+        :param doc: 文档
+        :return: 字段 -> 取值
+        """
+        source = doc.metadata.get("source", "")
+        tags = {
+            "chemical": os.path.splitext(os.path.basename(source))[0],
+            "cas": "",
+            "section": "",
+        }
+        match = CAS_PATTERN.search(doc.page_content)
+        if match:
+            tags["cas"] = match.group()
+        tags.update({key: doc.metadata.get(key) or tags[key] for key in METADATA_KEYS})
+        return {key: value for key, value in tags.items() if value}
+
+    def add(self, ids: list[str], documents: list[Document]) -> None:
+        """
+        添加文档的元数据标签
+
+        :param ids: 文档id
+        :param documents: 与id一一对应的文档
+        """
+        rows = [
+            (key, value, doc_id)
+            for doc_id, doc in zip(ids, documents)
+            for key, value in self.get_tags(doc).items()
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO tags (key, value, doc_id) VALUES (?, ?, ?)", rows
+            )
+            self.chemicals = None
+
+    def delete(self, ids: list[str]) -> None:
+        """
+        删除文档的元数据标签
+
+        :param ids: 文档id
+        """
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM tags WHERE doc_id = ?", [(doc_id,) for doc_id in ids]
+            )
+            self.chemicals = None
+
+    def get_ids(self, filters: dict[str, str]) -> list[str]:
+        """
+        查询同时满足全部过滤条件的文档id
+
+        :param filters: 字段 -> 取值, 如 {"chemical": "氢化钙"}
+        :return: 文档id
+        """
+        ids = None
+        with self.lock:
+            for key, value in filters.items():
+                rows = self.conn.execute(
+                    "SELECT doc_id FROM tags WHERE key = ? AND value = ?", (key, value)
+                ).fetchall()
+                found = {row[0] for row in rows}
+                ids = found if ids is None else ids & found
+        return sorted(ids or [])
+
+    def get_chemicals(self) -> list[str]:
+        """全部化学品名称, 按长度降序排列, 以便优先匹配较长的名称"""
+        with self.lock:
+            if self.chemicals is None:
+                rows = self.conn.execute(
+                    "SELECT DISTINCT value FROM tags WHERE key = 'chemical'"
+                ).fetchall()
+                self.chemicals = sorted((row[0] for row in rows), key=len, reverse=True)
+            return self.chemicals
+
+    def resolve_filters(self, query: str) -> dict[str, str] | None:
+        """
+        从查询中解析化学品: 优先匹配CAS号, 其次匹配已知的化学品名称
+
+        :param query: 查询文本
+        :return: 过滤条件, 无法解析时返回None
+        """
+        match = CAS_PATTERN.search(query)
+        if match and self.get_ids({"cas": match.group()}):
+            return {"cas": match.group()}
+        for chemical in self.get_chemicals():
+            if chemical in query:
+                return {"chemical": chemical}
+        return None
+
+    def count(self) -> int:
+        """已索引的文档数"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(DISTINCT doc_id) FROM tags"
+            ).fetchone()[0]
+
+    def commit(self) -> None:
+        """提交累积的写入"""
+        with self.lock:
+            self.conn.commit()
+
+    def clear(self) -> None:
+        """清空索引"""
+        with self.lock:
+            self.conn.execute("DELETE FROM tags")
+            self.conn.commit()
+            self.chemicals = None
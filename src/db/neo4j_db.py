@@ -1,14 +1,98 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
 import numpy as np
 from langchain.schema import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
+from neo4j import AsyncDriver, AsyncGraphDatabase, Query
+from neo4j.exceptions import Neo4jError as DriverError
 from py2neo import Graph, Node, Relationship
-from ratelimit import limits, sleep_and_retry
+from py2neo.bulk import merge_nodes, merge_relationships
+from py2neo.cypher import cypher_escape
+from py2neo.errors import Neo4jError
 from sklearn.metrics.pairwise import cosine_similarity
 
 from src.config import hp
+from src.db.embedding_mirror import EmbeddingMirror
 from src.prompt import Prompt
-from src.toolkits import get_json_from_str
+from src.toolkits import (
+    EmbeddingCache,
+    TokenBucket,
+    fuse_rankings,
+    get_json_from_str,
+    top_k_indices,
+)
+
+VECTOR_QUERY_CYPHER = (
+    "CALL db.index.vector.queryNodes($index, $k, $embedding) "
+    "YIELD node, score RETURN id(node) AS id, score"
+)
+
+# 检索时只读取向量索引的状态, 索引在构建图数据库时创建
+VECTOR_INDEX_STATE_CYPHER = (
+    "SHOW INDEXES YIELD name, type, state "
+    "WHERE name = $name AND type = 'VECTOR' RETURN state"
+)
+
+EMBED_DIMENSIONS_CYPHER = (
+    "MATCH (n) WHERE n.embed IS NOT NULL RETURN size(n.embed) AS dimensions LIMIT 1"
+)
+
+SCAN_CYPHER = (
+    "MATCH (n) WHERE n.embed IS NOT NULL RETURN id(n) AS id, n.embed AS embed"
+)
+
+# 节点的updated_at由服务端时钟写入(秒), 不受各写入进程的时钟偏差影响
+TOUCH_NODES_CYPHER = (
+    "UNWIND $ids AS node_id MATCH (n) WHERE id(n) = node_id "
+    "SET n.updated_at = timestamp() / 1000.0"
+)
+
+# 首次同步前为历史节点补充实体标签与updated_at, 之后才能按水位线增量同步
+MIRROR_BACKFILL_CYPHER = (
+    "MATCH (n) WHERE n.embed IS NOT NULL "
+    f"AND (n.updated_at IS NULL OR NOT n:`{hp.neo4j_entity_label}`) "
+    f"SET n:`{hp.neo4j_entity_label}`, "
+    "n.updated_at = coalesce(n.updated_at, timestamp() / 1000.0)"
+)
+
+# 镜像截断时只传输前$dim维, $dim为null时传输完整向量
+MIRROR_FULL_SYNC_CYPHER = (
+    f"MATCH (n:`{hp.neo4j_entity_label}`) WHERE n.embed IS NOT NULL "
+    "RETURN id(n) AS id, n.embed[0..coalesce($dim, size(n.embed))] AS embed, "
+    "n.updated_at AS updated_at"
+)
+
+MIRROR_INCREMENTAL_SYNC_CYPHER = (
+    f"MATCH (n:`{hp.neo4j_entity_label}`) WHERE n.updated_at >= $since "
+    "AND n.embed IS NOT NULL "
+    "RETURN id(n) AS id, n.embed[0..coalesce($dim, size(n.embed))] AS embed, "
+    "n.updated_at AS updated_at"
+)
+
+# 标签计数走计数存储, 不需要扫描节点
+MIRROR_COUNT_CYPHER = f"MATCH (n:`{hp.neo4j_entity_label}`) RETURN count(n) AS count"
+
+MIRROR_IDS_CYPHER = f"MATCH (n:`{hp.neo4j_entity_label}`) RETURN id(n) AS id"
+
+# 增量同步时水位线向前回退的秒数, 覆盖开始早于水位线、提交晚于上次同步的写事务
+MIRROR_SYNC_OVERLAP = 60.0
+
+RESCORE_CYPHER = "MATCH (n) WHERE id(n) IN $ids RETURN id(n) AS id, n.embed AS embed"
+
+EXPAND_CYPHER = (
+    "UNWIND range(0, size($ids) - 1) AS idx "
+    "MATCH (n) WHERE id(n) = $ids[idx] "
+    "OPTIONAL MATCH (n)-[r]->(m) "
+    "WITH idx, n, collect(CASE WHEN r IS NULL THEN NULL "
+    "ELSE {type: type(r), context: m.context} END) AS rels "
+    "RETURN n.name AS name, n.context AS context, "
+    "CASE WHEN $fanout IS NULL THEN rels ELSE rels[..$fanout] END AS rels "
+    "ORDER BY idx"
+)
 
 
 class Neo4jDB:
@@ -20,14 +104,53 @@ class Neo4jDB:
         bolt_url: str = hp.neo4j_bolt_url,
         username: str = hp.neo4j_username,
         password: str = hp.neo4j_password,
+        search_mode: str = hp.neo4j_search_mode,
+        fusion_method: str = hp.neo4j_fusion_method,
+        mirror_path: str = hp.neo4j_mirror_path,
+        mirror_quantization: str = hp.neo4j_mirror_quantization,
+        mirror_truncate_dim: int | None = hp.neo4j_mirror_truncate_dim,
+        rescore_factor: int = hp.neo4j_mirror_rescore_factor,
+        embed_limiter: TokenBucket | None = None,
+        embed_cache: EmbeddingCache | None = None,
+        pool_size: int = hp.neo4j_pool_size,
+        acquisition_timeout: float = hp.neo4j_acquisition_timeout,
+        connection_timeout: float = hp.neo4j_connection_timeout,
+        query_timeout: float | None = hp.neo4j_query_timeout,
     ) -> None:
         self.chat_model: BaseChatModel = chat_model
         self.embed_model: Embeddings = embed_model
         self.bolt_url: str = bolt_url
         self.username: str = username
         self.password: str = password
-
+        self.search_mode: str = search_mode
+        self.fusion_method: str = fusion_method
+        self.mirror_path: str = mirror_path
+        self.mirror_quantization: str = mirror_quantization
+        self.mirror_truncate_dim: int | None = mirror_truncate_dim
+        self.rescore_factor: int = rescore_factor
+        self.pool_size: int = pool_size
+        self.acquisition_timeout: float = acquisition_timeout
+        self.connection_timeout: float = connection_timeout
+        self.query_timeout: float | None = query_timeout
+        # 节点与边的嵌入请求共用同一个限流器
+        self.embed_limiter: TokenBucket = embed_limiter or TokenBucket(
+            hp.embed_rate_limit, hp.embed_rate_burst
+        )
+        self.embed_cache: EmbeddingCache = embed_cache or EmbeddingCache(
+            hp.embedding_cache_path,
+            namespace=getattr(embed_model, "model", type(embed_model).__name__),
+            max_size=hp.embedding_cache_size,
+        )
+
+        # 同步接口(构建脚本)使用py2neo, 异步检索使用官方驱动的连接池
         self.graph: Graph = self.get_graph()
+        self.async_driver: AsyncDriver | None = None
+        self.async_session_slots: asyncio.Semaphore | None = None
+        self.vector_index_ready: bool = False
+        self.mirror: EmbeddingMirror | None = None
+        # 异步检索时同一时刻只有一个协程同步镜像
+        self.mirror_sync_lock = asyncio.Lock()
+        self.indexed_labels: set[str] = set()
 
     def get_graph(self) -> Graph:
         """获取Neo4j数据库连接"""
@@ -52,9 +175,17 @@ class Neo4jDB:
         """
         embed: list[float] = self.get_node_embedding(content)
 
-        node = Node(label, name=name, context=context, embed=embed, **properties)
+        node = Node(
+            label,
+            hp.neo4j_entity_label,
+            name=name,
+            context=context,
+            embed=embed,
+            **properties,
+        )
 
         self.graph.merge(node, label, "name")
+        self.graph.run(TOUCH_NODES_CYPHER, ids=[node.identity])
         return node
 
     def create_edge(
@@ -85,18 +216,171 @@ class Neo4jDB:
         except Exception as e:
             print(f"Error creating edge: {e}")
 
+    def create_name_constraints(self, labels: set[str]) -> None:
+        """
+        为节点类别创建name唯一约束, 并为实体标签创建name索引, 供批量MERGE使用
+
+        :param labels: 节点类别
+        """
+        labels = labels - self.indexed_labels
+        if not labels:
+            return
+
+        for label in sorted(labels):
+            try:
+                self.graph.run(
+                    f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{cypher_escape(label)}) "
+                    "REQUIRE n.name IS UNIQUE"
+                )
+            except Neo4jError as e:
+                logging.warning(f"无法为节点类别 {label} 创建唯一约束: {e}")
+        self.graph.run(
+            f"CREATE INDEX IF NOT EXISTS FOR (n:{cypher_escape(hp.neo4j_entity_label)}) "
+            "ON (n.name)"
+        )
+        self.indexed_labels |= labels
+
+    def create_nodes(
+        self, nodes: list[dict], batch_size: int = hp.neo4j_write_batch_size
+    ) -> int:
+        """
+        以UNWIND/MERGE事务批量创建或合并节点.
+
+        :param nodes: 节点字典列表, 包含label, name, content, context
+        :param batch_size: 每个事务写入的节点数
+        :return: 写入的节点数
+        """
+        groups = defaultdict(list)
+        for node in nodes:
+            groups[node["label"]].append(node)
+        self.create_name_constraints(set(groups))
+
+        start = time.perf_counter()
+        for label, group in groups.items():
+            for idx in range(0, len(group), batch_size):
+                batch = group[idx : idx + batch_size]
+                embeds = self.embed_texts([node["content"] for node in batch])
+                data = [
+                    dict(name=node["name"], context=node["context"], embed=embed)
+                    for node, embed in zip(batch, embeds)
+                ]
+
+                tx = self.graph.begin()
+                merge_nodes(
+                    tx,
+                    data,
+                    merge_key=(label, "name"),
+                    labels={hp.neo4j_entity_label},
+                )
+                tx.run(
+                    f"UNWIND $names AS name MATCH (n:{cypher_escape(label)}) "
+                    "WHERE n.name = name SET n.updated_at = timestamp() / 1000.0",
+                    names=[node["name"] for node in batch],
+                )
+                self.graph.commit(tx)
+
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"已写入 {len(nodes)} 个节点, 耗时 {elapsed:.2f}s, "
+            f"{len(nodes) / max(elapsed, 1e-6):.1f} 行/秒, "
+            f"嵌入缓存命中率 {self.embed_cache.get_hit_rate():.1%}"
+        )
+        return len(nodes)
+
+    def create_edges(
+        self, edges: list[dict], batch_size: int = hp.neo4j_write_batch_size
+    ) -> int:
+        """
+        以UNWIND/MERGE事务批量创建或合并边, 端点不存在的边会被跳过.
+        节点名称只在各自的节点类别内唯一, 给出端点类别时按 (类别, 名称) 匹配端点,
+        否则按实体标签匹配, 同名的多个节点都会连上这条边.
+
+        :param edges: 边字典列表, 包含start_node_name, end_node_name, rel_type,
+            description, 以及可选的start_node_label, end_node_label
+        :param batch_size: 每个事务写入的边数
+        :return: 写入的边数
+        """
+        groups = defaultdict(list)
+        for edge in edges:
+            key = (
+                edge["rel_type"],
+                edge.get("start_node_label") or hp.neo4j_entity_label,
+                edge.get("end_node_label") or hp.neo4j_entity_label,
+            )
+            groups[key].append(edge)
+
+        start = time.perf_counter()
+        rel_types = list(dict.fromkeys(rel_type for rel_type, _, _ in groups))
+        rel_embeds = dict(zip(rel_types, self.embed_texts(rel_types)))
+        for (rel_type, start_label, end_label), group in groups.items():
+            embed = rel_embeds[rel_type]
+            for idx in range(0, len(group), batch_size):
+                batch = group[idx : idx + batch_size]
+                data = [
+                    (
+                        edge["start_node_name"],
+                        dict(embed=embed, description=edge.get("description", "")),
+                        edge["end_node_name"],
+                    )
+                    for edge in batch
+                ]
+
+                tx = self.graph.begin()
+                merge_relationships(
+                    tx,
+                    data,
+                    merge_key=(rel_type,),
+                    start_node_key=(start_label, "name"),
+                    end_node_key=(end_label, "name"),
+                )
+                self.graph.commit(tx)
+
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"已写入 {len(edges)} 条边, 耗时 {elapsed:.2f}s, "
+            f"{len(edges) / max(elapsed, 1e-6):.1f} 行/秒, "
+            f"嵌入缓存命中率 {self.embed_cache.get_hit_rate():.1%}"
+        )
+        return len(edges)
+
     def get_node_by_name(self, name: str) -> Node | None:
         """根据节点名称获取节点"""
 
         return self.graph.nodes.match(name=name).first()
 
-    @sleep_and_retry
-    @limits(calls=20, period=1)
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        """
+        获取嵌入向量, 先查缓存, 未命中的文本去重后按hp.max_batch_size分批请求,
+        每个批次从限流器获取一个令牌
+
+        :param texts: 待嵌入的文本
+        :return: 与输入顺序一致的嵌入向量
+        """
+        cached = self.embed_cache.get_many(texts)
+        missing = list(
+            dict.fromkeys(text for text, embed in zip(texts, cached) if embed is None)
+        )
+
+        embeds = []
+        for idx in range(0, len(missing), hp.max_batch_size):
+            self.embed_limiter.acquire()
+            embeds.extend(
+                self.embed_model.embed_documents(missing[idx : idx + hp.max_batch_size])
+            )
+        if missing:
+            self.embed_cache.put_many(missing, embeds)
+
+        fetched = dict(zip(missing, embeds))
+        return [
+            embed if embed is not None else fetched[text]
+            for text, embed in zip(texts, cached)
+        ]
+
     def get_node_embedding(self, text: str) -> list[float]:
         """
         获取节点的嵌入向量
         """
-        return self.embed_model.embed_query(text)
+        return self.embed_texts([text])[0]
 
     def get_nodes_embedding(self, nodes: list[Node]) -> np.ndarray:
         embeds = [node["embed"] for node in nodes]
@@ -110,13 +394,15 @@ class Neo4jDB:
         """
         获取边的嵌入向量
         """
-        return self.embed_model.embed_query(text)
+        return self.embed_texts([text])[0]
 
     def delete_all(self) -> None:
         """
         删除整个图数据库
         """
         self.graph.delete_all()
+        if self.mirror is not None:
+            self.mirror.clear()
 
     def get_high_low_keywords(self, query: str) -> list[str]:
         """获取语句中的关键词"""
@@ -151,88 +437,448 @@ class Neo4jDB:
         else:
             return [query]
 
-    def get_relevant_chunks(self, query: str, limit: int = 10) -> list[Document]:
+    def get_vector_index_statements(self, dimensions: int) -> list[str]:
+        """
+        为实体节点的嵌入向量创建向量索引的语句, 同时为历史节点补充实体标签
 
-        keywords = self.get_high_low_keywords(query=query)
+        :param dimensions: 嵌入向量维度
+        """
+        label = hp.neo4j_entity_label
+        return [
+            f"MATCH (n) WHERE n.embed IS NOT NULL AND NOT n:`{label}` SET n:`{label}`",
+            f"CREATE VECTOR INDEX `{hp.neo4j_vector_index}` IF NOT EXISTS "
+            f"FOR (n:`{label}`) ON (n.embed) "
+            f"OPTIONS {{indexConfig: {{`vector.dimensions`: {int(dimensions)}, "
+            f"`vector.similarity_function`: 'cosine'}}}}",
+            f"CALL db.awaitIndex('{hp.neo4j_vector_index}', 300)",
+        ]
+
+    def create_vector_index(self, dimensions: int | None = None) -> bool:
+        """
+        为实体节点的嵌入向量创建向量索引并等待其上线, 同时为历史节点补充实体标签.
+        会写入全图并可能耗时较长, 只在构建图数据库时调用, 检索时只检查索引状态
 
-        query_embedding = self.embed_model.embed_documents(keywords)
-        nodes = list(self.graph.nodes.match())
-        # TODO 非一次性读取
-        embeds = self.get_nodes_embedding(nodes)
+        :param dimensions: 嵌入向量维度, None时取图中已有节点的维度
+        :return: 是否创建成功, 图中没有嵌入向量或服务端不支持向量索引时返回False
+        """
+        if dimensions is None:
+            dimensions = self.graph.evaluate(EMBED_DIMENSIONS_CYPHER)
+            if dimensions is None:
+                return False
+        try:
+            for statement in self.get_vector_index_statements(dimensions):
+                self.graph.run(statement)
+        except Neo4jError as e:
+            logging.warning(f"无法创建向量索引，检索时将使用全图扫描: {e}")
+            return False
+        self.vector_index_ready = True
+        logging.info(f"向量索引 {hp.neo4j_vector_index} 已上线")
+        return True
+
+    def set_vector_index_state(self, state: str | None) -> bool:
+        """根据索引状态更新vector_index_ready, 未上线时本次检索回退到全图扫描"""
+        self.vector_index_ready = state == "ONLINE"
+        if not self.vector_index_ready:
+            logging.warning(
+                f"向量索引 {hp.neo4j_vector_index} 的状态为 {state or '不存在'}，"
+                "本次检索使用全图扫描, 请在构建时调用create_vector_index"
+            )
+        return self.vector_index_ready
+
+    def is_vector_index_online(self) -> bool:
+        """检查向量索引是否存在且已上线, 不创建索引也不写入数据. 上线后不再重复检查"""
+        if self.vector_index_ready:
+            return True
+        try:
+            state = self.graph.evaluate(
+                VECTOR_INDEX_STATE_CYPHER, name=hp.neo4j_vector_index
+            )
+        except Neo4jError as e:
+            logging.warning(f"无法读取向量索引状态，本次检索使用全图扫描: {e}")
+            return False
+        return self.set_vector_index_state(state)
+
+    def search_by_vector_index(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        通过服务端向量索引检索每个关键词最相近的节点
+
+        :param query_embedding: 关键词嵌入向量
+        :param limit: 每个关键词返回的节点数
+        :return: 每个关键词对应的(节点id, 相似度), 按相似度降序排列
+        """
+        return [
+            self.get_hit_from_records(
+                self.graph.run(
+                    VECTOR_QUERY_CYPHER,
+                    index=hp.neo4j_vector_index,
+                    k=limit,
+                    embedding=embedding,
+                ).data()
+            )
+            for embedding in query_embedding
+        ]
+
+    @staticmethod
+    def get_hit_from_records(records: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+        """将向量索引返回的记录转换为(节点id, 相似度)"""
+        return (
+            np.array([record["id"] for record in records], dtype=np.int64),
+            np.array([record["score"] for record in records], dtype=np.float64),
+        )
+
+    def search_by_scan(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        读取全部节点嵌入向量并在本地计算余弦相似度
+
+        :param query_embedding: 关键词嵌入向量
+        :param limit: 每个关键词返回的节点数
+        :return: 每个关键词对应的(节点id, 相似度), 按相似度降序排列
+        """
+        records = self.graph.run(SCAN_CYPHER).data()
+        return self.get_top_ids_from_records(records, query_embedding, limit)
+
+    def get_top_ids_from_records(
+        self, records: list[dict], query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """对全图扫描得到的节点向量计算余弦相似度并选出每个关键词的最优节点"""
+        if not records:
+            return []
+
+        ids = np.array([record["id"] for record in records])
+        embeds = np.array([record["embed"] for record in records])
 
         cosine = cosine_similarity(query_embedding, embeds)
-        top_indices = np.argsort(cosine, axis=1)[:, -limit:][:, ::-1]
-        top_nodes = np.array(nodes)[top_indices]
+        return self.get_top_ids(ids, cosine, limit)
+
+    def get_top_ids(
+        self, ids: np.ndarray, scores: np.ndarray, limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        根据相似度矩阵选出每个关键词得分最高的节点, 使用argpartition避免全量排序
+
+        :param ids: 节点id数组
+        :param scores: 形状为(关键词数, 节点数)的相似度矩阵
+        :param limit: 每个关键词返回的节点数
+        :return: 每个关键词对应的(节点id, 相似度), 按相似度降序排列
+        """
+        top_indices = top_k_indices(scores, limit)
+        top_scores = np.take_along_axis(scores, top_indices, axis=1)
+        return list(zip(ids[top_indices], top_scores))
+
+    def get_mirror(self) -> EmbeddingMirror:
+        """获取本地向量镜像"""
+        if self.mirror is None:
+            self.mirror = EmbeddingMirror(
+                self.mirror_path, self.mirror_quantization, self.mirror_truncate_dim
+            )
+        return self.mirror
 
-        top_nodes = top_nodes.flatten().tolist()[:limit]
+    def get_mirror_sync_query(self, mirror: EmbeddingMirror) -> tuple[str, dict]:
+        """
+        首次同步拉取全部节点, 之后拉取updated_at不早于水位线减去MIRROR_SYNC_OVERLAP
+        的节点, 重复拉取的节点由镜像按id与updated_at去重
+        """
+        if mirror.watermark is None:
+            return MIRROR_FULL_SYNC_CYPHER, {"dim": mirror.truncate_dim}
+        return MIRROR_INCREMENTAL_SYNC_CYPHER, {
+            "since": mirror.watermark - MIRROR_SYNC_OVERLAP,
+            "dim": mirror.truncate_dim,
+        }
+
+    def apply_mirror_records(
+        self,
+        mirror: EmbeddingMirror,
+        records: list[dict],
+        live_ids: list[int] | None = None,
+    ) -> EmbeddingMirror:
+        """将同步得到的节点记录合并到本地向量镜像, 给出live_ids时同时删除已删除的节点"""
+        synced = mirror.apply(records, live_ids)
+        if synced:
+            logging.info(f"本地向量镜像已同步 {synced} 个节点，共 {len(mirror.ids)} 个节点")
+        return mirror
+
+    def sync_mirror(self) -> EmbeddingMirror:
+        """
+        增量同步本地向量镜像, 仅拉取updated_at不早于水位线的节点. 合并后镜像的节点数
+        多于图数据库中的节点数时说明有节点被删除, 再拉取全部节点id删除多余的节点
+        """
+        mirror = self.get_mirror()
+        if mirror.watermark is None:
+            self.graph.run(MIRROR_BACKFILL_CYPHER)
+        cypher, parameters = self.get_mirror_sync_query(mirror)
+        records = self.graph.run(cypher, **parameters).data()
+
+        live_ids = None
+        if mirror.get_merged_size(records) > self.graph.evaluate(MIRROR_COUNT_CYPHER):
+            live_ids = [record["id"] for record in self.graph.run(MIRROR_IDS_CYPHER)]
+        return self.apply_mirror_records(mirror, records, live_ids)
+
+    def search_by_mirror(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        在本地向量镜像上完成相似度计算
 
+        :param query_embedding: 关键词嵌入向量
+        :param limit: 每个关键词返回的节点数
+        :return: 每个关键词对应的(节点id, 相似度), 按相似度降序排列
+        """
+        mirror = self.sync_mirror()
+        hits = self.get_top_ids_from_mirror(mirror, query_embedding, limit)
+        if not mirror.compact or not hits:
+            return hits
+        records = self.graph.run(RESCORE_CYPHER, ids=self.get_candidate_ids(hits)).data()
+        return self.get_top_ids_from_records(records, query_embedding, limit)
+
+    def get_top_ids_from_mirror(
+        self, mirror: EmbeddingMirror, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        在本地向量镜像上选出每个关键词的最优节点, 镜像经过压缩时多取
+        rescore_factor倍的候选, 供调用方以全精度向量重排
+        """
+        if not len(mirror.ids):
+            return []
+        if mirror.compact:
+            limit *= self.rescore_factor
+        return self.get_top_ids(*mirror.score(query_embedding), limit)
+
+    @staticmethod
+    def get_candidate_ids(hits: list[tuple[np.ndarray, np.ndarray]]) -> list[int]:
+        """各关键词候选节点id的并集, 用于读取全精度向量重排"""
+        return np.unique(np.concatenate([hit[0] for hit in hits])).tolist()
+
+    def merge_hits(
+        self, hits: list[tuple[np.ndarray, np.ndarray]], limit: int
+    ) -> list[int]:
+        """
+        融合各关键词的检索结果, 去重后返回全局top-k
+
+        :param hits: 每个关键词对应的(节点id, 相似度)
+        :param limit: 返回的节点数
+        :return: 节点id列表
+        """
+        ids, _ = fuse_rankings(
+            [hit[0] for hit in hits],
+            [hit[1] for hit in hits],
+            limit,
+            method=self.fusion_method,
+        )
+        return ids.tolist()
+
+    def search_nodes(self, query_embedding: list[list[float]], limit: int) -> list[int]:
+        """
+        按检索方式获取与关键词最相近的节点id
+
+        :param query_embedding: 关键词嵌入向量
+        :param limit: 返回的节点数
+        :return: 节点id列表
+        """
+        hits = None
+        if self.search_mode == "vector_index" and self.is_vector_index_online():
+            try:
+                hits = self.search_by_vector_index(query_embedding, limit)
+            except Neo4jError as e:
+                # 索引可能已被删除, 下次检索时重新检查状态
+                self.vector_index_ready = False
+                logging.warning(f"向量索引查询失败，回退到全图扫描: {e}")
+        elif self.search_mode == "mirror":
+            hits = self.search_by_mirror(query_embedding, limit)
+        if hits is None:
+            hits = self.search_by_scan(query_embedding, limit)
+
+        return self.merge_hits(hits, limit)
+
+    def expand_nodes(
+        self, ids: list[int], fanout: int | None = hp.neo4j_max_fanout
+    ) -> list[Document]:
+        """
+        一次查询取回节点上下文及其出边邻居, 整理为文档片段
+
+        :param ids: 节点id列表, 结果保持该顺序
+        :param fanout: 每个节点最多展开的出边数, None表示不限制
+        :return: 文档片段
+        """
+        records = self.graph.run(EXPAND_CYPHER, ids=ids, fanout=fanout).data()
+        return self.get_chunks_from_records(records)
+
+    def get_chunks_from_records(self, records: list[dict]) -> list[Document]:
+        """将节点及其邻居记录整理为文档片段"""
         chunks = []
-        for node in top_nodes:
-            if node["context"] is None:
+        for record in records:
+            if record["context"] is None:
                 continue
-            chunks.append(Document(page_content=node["context"]))
-
-            rels = list(self.graph.relationships.match(nodes=(node, None)))
-            for rel in rels:
-                _start_node = rel.start_node
-                _end_node = rel.end_node
+            chunks.append(Document(page_content=record["context"]))
 
+            for rel in record["rels"]:
                 chunks.append(
                     Document(
-                        page_content=f"关系: {_start_node['name']} -> {rel.__class__.__name__}, 描述: {_end_node['context']}"
+                        page_content=f"关系: {record['name']} -> {rel['type']}, 描述: {rel['context']}"
                     )
                 )
 
         return chunks
 
-    # ! 当前阶段仅支持单文本,少量向量检索
-    async def aget_relevant_chunks(self, query: str, limit: int = 10) -> list[Document]:
+    def get_relevant_chunks(
+        self, query: str, limit: int = 10, fanout: int | None = hp.neo4j_max_fanout
+    ) -> list[Document]:
 
-        keywords = await self.aget_high_low_keywords(query=query)
+        keywords = self.get_high_low_keywords(query=query)
 
-        query_embedding = await self.embed_model.aembed_documents(keywords)
-        nodes = list(self.graph.nodes.match())
-        # TODO 非一次性读取
-        embeds = self.get_nodes_embedding(nodes)
+        query_embedding = self.embed_model.embed_documents(keywords)
+        top_ids = self.search_nodes(query_embedding, limit)
+
+        return self.expand_nodes(top_ids, fanout)
+
+    def get_async_driver(self) -> AsyncDriver:
+        """获取异步Neo4j驱动, 连接池大小与超时由构造参数决定"""
+        if self.async_driver is None:
+            self.async_driver = AsyncGraphDatabase.driver(
+                self.bolt_url,
+                auth=(self.username, self.password),
+                max_connection_pool_size=self.pool_size,
+                connection_acquisition_timeout=self.acquisition_timeout,
+                connection_timeout=self.connection_timeout,
+            )
+            self.async_session_slots = asyncio.Semaphore(self.pool_size)
+        return self.async_driver
 
-        cosine = cosine_similarity(query_embedding, embeds)
-        top_indices = np.argsort(cosine, axis=1)[:, -limit:][:, ::-1]
-        top_nodes = np.array(nodes)[top_indices]
+    async def arun(self, cypher: str, **parameters) -> list[dict]:
+        """
+        在有界会话池中异步执行Cypher查询
 
-        top_nodes = top_nodes.flatten().tolist()[:limit]
+        :param cypher: Cypher语句
+        :param parameters: 查询参数
+        :return: 查询结果记录
+        """
+        driver = self.get_async_driver()
+        async with self.async_session_slots:
+            async with driver.session() as session:
+                result = await session.run(
+                    Query(cypher, timeout=self.query_timeout), parameters
+                )
+                return await result.data()
+
+    async def aclose(self) -> None:
+        """关闭异步驱动及其连接池"""
+        if self.async_driver is not None:
+            await self.async_driver.close()
+            self.async_driver = None
+
+    async def ais_vector_index_online(self) -> bool:
+        """is_vector_index_online的异步版本"""
+        if self.vector_index_ready:
+            return True
+        try:
+            records = await self.arun(
+                VECTOR_INDEX_STATE_CYPHER, name=hp.neo4j_vector_index
+            )
+        except DriverError as e:
+            logging.warning(f"无法读取向量索引状态，本次检索使用全图扫描: {e}")
+            return False
+        return self.set_vector_index_state(records[0]["state"] if records else None)
+
+    async def asearch_by_vector_index(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """search_by_vector_index的异步版本, 各关键词的查询并发执行"""
+        results = await asyncio.gather(
+            *[
+                self.arun(
+                    VECTOR_QUERY_CYPHER,
+                    index=hp.neo4j_vector_index,
+                    k=limit,
+                    embedding=embedding,
+                )
+                for embedding in query_embedding
+            ]
+        )
+        return [self.get_hit_from_records(records) for records in results]
+
+    async def asearch_by_scan(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """search_by_scan的异步版本, 相似度计算在线程中执行, 不阻塞事件循环"""
+        records = await self.arun(SCAN_CYPHER)
+        return await asyncio.to_thread(
+            self.get_top_ids_from_records, records, query_embedding, limit
+        )
+
+    async def async_sync_mirror(self) -> EmbeddingMirror:
+        """sync_mirror的异步版本, 合并与写盘在线程中执行"""
+        mirror = self.get_mirror()
+        async with self.mirror_sync_lock:
+            if mirror.watermark is None:
+                await self.arun(MIRROR_BACKFILL_CYPHER)
+            cypher, parameters = self.get_mirror_sync_query(mirror)
+            records = await self.arun(cypher, **parameters)
+
+            live_ids = None
+            count = (await self.arun(MIRROR_COUNT_CYPHER))[0]["count"]
+            if await asyncio.to_thread(mirror.get_merged_size, records) > count:
+                live_ids = [
+                    record["id"] for record in await self.arun(MIRROR_IDS_CYPHER)
+                ]
+            return await asyncio.to_thread(
+                self.apply_mirror_records, mirror, records, live_ids
+            )
 
-        # chunks = [
-        #     Document(page_content=rel["description"])
-        #     for node in top_nodes
-        #     for rel in self.graph.relationships.match((node, None))
-        # ]
-        chunks = []
-        for node in top_nodes:
-            if node["context"] is None:
-                continue
-            chunks.append(Document(page_content=node["context"]))
+    async def asearch_nodes(
+        self, query_embedding: list[list[float]], limit: int
+    ) -> list[int]:
+        """search_nodes的异步版本"""
+        hits = None
+        if self.search_mode == "vector_index" and await self.ais_vector_index_online():
+            try:
+                hits = await self.asearch_by_vector_index(query_embedding, limit)
+            except DriverError as e:
+                self.vector_index_ready = False
+                logging.warning(f"向量索引查询失败，回退到全图扫描: {e}")
+        elif self.search_mode == "mirror":
+            mirror = await self.async_sync_mirror()
+            hits = await asyncio.to_thread(
+                self.get_top_ids_from_mirror, mirror, query_embedding, limit
+            )
+            if mirror.compact and hits:
+                records = await self.arun(
+                    RESCORE_CYPHER, ids=self.get_candidate_ids(hits)
+                )
+                hits = await asyncio.to_thread(
+                    self.get_top_ids_from_records, records, query_embedding, limit
+                )
+        if hits is None:
+            hits = await self.asearch_by_scan(query_embedding, limit)
 
-            rels = list(self.graph.relationships.match(nodes=(node, None)))
-            for rel in rels:
-                _start_node = rel.start_node
-                _end_node = rel.end_node
+        return self.merge_hits(hits, limit)
 
-                chunks.append(
-                    Document(
-                        page_content=f"关系: {_start_node['name']} -> {rel.__class__.__name__}, 描述: {_end_node['context']}"
-                    )
-                )
+    async def aexpand_nodes(
+        self, ids: list[int], fanout: int | None = hp.neo4j_max_fanout
+    ) -> list[Document]:
+        """expand_nodes的异步版本"""
+        records = await self.arun(EXPAND_CYPHER, ids=ids, fanout=fanout)
+        return self.get_chunks_from_records(records)
 
-        return chunks
+    async def aget_relevant_chunks(
+        self, query: str, limit: int = 10, fanout: int | None = hp.neo4j_max_fanout
+    ) -> list[Document]:
 
+        keywords = await self.aget_high_low_keywords(query=query)
 
-if __name__ == "__main__":
-    import asyncio
+        query_embedding = await self.embed_model.aembed_documents(keywords)
+        top_ids = await self.asearch_nodes(query_embedding, limit)
 
-    from src.model import SiliconflowClient
+        return await self.aexpand_nodes(top_ids, fanout)
+
+
+if __name__ == "__main__":
+    from src.model import CachedEmbeddings, SiliconflowClient
 
     chat_model = SiliconflowClient().get_chat_model()
-    embed_model = SiliconflowClient().get_embed_model()
+    embed_model = CachedEmbeddings(SiliconflowClient().get_embed_model())
     db = Neo4jDB(chat_model, embed_model)
 
     # node1 = db.create_node(
@@ -0,0 +1,340 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import hp
+from src.db.faiss_db import FaissDB
+from src.parser import MsdsParser
+from src.toolkits import TokenBucket
+
+LAYOUT_FILE = "shards.json"
+
+
+def get_shard_id(file: str, num_shards: int) -> int:
+    """按源文件名的哈希分配分片, 与文件所在目录无关"""
+    digest = hashlib.sha256(os.path.basename(file).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % num_shards
+
+
+def sync_shard(
+    shard_path: str,
+    files: list[str],
+    embed_model: Embeddings | Callable[[], Embeddings],
+    rate_share: float,
+    kwargs: dict,
+) -> dict[str, int]:
+    """
+    在子进程中构建或增量同步单个分片, 需为模块级函数以便跨进程传递
+
+    :param shard_path: 分片路径
+    :param files: 属于该分片的全部源文件
+    :param embed_model: 嵌入模型, 或在子进程中创建模型的可序列化工厂函数
+    :param rate_share: 该分片可使用的嵌入接口限额比例
+    :param kwargs: FaissDB的其他参数
+    :return: 新增、修改、删除的文件数
+    """
+    if not isinstance(embed_model, Embeddings):
+        embed_model = embed_model()
+    # 各进程分摊嵌入接口的限额与解析文件使用的CPU核数
+    kwargs = dict(
+        kwargs,
+        embed_limiter=TokenBucket(
+            hp.embed_rate_limit * rate_share,
+            max(1.0, hp.embed_rate_burst * rate_share),
+        ),
+        parse_workers=max(1, int((os.cpu_count() or 1) * rate_share)),
+    )
+    if os.path.isdir(shard_path):
+        return FaissDB(shard_path, embed_model, **kwargs).sync(files)
+
+    parser = MsdsParser(
+        files,
+        max_workers=kwargs["parse_workers"],
+        split_mode=kwargs.get("split_mode", hp.split_mode),
+    )
+    FaissDB(
+        shard_path,
+        embed_model,
+        documents=parser.iter_documents(),
+        files=files,
+        **kwargs,
+    )
+    return {"added": len(files), "modified": 0, "removed": 0}
+
+
+class ShardedFaissDB:
+    """
+    分片FAISS数据库
+
+    按源文件名的哈希将文件分配到N个分片, 每个分片是一个独立的FaissDB(各自的文件清单、
+    词法索引与元数据索引), 可以单独重建. 构建时每个分片在独立进程中完成; 检索时查询只嵌入
+    一次, 各分片在线程池中并行检索(faiss检索时释放GIL), 结果以堆合并为全局top-k.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        embed_model: Embeddings,
+        num_shards: int = hp.faiss_num_shards,
+        embed_model_factory: Optional[Callable[[], Embeddings]] = None,
+        **kwargs,
+    ) -> None:
+        """
+        :param db_path: 数据库路径, 各分片位于其下的shard_xxx目录
+        :param embed_model: 嵌入模型
+        :param num_shards: 分片数, 已有数据库以创建时的分片数为准
+        :param embed_model_factory: 在子进程中创建嵌入模型的可序列化工厂函数(模块级函数
+            或functools.partial), 嵌入模型本身无法序列化(如持有HTTP连接)时使用
+        :param kwargs: 传给每个分片FaissDB的参数
+        """
+        self.db_path: str = db_path
+        self.layout_path: str = os.path.join(db_path, LAYOUT_FILE)
+        self.embed_model: Embeddings = embed_model
+        self.embed_model_factory = embed_model_factory
+        self.prefilter: bool = kwargs.get("prefilter", hp.faiss_prefilter)
+        self.kwargs: dict = kwargs
+
+        self.num_shards: int = self.load_num_shards(num_shards)
+        self.shards: dict[int, FaissDB] = self.load_shards()
+        self.executor = ThreadPoolExecutor(max_workers=self.num_shards)
+
+    def load_num_shards(self, num_shards: int) -> int:
+        """读取已有数据库的分片数, 与参数不一致时以已有数据库为准"""
+        if not os.path.exists(self.layout_path):
+            return num_shards
+        with open(self.layout_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)["num_shards"]
+        if stored != num_shards:
+            logging.warning(
+                f"数据库 {self.db_path} 创建时的分片数为 {stored}，忽略参数 {num_shards}"
+            )
+        return stored
+
+    def get_shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.db_path, f"shard_{shard_id:03d}")
+
+    def load_shards(self) -> dict[int, FaissDB]:
+        """加载已存在的分片"""
+        return {
+            shard_id: FaissDB(
+                self.get_shard_path(shard_id), self.embed_model, **self.kwargs
+            )
+            for shard_id in range(self.num_shards)
+            if os.path.isdir(self.get_shard_path(shard_id))
+        }
+
+    def partition(self, files: list[str]) -> dict[int, list[str]]:
+        """按分片划分源文件"""
+        partitions: dict[int, list[str]] = {}
+        for file in files:
+            partitions.setdefault(get_shard_id(file, self.num_shards), []).append(file)
+        return partitions
+
+    def run_shards(
+        self, tasks: dict[int, list[str]], max_workers: Optional[int] = None
+    ) -> dict[int, dict[str, int]]:
+        """
+        在进程池中构建或同步分片
+
+        :param tasks: 分片id -> 属于该分片的全部源文件
+        :param max_workers: 最大进程数, 默认不超过CPU核数
+        :return: 分片id -> 同步结果
+        """
+        if not tasks:
+            return {}
+        max_workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+        os.makedirs(self.db_path, exist_ok=True)
+        with open(self.layout_path, "w", encoding="utf-8") as f:
+            json.dump({"num_shards": self.num_shards}, f)
+
+        # faiss使用OpenMP, fork出的子进程可能死锁, 使用spawn启动子进程
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers, mp_context=context) as executor:
+            futures = {
+                shard_id: executor.submit(
+                    sync_shard,
+                    self.get_shard_path(shard_id),
+                    files,
+                    self.embed_model_factory or self.embed_model,
+                    1 / max_workers,
+                    self.kwargs,
+                )
+                for shard_id, files in tasks.items()
+            }
+            stats = {shard_id: future.result() for shard_id, future in futures.items()}
+
+        self.shards = self.load_shards()
+        logging.info(f"FAISS分片已同步: {stats}")
+        return stats
+
+    def sync(
+        self, files: list[str], max_workers: Optional[int] = None
+    ) -> dict[int, dict[str, int]]:
+        """
+        按文件清单增量同步全部分片, 不存在的分片直接构建
+
+        :param files: 当前知识库中的全部源文件
+        :param max_workers: 最大进程数
+        :return: 分片id -> 新增、修改、删除的文件数
+        """
+        partitions = self.partition(files)
+        # 已存在但不再分到文件的分片也要同步, 以删除其中的向量
+        tasks = {
+            shard_id: partitions.get(shard_id, [])
+            for shard_id in sorted(set(partitions) | set(self.shards))
+        }
+        return self.run_shards(tasks, max_workers)
+
+    def rebuild_shard(self, shard_id: int, files: list[str]) -> dict[str, int]:
+        """
+        删除并重建单个分片, 其他分片不受影响
+
+        :param shard_id: 分片id
+        :param files: 知识库中的全部源文件, 只使用属于该分片的文件
+        :return: 同步结果
+        """
+        shard = self.shards.pop(shard_id, None)
+        if shard is not None:
+            shard.delete_db()
+        elif os.path.isdir(self.get_shard_path(shard_id)):
+            shutil.rmtree(self.get_shard_path(shard_id))
+
+        files = self.partition(files).get(shard_id, [])
+        if not files:
+            return {"added": 0, "modified": 0, "removed": 0}
+        return self.run_shards({shard_id: files}, max_workers=1)[shard_id]
+
+    def resolve_filters(self, query: str) -> Optional[dict[str, str]]:
+        """在全部分片中解析查询对应的化学品, 优先CAS号, 其次最长的化学品名称"""
+        candidates = [
+            filters
+            for shard in self.shards.values()
+            if (filters := shard.metadata_index.resolve_filters(query))
+        ]
+        return max(
+            candidates,
+            key=lambda filters: ("cas" in filters, len(filters.get("chemical", ""))),
+            default=None,
+        )
+
+    def get_lexical_stats(self, query: str) -> tuple[int, int, dict[str, int]]:
+        """
+        将各分片的文档数、文档总长度与文档频率相加, 得到全部分片的BM25语料统计.
+        各分片以相同的统计计算得分, 结果可直接按得分合并
+        """
+        num_docs, total_length, df = 0, 0, Counter()
+        for shard_docs, shard_length, shard_df in self.executor.map(
+            lambda shard: shard.lexical_index.get_stats(query), self.shards.values()
+        ):
+            num_docs += shard_docs
+            total_length += shard_length
+            df.update(shard_df)
+        return num_docs, total_length, dict(df)
+
+    def search(
+        self,
+        query: str,
+        search_mode: str = "vector",
+        k: int = 10,
+        score_threshold: float = 0.15,
+        filters: Optional[dict[str, str]] = None,
+    ) -> list[Document]:
+        """
+        并行检索全部分片并合并结果, 参数与FaissDB.search一致
+
+        :param query: 查询文本
+        :param search_mode: vector | bm25 | hybrid
+        :param k: 返回的文档数
+        :param score_threshold: 向量检索的相关度阈值
+        :param filters: 元数据过滤条件, None时从查询中解析
+        :return: 文档列表
+        """
+        if search_mode not in ("vector", "bm25", "hybrid"):
+            raise ValueError(f"不支持的检索方式: {search_mode}")
+        if not self.shards:
+            return []
+
+        # 有分片的词法索引与元数据索引尚未重建时只使用向量检索
+        if not all(shard.indexes_ready for shard in self.shards.values()):
+            filters, search_mode = {}, "vector"
+        if filters is None and self.prefilter:
+            filters = self.resolve_filters(query)
+        fetch_k = 2 * k if search_mode == "hybrid" else k
+        embedding = (
+            self.embed_model.embed_query(query) if search_mode != "bm25" else None
+        )
+        stats = self.get_lexical_stats(query) if search_mode != "vector" else None
+
+        def search_shard(shard: FaissDB) -> tuple[list, list]:
+            doc_ids = shard.metadata_index.get_ids(filters) if filters else None
+            if doc_ids is not None and not doc_ids:
+                return [], []
+            dense = (
+                shard.dense_search_by_vector(embedding, fetch_k, doc_ids)
+                if embedding is not None
+                else []
+            )
+            lexical = (
+                shard.lexical_search(query, fetch_k, doc_ids, stats)
+                if search_mode != "vector"
+                else []
+            )
+            return dense, lexical
+
+        results = list(self.executor.map(search_shard, self.shards.values()))
+        dense = heapq.nsmallest(
+            fetch_k,
+            itertools.chain.from_iterable(result[0] for result in results),
+            key=lambda hit: hit[1],
+        )
+        lexical = heapq.nlargest(
+            fetch_k,
+            itertools.chain.from_iterable(result[1] for result in results),
+            key=lambda hit: hit[1],
+        )
+
+        if search_mode == "vector":
+            shard = next(iter(self.shards.values()))
+            relevance_score_fn = shard.db._select_relevance_score_fn()
+            hits = [(doc, relevance_score_fn(distance)) for doc, distance in dense]
+            hits = [(doc, score) for doc, score in hits if score >= score_threshold]
+        elif search_mode == "bm25":
+            hits = lexical
+        else:
+            hits = FaissDB.fuse_hits(dense, lexical, k)
+        return [doc for doc, _ in hits]
+
+
+if __name__ == "__main__":
+    from functools import partial
+
+    from langchain_openai import OpenAIEmbeddings
+
+    from src.toolkits import get_files_from_kb_space
+
+    # 子进程中按相同参数创建嵌入模型, partial可序列化
+    embed_model_factory = partial(
+        OpenAIEmbeddings,
+        model=hp.siliconflow_embedding_model,
+        base_url=hp.siliconflow_base_url,
+        api_key=os.getenv("SILICONFLOW_API_KEY"),
+    )
+    db = ShardedFaissDB(
+        "/root/Documents/msds-qa/kb_sharded",
+        embed_model_factory(),
+        num_shards=8,
+        embed_model_factory=embed_model_factory,
+    )
+    db.sync(get_files_from_kb_space("/root/Documents/msds-qa/assets"))
+    print(db.search("氢化钙的急救措施", search_mode="hybrid"))
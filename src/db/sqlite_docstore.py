@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from typing import Iterator, Union
+
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    基于SQLite的文档库
+
+    文本块内容与元数据按id建立索引, 查询时逐条读取, 不需要在启动时反序列化整个文档库.
+    写入在同一事务中累积, 调用commit后才对其他进程可见, 以便与向量索引一同落盘.
+    """
+
+    def __init__(self, store_path: str) -> None:
+        """
+        :param store_path: SQLite文件路径
+        """
+        self.store_path: str = store_path
+
+        os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(store_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs "
+            "(id TEXT PRIMARY KEY, content TEXT, metadata TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, id TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS positions_id ON positions (id)")
+        self.conn.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        按id读取文档
+
+        :param search: 文档id
+        :return: 文档, 不存在时返回提示字符串(与InMemoryDocstore一致)
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, metadata FROM docs WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: dict[str, Document]) -> None:
+        """
+        添加文档
+
+        :param texts: 文档id -> 文档
+        """
+        ids = list(texts)
+        with self.lock:
+            for idx in range(0, len(ids), 500):
+                batch = ids[idx : idx + 500]
+                overlapping = self.conn.execute(
+                    f"SELECT id FROM docs WHERE id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                if overlapping:
+                    raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            self.conn.executemany(
+                "INSERT INTO docs (id, content, metadata) VALUES (?, ?, ?)",
+                [
+                    (
+                        doc_id,
+                        doc.page_content,
+                        json.dumps(doc.metadata, ensure_ascii=False),
+                    )
+                    for doc_id, doc in texts.items()
+                ],
+            )
+
+    def delete(self, ids: list[str]) -> None:
+        """
+        删除文档
+
+        :param ids: 文档id
+        """
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM docs WHERE id = ?", [(doc_id,) for doc_id in ids]
+            )
+
+    def set_positions(self, index_to_docstore_id: dict[int, str]) -> None:
+        """
+        重写向量位置到文档id的映射, 用于删除向量后位置整体前移的情况
+
+        :param index_to_docstore_id: 向量位置 -> 文档id
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM positions")
+            self.conn.executemany(
+                "INSERT INTO positions (position, id) VALUES (?, ?)",
+                list(index_to_docstore_id.items()),
+            )
+
+    def commit(self) -> None:
+        """提交累积的写入"""
+        with self.lock:
+            self.conn.commit()
+
+    def rollback(self) -> None:
+        """放弃未提交的写入"""
+        with self.lock:
+            self.conn.rollback()
+
+    def close(self) -> None:
+        """关闭连接"""
+        with self.lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+class SqliteIndexMap(MutableMapping):
+    """
+    向量位置到文档id的映射, 读写直接作用于SqliteDocstore的positions表,
+    可直接作为LangChain FAISS的index_to_docstore_id使用
+    """
+
+    def __init__(self, docstore: SqliteDocstore) -> None:
+        self.docstore: SqliteDocstore = docstore
+
+    def query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self.docstore.lock:
+            return self.docstore.conn.execute(sql, params).fetchall()
+
+    def __getitem__(self, position: int) -> str:
+        rows = self.query("SELECT id FROM positions WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __setitem__(self, position: int, doc_id: str) -> None:
+        self.update({position: doc_id})
+
+    def __delitem__(self, position: int) -> None:
+        with self.docstore.lock:
+            self.docstore.conn.execute(
+                "DELETE FROM positions WHERE position = ?", (int(position),)
+            )
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([row[0] for row in self.query("SELECT position FROM positions")])
+
+    def __len__(self) -> int:
+        return self.query("SELECT COUNT(*) FROM positions")[0][0]
+
+    def items(self) -> list[tuple[int, str]]:
+        return self.query("SELECT position, id FROM positions ORDER BY position")
+
+    def values(self) -> list[str]:
+        return [row[0] for row in self.query("SELECT id FROM positions ORDER BY position")]
+
+    def get_positions(self, doc_ids: list[str]) -> list[int]:
+        """文档id对应的向量位置"""
+        positions = []
+        for idx in range(0, len(doc_ids), 500):
+            batch = doc_ids[idx : idx + 500]
+            positions += [
+                row[0]
+                for row in self.query(
+                    "SELECT position FROM positions WHERE id IN "
+                    f"({','.join('?' * len(batch))})",
+                    tuple(batch),
+                )
+            ]
+        return positions
+
+    def update(self, other: dict[int, str] = (), **kwargs) -> None:
+        rows = [(int(k), v) for k, v in dict(other, **kwargs).items()]
+        with self.docstore.lock:
+            self.docstore.conn.executemany(
+                "INSERT OR REPLACE INTO positions (position, id) VALUES (?, ?)", rows
+            )
@@ -0,0 +1,499 @@
+"""
+离线检索基准
+
+以固定随机种子生成的MSDS语料构建索引, 使用基于特征哈希的确定性嵌入代替嵌入接口, 不访问网络.
+评估FaissDB各索引配置与Neo4jDB.get_relevant_chunks的构建耗时、索引大小、查询延迟分位数与
+recall@k, 结果写入JSON文件, 可在不同提交之间比较. Neo4j不可达时跳过图数据库部分.
+
+用法: python -m src.eval.benchmark --output bench_output.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+
+from src.config import hp
+from src.db import FaissDB, Neo4jDB
+from src.db.bm25_index import tokenize
+from src.parser import MSDS_SECTIONS
+from src.toolkits import EmbeddingCache, TokenBucket
+
+# 默认评估的FAISS配置, name之外的字段作为FaissDB参数或检索参数
+FAISS_CONFIGS = [
+    {"name": "flat-vector", "index_type": "flat", "search_mode": "vector"},
+    {"name": "flat-bm25", "index_type": "flat", "search_mode": "bm25"},
+    {"name": "flat-hybrid", "index_type": "flat", "search_mode": "hybrid"},
+    {
+        "name": "flat-hybrid-no-prefilter",
+        "index_type": "flat",
+        "search_mode": "hybrid",
+        "prefilter": False,
+    },
+    {"name": "hnsw-vector", "index_type": "hnsw", "search_mode": "vector"},
+    {"name": "ivf_flat-vector", "index_type": "ivf_flat", "search_mode": "vector"},
+    {
+        "name": "flat-int8-vector",
+        "index_type": "flat",
+        "quantization": "int8",
+        "search_mode": "vector",
+    },
+]
+NEO4J_SEARCH_MODES = ["scan", "mirror", "vector_index"]
+# 基准写入图数据库的节点类别, 运行前后只清理这两类节点
+NEO4J_LABELS = ["BenchChemical", "BenchSection"]
+
+# 语料生成使用的化学品名称与描述短语
+CHEMICAL_PREFIXES = "氯化 硫酸 硝酸 碳酸 磷酸 氢氧化 醋酸 溴化 碘化 氟化".split()
+CHEMICAL_CATIONS = "钠 钾 钙 镁 铵 锌 铜 铁 钡 锂".split()
+PHRASES = (
+    "遇湿易燃 对眼睛和皮肤有刺激性 吸入后立即转移至空气新鲜处 用大量流动清水冲洗 "
+    "储存于阴凉、通风的库房 远离火种、热源 与强氧化剂分开存放 佩戴自吸过滤式防尘口罩 "
+    "泄漏时隔离污染区 用干燥的砂土覆盖 熔点较高 易溶于水 对水生生物有毒 不得随意排放 "
+    "按危险货物运输 符合国家相关法规 粉尘可引起呼吸道刺激 灭火时使用干粉 禁止用水灭火 "
+    "长期接触可致慢性中毒"
+).split()
+QUERY_TEMPLATES = [
+    "{chemical}的{section}",
+    "{chemical}{section}有哪些内容",
+    "CAS {cas} 的{section}",
+]
+
+
+class HashEmbeddings(Embeddings):
+    """
+    确定性的本地嵌入: 将词法分词结果按特征哈希映射到固定维度并归一化,
+    文本相同则向量相同, 词项重叠越多相似度越高
+    """
+
+    def __init__(self, dimensions: int = 256) -> None:
+        self.dimensions: int = dimensions
+        self.model: str = f"hash-embedding-{dimensions}"
+
+    def embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            idx = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[idx] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed(text)
+
+
+def get_cas(seed: int) -> str:
+    """按序号生成带合法校验位的CAS号"""
+    digits = str(7000 + seed * 37)
+    body = digits + f"{seed % 100:02d}"
+    check = sum(int(d) * (i + 1) for i, d in enumerate(reversed(body))) % 10
+    return f"{digits}-{seed % 100:02d}-{check}"
+
+
+def build_corpus(
+    corpus_dir: str, num_chemicals: int = 50, seed: int = 0
+) -> tuple[list[Document], list[dict]]:
+    """
+    生成固定的MSDS语料: 每个化学品一个源文件, 每个部分一个文本块
+
+    :param corpus_dir: 源文件目录
+    :param num_chemicals: 化学品数, 不超过100
+    :param seed: 随机种子
+    :return: 文本块, 以及每个文本块的 {chemical, cas, section} 标注
+    """
+    rng = np.random.default_rng(seed)
+    names = [p + c for p in CHEMICAL_PREFIXES for c in CHEMICAL_CATIONS]
+    names = [names[idx] for idx in rng.permutation(len(names))[:num_chemicals]]
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    documents, labels = [], []
+    for idx, chemical in enumerate(names):
+        cas = get_cas(idx)
+        source = os.path.join(corpus_dir, f"{chemical}.txt")
+        texts = []
+        for section in MSDS_SECTIONS:
+            phrases = rng.choice(PHRASES, size=int(rng.integers(3, 6)), replace=False)
+            subject = chemical if rng.random() < 0.5 else "本品"
+            text = f"{section}\n{subject}" + "，".join(phrases) + "。"
+            if section == "化学品及企业标识":
+                text += f"CAS号：{cas}。"
+            texts.append(text)
+            documents.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        "source": source,
+                        "chemical": chemical,
+                        "cas": cas,
+                        "section": section,
+                    },
+                )
+            )
+            labels.append({"chemical": chemical, "cas": cas, "section": section})
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(texts))
+    return documents, labels
+
+
+def build_queries(
+    documents: list[Document], labels: list[dict], num_queries: int, seed: int = 0
+) -> list[tuple[str, str]]:
+    """
+    抽样生成查询, 每个查询对应唯一的相关文本块
+
+    :return: (查询文本, 相关文本块内容)
+    """
+    rng = np.random.default_rng(seed + 1)
+    size = min(num_queries, len(documents))
+    picks = rng.choice(len(documents), size=size, replace=False)
+    return [
+        (
+            QUERY_TEMPLATES[idx % len(QUERY_TEMPLATES)].format(**labels[pick]),
+            documents[pick].page_content,
+        )
+        for idx, pick in enumerate(picks.tolist())
+    ]
+
+
+def get_dir_size(path: str, exclude: tuple[str, ...] = ("files",)) -> dict[str, int]:
+    """
+    目录下各文件的字节数, 不含复制的源文件. SQLite文件先执行检查点将WAL合并回主文件,
+    WAL与共享内存文件不计入
+    """
+    sizes = {}
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in exclude]
+        for file in files:
+            full = os.path.join(root, file)
+            if file.endswith(".sqlite"):
+                conn = sqlite3.connect(full)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+        for file in files:
+            if file.endswith(("-wal", "-shm")):
+                continue
+            full = os.path.join(root, file)
+            sizes[os.path.relpath(full, path)] = os.path.getsize(full)
+    return sizes
+
+
+def measure(
+    search: Callable[[str], list[Document]],
+    queries: list[tuple[str, str]],
+    k: int,
+    warmup: int = 3,
+) -> dict[str, float]:
+    """
+    逐条执行查询, 统计延迟分位数与recall@k
+
+    :param search: 查询函数, 返回文档列表
+    :param queries: (查询文本, 相关文本块内容)
+    :param k: 召回率计算的top-k
+    :param warmup: 预热查询数, 不计入统计
+    """
+    for query, _ in queries[:warmup]:
+        search(query)
+
+    latencies, hits = [], 0
+    for query, relevant in queries:
+        start = time.perf_counter()
+        docs = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += any(doc.page_content == relevant for doc in docs[:k])
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    return {
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "mean_ms": float(np.mean(latencies)),
+        f"recall@{k}": hits / len(queries),
+    }
+
+
+def benchmark_faiss(
+    work_dir: str,
+    documents: list[Document],
+    queries: list[tuple[str, str]],
+    embed_model: Embeddings,
+    configs: list[dict],
+    k: int,
+) -> list[dict]:
+    """
+    按配置构建FaissDB并评估
+
+    :param work_dir: 工作目录, 每个配置的数据库位于其下
+    :param documents: 语料文本块
+    :param queries: (查询文本, 相关文本块内容)
+    :param embed_model: 嵌入模型
+    :param configs: FAISS配置
+    :param k: 返回的文档数
+    :return: 每个配置的评估结果
+    """
+    results = []
+    for config in configs:
+        params = dict(config)
+        name = params.pop("name")
+        search_mode = params.pop("search_mode", "vector")
+        db_path = os.path.join(work_dir, name)
+        shutil.rmtree(db_path, ignore_errors=True)
+
+        start = time.perf_counter()
+        db = FaissDB(
+            db_path,
+            embed_model,
+            documents=documents,
+            embed_limiter=TokenBucket(1e9),
+            train_size=len(documents),
+            **params,
+        )
+        build_time = time.perf_counter() - start
+        sizes = get_dir_size(db_path)
+
+        # 向量检索以排名评估, 不按相关度阈值截断
+        metrics = measure(
+            lambda query: db.search(
+                query, search_mode=search_mode, k=k, score_threshold=float("-inf")
+            ),
+            queries,
+            k,
+        )
+        results.append(
+            {
+                "name": name,
+                "search_mode": search_mode,
+                **params,
+                "build_s": build_time,
+                "index_bytes": sum(sizes.values()),
+                "files": sizes,
+                **metrics,
+            }
+        )
+        logging.info(f"FAISS基准: {results[-1]}")
+    return results
+
+
+def get_neo4j_db(
+    embed_model: Embeddings, bolt_url: str, mirror_path: str, search_mode: str
+) -> Neo4jDB:
+    """创建不访问大模型的Neo4jDB, 关键词抽取固定失败, 以原查询检索"""
+    return Neo4jDB(
+        FakeListChatModel(responses=["none"]),
+        embed_model,
+        bolt_url=bolt_url,
+        search_mode=search_mode,
+        mirror_path=mirror_path,
+        embed_limiter=TokenBucket(1e9),
+        embed_cache=EmbeddingCache(None, embed_model.model),
+    )
+
+
+def clear_neo4j_fixture(db: Neo4jDB) -> None:
+    """删除基准写入的节点, 不影响库中的其他数据"""
+    labels = " OR ".join(f"n:{label}" for label in NEO4J_LABELS)
+    db.graph.run(f"MATCH (n) WHERE {labels} DETACH DELETE n")
+
+
+def benchmark_neo4j(
+    work_dir: str,
+    documents: list[Document],
+    labels: list[dict],
+    queries: list[tuple[str, str]],
+    embed_model: Embeddings,
+    bolt_url: str,
+    k: int,
+) -> dict:
+    """
+    将语料写入图数据库(化学品节点 -> 各部分节点)并按各检索方式评估get_relevant_chunks.
+    全图扫描与向量镜像会读取库中全部节点, 应使用专用的空数据库.
+
+    :return: 构建结果与每种检索方式的评估结果, Neo4j不可达时返回跳过原因
+    """
+    try:
+        mirror_path = os.path.join(work_dir, "mirror")
+        db = get_neo4j_db(embed_model, bolt_url, mirror_path, "scan")
+        db.graph.run("RETURN 1")
+    except Exception as e:
+        logging.warning(f"Neo4j不可达，跳过图数据库基准: {e}")
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    clear_neo4j_fixture(db)
+    chemicals = {label["chemical"]: label["cas"] for label in labels}
+    nodes = [
+        {
+            "label": "BenchChemical",
+            "name": chemical,
+            "content": chemical,
+            "context": f"{chemical}，CAS号{cas}",
+        }
+        for chemical, cas in chemicals.items()
+    ] + [
+        {
+            "label": "BenchSection",
+            "name": f"{label['chemical']}·{label['section']}",
+            "content": doc.page_content,
+            "context": doc.page_content,
+        }
+        for doc, label in zip(documents, labels)
+    ]
+    edges = [
+        {
+            "start_node_name": label["chemical"],
+            "end_node_name": f"{label['chemical']}·{label['section']}",
+            "rel_type": label["section"],
+            "description": f"{label['chemical']}的{label['section']}",
+        }
+        for label in labels
+    ]
+
+    start = time.perf_counter()
+    db.create_nodes(nodes)
+    db.create_edges(edges)
+    db.create_vector_index()
+    result = {
+        "build_s": time.perf_counter() - start,
+        "nodes": len(nodes),
+        "edges": len(edges),
+        "modes": [],
+    }
+
+    try:
+        for search_mode in NEO4J_SEARCH_MODES:
+            db.search_mode = search_mode
+            metrics = measure(
+                lambda query: db.get_relevant_chunks(query, limit=k), queries, k
+            )
+            entry = {"search_mode": search_mode, **metrics}
+            if search_mode == "mirror":
+                entry["mirror_bytes"] = sum(get_dir_size(db.mirror_path).values())
+            result["modes"].append(entry)
+            logging.info(f"Neo4j基准: {entry}")
+    finally:
+        clear_neo4j_fixture(db)
+    return result
+
+
+def get_commit() -> Optional[str]:
+    """当前代码的提交号, 不在git仓库中时返回None"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    output: str,
+    num_chemicals: int = 50,
+    num_queries: int = 200,
+    k: int = 5,
+    dimensions: int = 256,
+    seed: int = 0,
+    faiss_configs: Optional[list[dict]] = None,
+    bolt_url: Optional[str] = hp.neo4j_bolt_url,
+    work_dir: Optional[str] = None,
+) -> dict:
+    """
+    运行离线基准并写入JSON结果
+
+    :param output: 结果文件路径
+    :param num_chemicals: 语料中的化学品数
+    :param num_queries: 查询数
+    :param k: 返回的文档数与召回率的top-k
+    :param dimensions: 哈希嵌入的维度
+    :param seed: 随机种子
+    :param faiss_configs: FAISS配置, 默认为FAISS_CONFIGS
+    :param bolt_url: Neo4j地址, None表示跳过图数据库基准
+    :param work_dir: 工作目录, 默认使用临时目录并在结束后删除
+    :return: 基准结果
+    """
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="msds-bench-")
+    embed_model = HashEmbeddings(dimensions)
+    try:
+        documents, labels = build_corpus(
+            os.path.join(work_dir, "corpus"), num_chemicals, seed
+        )
+        queries = build_queries(documents, labels, num_queries, seed)
+        report = {
+            "commit": get_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "corpus": {
+                "chemicals": num_chemicals,
+                "chunks": len(documents),
+                "queries": len(queries),
+                "k": k,
+                "dimensions": dimensions,
+                "seed": seed,
+            },
+            "faiss": benchmark_faiss(
+                work_dir,
+                documents,
+                queries,
+                embed_model,
+                faiss_configs or FAISS_CONFIGS,
+                k,
+            ),
+            "neo4j": (
+                benchmark_neo4j(
+                    work_dir, documents, labels, queries, embed_model, bolt_url, k
+                )
+                if bolt_url
+                else {"skipped": "未指定Neo4j地址"}
+            ),
+        }
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info(f"基准结果已写入 {output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线检索基准")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--num-chemicals", type=int, default=50)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--neo4j-url", default=hp.neo4j_bolt_url)
+    parser.add_argument("--skip-neo4j", action="store_true")
+    parser.add_argument("--work-dir", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_benchmark(
+        args.output,
+        num_chemicals=args.num_chemicals,
+        num_queries=args.num_queries,
+        k=args.k,
+        dimensions=args.dimensions,
+        seed=args.seed,
+        bolt_url=None if args.skip_neo4j else args.neo4j_url,
+        work_dir=args.work_dir,
+    )
@@ -1,3 +1,4 @@
+from .cached_embeddings import CachedEmbeddings
 from .gemini import GeminiClient
 from .ollama import OllamaClient
 from .siliconflow import SiliconflowClient
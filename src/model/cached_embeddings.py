@@ -0,0 +1,104 @@
+import unicodedata
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import hp
+from src.toolkits import EmbeddingCache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的嵌入模型
+
+    包装任意LangChain嵌入模型, 以 (模型名称, 规范化文本) 为键缓存向量, 内存中LRU淘汰,
+    可选SQLite持久化. 规范化只用于缓存键, 未命中时以原始文本调用模型.
+    查询向量与文档向量分别缓存, 兼容两者不同的模型.
+    """
+
+    def __init__(
+        self,
+        embed_model: Embeddings,
+        cache_path: str | None = hp.embedding_cache_path,
+        max_size: int = hp.embedding_cache_size,
+    ) -> None:
+        """
+        :param embed_model: 被包装的嵌入模型
+        :param cache_path: SQLite缓存文件路径, None表示仅使用内存缓存
+        :param max_size: 内存中最多保留的向量数
+        """
+        self.embed_model: Embeddings = embed_model
+        # 与Neo4jDB的嵌入缓存使用相同的命名空间, 文档向量可互相复用
+        self.model: str = getattr(embed_model, "model", type(embed_model).__name__)
+        self.document_cache = EmbeddingCache(cache_path, self.model, max_size)
+        self.query_cache = EmbeddingCache(cache_path, f"{self.model}/query", max_size)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化缓存键: 全角转半角并合并空白"""
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def lookup(
+        self, cache: EmbeddingCache, texts: list[str]
+    ) -> tuple[list[list[float] | None], dict[str, str]]:
+        """
+        查询缓存
+
+        :return: 与输入顺序一致的向量(未命中为None), 未命中的缓存键 -> 首次出现的原始文本
+        """
+        keys = [self.normalize(text) for text in texts]
+        cached = cache.get_many(keys)
+        missing: dict[str, str] = {}
+        for key, text, embed in zip(keys, texts, cached):
+            if embed is None:
+                missing.setdefault(key, text)
+        return cached, missing
+
+    def fill(
+        self,
+        cache: EmbeddingCache,
+        texts: list[str],
+        cached: list[list[float] | None],
+        missing: dict[str, str],
+        embeds: list[list[float]],
+    ) -> list[list[float]]:
+        """写入新嵌入的向量并按输入顺序返回全部向量"""
+        if missing:
+            cache.put_many(list(missing), embeds)
+        found = dict(zip(missing, embeds))
+        return [
+            embed if embed is not None else found[self.normalize(text)]
+            for text, embed in zip(texts, cached)
+        ]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached, missing = self.lookup(self.document_cache, texts)
+        embeds = (
+            self.embed_model.embed_documents(list(missing.values())) if missing else []
+        )
+        return self.fill(self.document_cache, texts, cached, missing, embeds)
+
+    def embed_query(self, text: str) -> list[float]:
+        cached, missing = self.lookup(self.query_cache, [text])
+        embeds = [self.embed_model.embed_query(text)] if missing else []
+        return self.fill(self.query_cache, [text], cached, missing, embeds)[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        cached, missing = self.lookup(self.document_cache, texts)
+        embeds = (
+            await self.embed_model.aembed_documents(list(missing.values()))
+            if missing
+            else []
+        )
+        return self.fill(self.document_cache, texts, cached, missing, embeds)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        cached, missing = self.lookup(self.query_cache, [text])
+        embeds = [await self.embed_model.aembed_query(text)] if missing else []
+        return self.fill(self.query_cache, [text], cached, missing, embeds)[0]
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """查询与文档缓存的命中统计"""
+        return {
+            "query": self.query_cache.get_stats(),
+            "document": self.document_cache.get_stats(),
+        }
@@ -1,2 +1,10 @@
 from .file_checker import FileChecker
-from .pdf_parser import MsdsParser
+from .pdf_parser import (
+    CAS_PATTERN,
+    MSDS_SECTIONS,
+    PARSER_VERSION,
+    MsdsParser,
+    MsdsSectionSplitter,
+)
+from .field_extractor import MsdsFieldExtractor
+from .text_cache import ParsedTextCache
@@ -0,0 +1,156 @@
+import re
+
+from langchain.schema import Document
+
+from src.parser.pdf_parser import CAS_PATTERN, SECTION_PATTERN, SUBSECTION_PATTERN
+
+# ChemInfoModel字段 -> (所在部分, 标签). 标签前不能紧跟汉字(避免 "密度" 匹配 "相对密度"),
+# 标签后允许单位、括注等不超过12个字符, 再接冒号
+FIELD_RULES: dict[str, tuple[tuple[str, ...], str]] = {
+    "chemName": (("化学品及企业标识",), r"化学品中文名称?|中文名称?"),
+    "chemEnglishName": (("化学品及企业标识",), r"化学品英文名称?|英文名称?"),
+    "chemCas": (("化学品及企业标识", "成分/组成信息"), r"CAS\s*(?:号|编号|No\.?)?"),
+    "chemAlias": (("化学品及企业标识", "成分/组成信息"), r"中文别名|别名|俗名"),
+    "ph": (("理化特性",), r"[pP][hH]值?"),
+    "meltPoint": (("理化特性",), r"熔点"),
+    "boilPoint": (("理化特性",), r"初?沸点"),
+    "relativeDensity": (("理化特性",), r"相对密度"),
+    "relativeVaporDensity": (("理化特性",), r"相对蒸气密度"),
+    "vaporPressure": (("理化特性",), r"饱和蒸气压|蒸气压"),
+    "combustionHeat": (("理化特性",), r"燃烧热"),
+    "limitTemp": (("理化特性",), r"临界温度"),
+    "limitPress": (("理化特性",), r"临界压力"),
+    "octMatModulus": (("理化特性",), r"正?辛醇[/／-]?水分配系数"),
+    "flashPoint": (("理化特性", "消防措施"), r"闪点"),
+    "autoIgnitionTemp": (("理化特性", "消防措施"), r"自燃温度|引燃温度"),
+    "exploLowerLimit": (("理化特性", "消防措施"), r"爆炸下限"),
+    "exploUpperLimit": (("理化特性", "消防措施"), r"爆炸上限"),
+    "breakdownTemp": (("理化特性", "稳定性和反应性"), r"分解温度"),
+    "viscosity": (("理化特性",), r"运动粘度|粘度|黏度"),
+    "solubilty": (("理化特性",), r"溶解性|溶解度"),
+    "density": (("理化特性",), r"密度"),
+    "specialDanger": (("危险性概述", "消防措施"), r"燃爆危险|燃烧与爆炸危险性|特别危险性"),
+    "physcialChemDanger": (("稳定性和反应性",), r"危险反应|活性反应"),
+    "healthHazard": (("危险性概述", "毒理学信息"), r"健康危害|中毒表现"),
+    "careerContactLimit": (("接触控制和个体防护",), r"职业接触限值"),
+    "environmentHazard": (("危险性概述", "生态学信息"), r"环境危害"),
+    "firstMeasure": (("急救措施",), r"急救措施"),
+    "leakageMeasure": (("泄漏应急处理",), r"应急处理|泄漏应急措施"),
+    "adviceProjectExtinguish": (("消防措施",), r"灭火方法"),
+    "avoidMater": (("稳定性和反应性",), r"禁配物|避免接触的物质|不相容物质?"),
+    "acuteToxicity": (("毒理学信息",), r"急性毒性"),
+    "riskCategory": (("危险性概述", "化学品及企业标识"), r"GHS危险性类别|危险性类别"),
+    "riskDesc": (("危险性概述",), r"危险性说明"),
+    "warnWord": (("危险性概述",), r"警示词|信号词"),
+    "pictograms": (("危险性概述",), r"象形图"),
+    "apperanceShape": (("理化特性",), r"外观与性状|外观"),
+}
+LABEL_PATTERN = re.compile(
+    "|".join(
+        rf"(?P<{field}>(?<![\u4e00-\u9fa5])(?:{label})[^:：\n]{{0,12}}[:：])"
+        for field, (_, label) in FIELD_RULES.items()
+    )
+)
+# 没有对应标签时取整个部分作为取值的字段
+SECTION_FIELDS = {
+    "firstMeasure": "急救措施",
+    "leakageMeasure": "泄漏应急处理",
+    "adviceProjectExtinguish": "消防措施",
+}
+# 只给出 "爆炸极限: 1.2%~7.1%" 时拆分为上下限
+EXPLOSION_LIMITS_PATTERN = re.compile(
+    r"爆炸极限[^:：\n]{0,12}[:：]\s*([\d.]+\s*%?)\s*[~～\-—至]+\s*([\d.]+\s*%?)"
+)
+
+
+class MsdsFieldExtractor:
+    """
+    以确定性规则从按部分切分的说明书中抽取ChemInfoModel的字段
+
+    每个字段只在其所在的部分中查找 "标签: 取值" 形式的文本, 取值截止到下一个已知标签或
+    小节标题; 急救措施等没有标签的字段取整个部分. 找不到的字段为空字符串.
+    """
+
+    @staticmethod
+    def normalize(value: str) -> str:
+        """合并空白, 去掉首尾的标点"""
+        return " ".join(value.split()).strip(" ;；,，。")
+
+    @staticmethod
+    def strip_heading(text: str) -> str:
+        """去掉部分的标题行"""
+        match = SECTION_PATTERN.match(text)
+        return text[match.end() :] if match else text
+
+    def get_section_texts(self, docs: list[Document]) -> dict[str, str]:
+        """按部分合并文本块, 没有部分标注的文本块归入空字符串"""
+        texts: dict[str, list[str]] = {}
+        for doc in docs:
+            texts.setdefault(doc.metadata.get("section", ""), []).append(
+                doc.page_content
+            )
+        return {section: "\n".join(chunks) for section, chunks in texts.items()}
+
+    def find_labels(self, text: str) -> dict[str, str]:
+        """
+        查找文本中全部字段标签的取值, 同一字段出现多次时取第一次
+
+        :param text: 一个部分的文本
+        :return: 字段 -> 取值
+        """
+        labels = list(LABEL_PATTERN.finditer(text))
+        bounds = sorted(
+            {match.start() for match in labels}
+            | {match.start() for match in SUBSECTION_PATTERN.finditer(text)}
+            | {len(text)}
+        )
+        values: dict[str, str] = {}
+        for match in labels:
+            end = next(bound for bound in bounds if bound > match.start())
+            end = max(end, match.end())
+            value = self.normalize(text[match.end() : end])
+            if value and match.lastgroup not in values:
+                values[match.lastgroup] = value
+        return values
+
+    def extract(self, docs: list[Document]) -> dict[str, str]:
+        """
+        抽取一个说明书的字段
+
+        :param docs: 同一文件按部分切分的文本块, 元数据包含chemical、cas、section
+        :return: ChemInfoModel字段 -> 取值
+        """
+        sections = self.get_section_texts(docs)
+        found = {section: self.find_labels(text) for section, text in sections.items()}
+        # 没有部分标注(无法识别部分标题)时在全文中查找
+        unsectioned = found.get("", {})
+
+        fields: dict[str, str] = {}
+        for field, (field_sections, _) in FIELD_RULES.items():
+            value = next(
+                (
+                    found[section][field]
+                    for section in field_sections
+                    if field in found.get(section, {})
+                ),
+                unsectioned.get(field, ""),
+            )
+            if not value and field in SECTION_FIELDS:
+                value = self.normalize(
+                    self.strip_heading(sections.get(SECTION_FIELDS[field], ""))
+                )
+            fields[field] = value
+
+        if not (fields["exploLowerLimit"] or fields["exploUpperLimit"]):
+            text = "\n".join(sections.values())
+            match = EXPLOSION_LIMITS_PATTERN.search(text)
+            if match:
+                fields["exploLowerLimit"] = self.normalize(match.group(1))
+                fields["exploUpperLimit"] = self.normalize(match.group(2))
+
+        # 文件名与全文首个CAS号比标签更可靠
+        metadata = docs[0].metadata if docs else {}
+        fields["chemName"] = metadata.get("chemical") or fields["chemName"]
+        cas = CAS_PATTERN.search(fields["chemCas"])
+        fields["chemCas"] = metadata.get("cas") or (cas.group() if cas else "")
+        return fields
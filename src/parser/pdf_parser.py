@@ -1,12 +1,166 @@
+import bisect
 import itertools
 import os
+import re
+from importlib.metadata import version
+from typing import Iterator
 
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
+from tqdm import tqdm
 
 from src.config import hp
-from src.toolkits import parallel_map
+from src.parser.text_cache import ParsedTextCache
+from src.toolkits import get_file_hash, pipelined_map, process_map
+
+# 逐页文本的提取逻辑变化时递增, 与PDF库的版本一起作为缓存键的一部分
+PARSER_VERSION = f"1/pypdf-{version('pypdf')}"
+
+# CAS号, 汉字属于\w, 边界不能用\b
+CAS_PATTERN = re.compile(r"(?<![\d-])\d{2,7}-\d{2}-\d(?![\d-])")
+
+# GB/T 16483 规定的16个部分, 标题写法不统一, 以宽松的模式匹配
+MSDS_SECTIONS = {
+    "化学品及企业标识": r"化学品(?:及|和)企业标识",
+    "危险性概述": r"危险性概述",
+    "成分/组成信息": r"成分[/／]?组成信息",
+    "急救措施": r"急救措施",
+    "消防措施": r"消防措施",
+    "泄漏应急处理": r"泄漏应急处理",
+    "操作处置与储存": r"操作处置(?:与|和)储存",
+    "接触控制和个体防护": r"接触控制(?:和|/|／)?个体防护",
+    "理化特性": r"理化特性",
+    "稳定性和反应性": r"稳定性(?:和|与)反应性",
+    "毒理学信息": r"毒理学信息",
+    "生态学信息": r"生态学信息",
+    "废弃处置": r"废弃处置",
+    "运输信息": r"运输信息",
+    "法规信息": r"法规信息",
+    "其他信息": r"其他信息",
+}
+SECTION_PATTERN = re.compile(
+    r"^\s*(?:第\s*[一二三四五六七八九十]+\s*部分|\d{1,2})?\s*[.、．:：]?\s*"
+    f"(?:{'|'.join(f'({pattern})' for pattern in MSDS_SECTIONS.values())})"
+    # 排除正文中 "急救措施: 见第四部分" 之类的字段
+    r"(?!\s*[:：])",
+    re.MULTILINE,
+)
+# 部分内的小节标题, 如 "皮肤接触：", "【灭火方法】:", "闪点(℃)："
+SUBSECTION_PATTERN = re.compile(
+    r"^\s*[【\[]?([\u4e00-\u9fa5][\u4e00-\u9fa5A-Za-z0-9/／()（）℃%、]{1,15})"
+    r"[】\]]?\s*[:：]",
+    re.MULTILINE,
+)
+
+
+class MsdsSectionSplitter:
+    """
+    按GB/T 16483的16个部分切分化学品安全技术说明书
+
+    每个部分输出一个文本块, 超过max_section_size的部分按小节标题合并为不超过上限的
+    文本块, 单个小节仍过长时再按字符切分. 部分与小节名称记录在元数据中, 不加入正文.
+    找不到部分标题的文件按字符切分.
+    """
+
+    def __init__(self, max_section_size: int = hp.max_section_size) -> None:
+        """
+        :param max_section_size: 文本块的最大字符数
+        """
+        self.max_section_size: int = max_section_size
+        self.fallback_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=max_section_size
+        )
+
+    @staticmethod
+    def find_sections(text: str) -> list[tuple[int, str]]:
+        """
+        查找部分标题的位置. 部分按标准顺序出现, 只接受序号大于前一部分的标题,
+        以忽略正文中引用其他部分的行(如 "急救措施: 见第四部分")
+
+        :param text: 整个文件的文本
+        :return: [(标题起始位置, 部分名称), ...]
+        """
+        sections = list(MSDS_SECTIONS)
+        found, last = [], -1
+        for match in SECTION_PATTERN.finditer(text):
+            idx = match.lastindex - 1
+            if idx > last:
+                # 模式开头的空白可能跨过换行, 以标题的首个字符为起始位置
+                start = match.end() - len(match.group().lstrip())
+                found.append((start, sections[idx]))
+                last = idx
+        return found
+
+    def split_section(self, text: str) -> list[tuple[str, str]]:
+        """
+        将过长的部分按小节合并为不超过上限的文本块
+
+        :param text: 一个部分的文本
+        :return: [(小节名称, 文本), ...], 小节名称取文本块中第一个小节
+        """
+        if len(text) <= self.max_section_size:
+            return [("", text)]
+
+        # 第一个小节标题之前的内容(部分标题等)并入第一个小节
+        matches = list(SUBSECTION_PATTERN.finditer(text))
+        bounds = [0] + [match.start() for match in matches[1:]] + [len(text)]
+        names = [match.group(1) for match in matches] or [""]
+
+        chunks: list[tuple[str, str]] = []
+        for name, start, end in zip(names, bounds, bounds[1:]):
+            piece = text[start:end]
+            if len(piece) > self.max_section_size:
+                parts = self.fallback_splitter.split_text(piece)
+                # 单独成块的部分标题行并入下一个文本块
+                if len(parts) > 1 and len(parts[0]) < self.max_section_size // 10:
+                    parts[:2] = [f"{parts[0]}\n{parts[1]}"]
+                chunks += [(name, part) for part in parts]
+            elif chunks and len(chunks[-1][1]) + len(piece) <= self.max_section_size:
+                chunks[-1] = (chunks[-1][0] or name, chunks[-1][1] + piece)
+            else:
+                chunks.append((name, piece))
+        return chunks
+
+    def split_documents(self, pages: list[Document]) -> list[Document]:
+        """
+        切分一个文件的逐页文档
+
+        :param pages: 加载器输出的逐页文档, 属于同一文件
+        :return: 文本块, 元数据包含来源、起始页码、部分与小节名称
+        """
+        if not pages:
+            return []
+        offsets, text = [], ""
+        for page in pages:
+            offsets.append(len(text))
+            text += page.page_content + "\n"
+
+        sections = self.find_sections(text)
+        if not sections:
+            return self.fallback_splitter.split_documents(pages)
+        # 第一个部分标题之前的内容(说明书标题、编号等)并入第一个部分
+        bounds = [0] + [start for start, _ in sections[1:]] + [len(text)]
+
+        docs = []
+        for (_, section), start, end in zip(sections, bounds, bounds[1:]):
+            # 字符切分的文本块之间有重叠, 起始位置只用于估计页码
+            offset = start
+            for subsection, chunk in self.split_section(text[start:end]):
+                lead = len(chunk) - len(chunk.lstrip())
+                page = pages[bisect.bisect_right(offsets, offset + lead) - 1]
+                offset += len(chunk)
+                if not chunk.strip():
+                    continue
+                metadata = {
+                    "source": page.metadata.get("source"),
+                    "page": page.metadata.get("page"),
+                    "section": section,
+                }
+                if subsection:
+                    metadata["subsection"] = subsection
+                docs.append(Document(page_content=chunk.strip(), metadata=metadata))
+        return docs
 
 
 # class PdfParser:
@@ -25,10 +179,56 @@ from src.toolkits import parallel_map
 #         return documents
 
 
+# 进程池中每个子进程的解析器, 由init_worker_parser创建
+worker_parser: "MsdsParser | None" = None
+
+
+def init_worker_parser(cache_path: str | None, split_mode: str) -> None:
+    """进程池初始化函数: 每个子进程只创建一个解析器, 各文件复用同一个缓存连接与切分器"""
+    global worker_parser
+    worker_parser = MsdsParser(
+        [], mode="thread", cache_path=cache_path, split_mode=split_mode
+    )
+
+
+def parse_file(file: str) -> list[Document]:
+    """解析并标注单个文件, 模块级函数, 在以init_worker_parser初始化的子进程中执行"""
+    return worker_parser.load_and_format(file)
+
+
 class MsdsParser:
-    def __init__(self, files: list[str] | str):
+    def __init__(
+        self,
+        files: list[str] | str,
+        mode: str = hp.parse_mode,
+        max_workers: int | None = hp.parse_workers,
+        cache_path: str | None = hp.parsed_text_cache_path,
+        split_mode: str = hp.split_mode,
+    ):
+        """
+        :param files: PDF文件
+        :param mode: thread(线程池) | process(进程池)
+        :param max_workers: 最大线程数或进程数, 默认线程池10个线程, 进程池每核一个进程
+        :param cache_path: 逐页文本缓存路径, None表示不缓存
+        :param split_mode: section(按说明书部分切分) | recursive(按max_chunk_size切分)
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"不支持的解析方式: {mode}")
+        if split_mode not in ("section", "recursive"):
+            raise ValueError(f"不支持的切分方式: {split_mode}")
         self.files: list[str] = files if isinstance(files, list) else [files]
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=hp.max_chunk_size)  # fmt: skip
+        self.mode: str = mode
+        self.max_workers: int | None = max_workers
+        self.cache_path: str | None = cache_path
+        self.text_cache: ParsedTextCache | None = (
+            ParsedTextCache(cache_path, PARSER_VERSION) if cache_path else None
+        )
+        self.split_mode: str = split_mode
+        self.text_splitter = (
+            MsdsSectionSplitter()
+            if split_mode == "section"
+            else RecursiveCharacterTextSplitter(chunk_size=hp.max_chunk_size)
+        )
         self.loader = PyPDFLoader
 
     def format_context(self, context: Document) -> Document:
@@ -37,20 +237,99 @@ class MsdsParser:
         context.page_content = f"<{file_name}>\n: {context.page_content}"
         return context
 
-    def invoke(self) -> list[Document]:
+    @staticmethod
+    def get_sections(text: str) -> list[str]:
+        """按出现顺序返回文本中的部分标题"""
+        sections = list(MSDS_SECTIONS)
+        return [
+            sections[match.lastindex - 1] for match in SECTION_PATTERN.finditer(text)
+        ]
+
+    def tag_documents(self, file: str, docs: list[Document]) -> list[Document]:
+        """
+        为文本块标注化学品名称(文件名)、CAS号(全文首个)与所属部分, 用于检索时预过滤
+
+        :param file: 源文件
+        :param docs: 按顺序切分得到的文本块
+        """
+        chemical = os.path.splitext(os.path.basename(file))[0]
+        cas = ""
+        for doc in docs:
+            match = CAS_PATTERN.search(doc.page_content)
+            if match:
+                cas = match.group()
+                break
 
-        def load_and_format(file) -> list[Document]:
-            docs = self.loader(file).load_and_split(self.text_splitter)
-            return [self.format_context(doc) for doc in docs]
+        section = ""
+        for doc in docs:
+            doc.metadata.update(chemical=chemical, cas=cas)
+            # 按部分切分时切分器已标注所属部分
+            if "section" in doc.metadata:
+                continue
+            sections = self.get_sections(doc.page_content)
+            doc.metadata["section"] = sections[0] if sections else section
+            section = sections[-1] if sections else section
+        return docs
 
+    def load_pages(self, file: str) -> list[Document]:
+        """
+        加载逐页文本, 文件内容与解析器版本不变时直接读取缓存, 跳过PDF解码
+
+        :param file: PDF文件
+        """
+        if self.text_cache is None:
+            return self.loader(file).load()
+
+        file_hash = get_file_hash(file)
+        pages = self.text_cache.get(file_hash)
+        if pages is None:
+            pages = self.loader(file).load()
+            self.text_cache.put(file_hash, pages)
+        # 相同内容的文件可能位于不同路径, 来源以当前路径为准
+        for page in pages:
+            page.metadata["source"] = file
+        return pages
+
+    def load_and_format(self, file: str) -> list[Document]:
+        docs = self.text_splitter.split_documents(self.load_pages(file))
+        docs = self.tag_documents(file, docs)
+        # 按部分切分时化学品名称只记录在元数据中, 不占用嵌入的文本
+        if self.split_mode == "section":
+            return docs
+        return [self.format_context(doc) for doc in docs]
+
+    def map_files(self) -> Iterator[list[Document]]:
+        """
+        按文件顺序产出每个文件切分后的文档. 进程池模式下文件按parse_chunk_size分组提交,
+        只有一个文件时直接在当前进程中解析, 省去启动子进程的开销
+        """
+        if self.mode == "process" and len(self.files) > 1:
+            return process_map(
+                parse_file,
+                self.files,
+                max_workers=self.max_workers,
+                chunk_size=hp.parse_chunk_size,
+                initializer=init_worker_parser,
+                initargs=(self.cache_path, self.split_mode),
+            )
+        return pipelined_map(
+            self.load_and_format, self.files, max_workers=self.max_workers or 10
+        )
+
+    def invoke(self) -> list[Document]:
         documents = list(
             itertools.chain.from_iterable(
-                parallel_map(
-                    load_and_format,
-                    self.files,
-                    max_workers=10,
-                    enable_tqdm=True,
+                tqdm(
+                    self.map_files(),
+                    total=len(self.files),
+                    desc="Loading",
+                    colour="green",
                 )
             )
         )
         return documents
+
+    def iter_documents(self) -> Iterator[Document]:
+        """按文件顺序流式产出切分后的文档, 不在内存中保留整个语料"""
+        for docs in self.map_files():
+            yield from docs
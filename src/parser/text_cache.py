@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+from langchain.schema import Document
+
+
+class ParsedTextCache:
+    """
+    PDF逐页文本缓存
+
+    以 (文件内容sha256, 解析器版本) 为键, 将PDF加载器输出的逐页文本与元数据以zlib压缩的JSON
+    保存在SQLite中. 文件内容不变时跳过PDF解码, 只需按当前的切分参数重新切分.
+    """
+
+    def __init__(self, cache_path: str, version: str) -> None:
+        """
+        :param cache_path: SQLite缓存文件路径
+        :param version: 解析器版本, 提取逻辑或依赖版本变化时旧缓存自动失效
+        """
+        self.cache_path: str = cache_path
+        self.version: str = version
+        self.connect()
+
+    def connect(self) -> None:
+        """初始化SQLite连接"""
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self.conn = sqlite3.connect(
+            self.cache_path, check_same_thread=False, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(file_hash TEXT, version TEXT, data BLOB, "
+            "PRIMARY KEY (file_hash, version))"
+        )
+        self.conn.commit()
+
+    def __getstate__(self) -> dict:
+        """跨进程传递时只传递配置, 在子进程中重新连接"""
+        return {"cache_path": self.cache_path, "version": self.version}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.connect()
+
+    def get(self, file_hash: str) -> list[Document] | None:
+        """
+        查询文件的逐页文本
+
+        :param file_hash: 文件内容哈希
+        :return: 逐页文档, 未命中时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM pages WHERE file_hash = ? AND version = ?",
+                (file_hash, self.version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        pages = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        return [
+            Document(page_content=page["page_content"], metadata=page["metadata"])
+            for page in pages
+        ]
+
+    def put(self, file_hash: str, pages: list[Document]) -> None:
+        """
+        写入文件的逐页文本
+
+        :param file_hash: 文件内容哈希
+        :param pages: 加载器输出的逐页文档
+        """
+        data = json.dumps(
+            [
+                {"page_content": page.page_content, "metadata": page.metadata}
+                for page in pages
+            ],
+            ensure_ascii=False,
+            default=str,
+        )
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (file_hash, version, data) "
+                "VALUES (?, ?, ?)",
+                (file_hash, self.version, zlib.compress(data.encode("utf-8"))),
+            )
+            self.conn.commit()
+
+    def prune(self) -> int:
+        """删除其他解析器版本的缓存, 返回删除的条目数"""
+        with self.lock:
+            deleted = self.conn.execute(
+                "DELETE FROM pages WHERE version != ?", (self.version,)
+            ).rowcount
+            self.conn.commit()
+        return deleted
+
+    def get_stats(self) -> dict[str, float]:
+        """缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
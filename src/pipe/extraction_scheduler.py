@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from tqdm import tqdm
+
+from src.config import hp
+from src.toolkits import TokenBucket
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """判断异常是否由服务商限流(HTTP 429)引起"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message
+
+
+class ExtractionScheduler:
+    """
+    实体抽取调度器
+
+    1. 信号量限制同时处理的文本块数
+    2. 按服务商的每分钟请求数与每分钟token数对每次模型调用限流
+    3. 遇到429时指数退避重试
+    4. 实时显示吞吐
+    """
+
+    def __init__(
+        self,
+        provider: str = "siliconflow",
+        max_concurrency: int | None = None,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        max_retry: int = hp.extraction_max_retry,
+        backoff: float = hp.extraction_backoff,
+    ) -> None:
+        """
+        :param provider: 服务商名称, 用于从hp中读取默认限额, 如siliconflow, gemini, ollama
+        :param max_concurrency: 最大并发处理的文本块数
+        :param rpm: 每分钟请求数
+        :param tpm: 每分钟token数
+        :param max_retry: 429重试次数
+        :param backoff: 退避基数(秒)
+        """
+        self.provider: str = provider
+        self.max_concurrency: int = max_concurrency or getattr(
+            hp, f"{provider}_concurrency"
+        )
+        self.rpm: int = rpm or getattr(hp, f"{provider}_rpm")
+        self.tpm: int = tpm or getattr(hp, f"{provider}_tpm")
+        self.max_retry: int = max_retry
+        self.backoff: float = backoff
+
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.request_bucket = TokenBucket(self.rpm / 60, max(1.0, self.rpm / 60))
+        self.token_bucket = TokenBucket(self.tpm / 60, max(1.0, self.tpm / 60))
+
+        self.requests: int = 0
+        self.tokens: int = 0
+        self.failures: int = 0
+
+    @staticmethod
+    def estimate_tokens(messages: list[BaseMessage]) -> int:
+        """粗略估计消息的token数, 中文文本大致按每字一个token计"""
+        return sum(len(str(message.content)) for message in messages)
+
+    async def ainvoke(
+        self, chat_model: BaseChatModel, messages: list[BaseMessage]
+    ) -> BaseMessage:
+        """
+        在限额内调用模型, 遇到429时指数退避重试
+
+        :param chat_model: 聊天模型
+        :param messages: 消息列表
+        :return: 模型回复
+        """
+        tokens = self.estimate_tokens(messages)
+        for attempt in range(self.max_retry + 1):
+            await self.request_bucket.aacquire()
+            await self.token_bucket.aacquire(tokens)
+            self.requests += 1
+            self.tokens += tokens
+            try:
+                return await chat_model.ainvoke(messages)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retry:
+                    raise
+                delay = self.backoff * 2**attempt + random.uniform(0, self.backoff)
+                logging.warning(f"{self.provider} 触发限流，{delay:.1f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def map(
+        self, func: Callable[[T], Awaitable[R]], items: Iterable[T]
+    ) -> AsyncIterator[R]:
+        """
+        以有界并发对流式输入执行异步函数, 按完成顺序产出结果
+
+        输入在线程中逐个拉取, 不会一次性读入内存; 单个输入处理失败时记录日志并跳过.
+
+        :param func: 异步处理函数
+        :param items: 输入, 可以是生成器
+        :return: 处理结果的异步迭代器
+        """
+
+        async def run(item: T) -> R:
+            async with self.semaphore:
+                return await func(item)
+
+        iterator = iter(items)
+        sentinel = object()
+        exhausted = False
+        pending: set[asyncio.Task] = set()
+
+        progress = tqdm(desc="Extracting", unit="chunk", colour="green")
+        start = time.perf_counter()
+
+        async def fill() -> None:
+            nonlocal exhausted
+            while not exhausted and len(pending) < self.max_concurrency * 2:
+                item = await asyncio.to_thread(next, iterator, sentinel)
+                if item is sentinel:
+                    exhausted = True
+                else:
+                    pending.add(asyncio.create_task(run(item)))
+
+        try:
+            await fill()
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pending.discard(task)
+                    progress.update(1)
+                    minutes = max(time.perf_counter() - start, 1e-6) / 60
+                    progress.set_postfix(
+                        rpm=f"{self.requests / minutes:.0f}",
+                        tpm=f"{self.tokens / minutes:.0f}",
+                        failed=self.failures,
+                    )
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.failures += 1
+                        logging.error(f"文本块处理失败: {e}")
+                        continue
+                    yield result
+                await fill()
+        finally:
+            for task in pending:
+                task.cancel()
+            progress.close()
@@ -1,16 +1,20 @@
 import asyncio
 import html
 import itertools
+import logging
 import re
 from collections import defaultdict
+from typing import Iterable, Iterator
 
 from langchain.schema import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
 
-from src.db import Neo4jDB
+from src.config import hp
+from src.db import ExtractionStore, Neo4jDB
 from src.memory import ChatMessages
 from src.parser import MsdsParser
+from src.pipe.extraction_scheduler import ExtractionScheduler
 from src.prompt import Prompt
 
 
@@ -74,13 +78,31 @@ class Msds2GraphDB:
         files: list[str] | str,
         chat_model: BaseChatModel,
         graph: Neo4jDB,
+        provider: str = "siliconflow",
+        max_chunks: int | None = None,
+        store_path: str = hp.extraction_store_path,
     ) -> None:
+        """
+        :param files: MSDS文件
+        :param chat_model: 用于实体抽取的聊天模型
+        :param graph: 图数据库
+        :param provider: 聊天模型的服务商, 决定抽取时的并发与限额
+        :param max_chunks: 最多处理的文本块数, None表示处理全部
+        :param store_path: 抽取结果存储路径
+        """
         self.files: list[str] = files if isinstance(files, list) else [files]
         self.parser = MsdsParser
 
         self.chat_model = chat_model
-        self.documents = self.get_documents()
         self.graph: Neo4jDB = graph
+        self.scheduler = ExtractionScheduler(provider=provider)
+        self.max_chunks: int | None = max_chunks
+        self.store = ExtractionStore(
+            store_path,
+            prompt_version=Prompt.get_extraction_prompt_version(),
+            model_name=getattr(chat_model, "model_name", None)
+            or getattr(chat_model, "model", type(chat_model).__name__),
+        )
 
         self.continue_prompt = self._get_continue_prompt()
         self.if_loop_prompt = self._get_if_loop_prompt()
@@ -92,6 +114,19 @@ class Msds2GraphDB:
         documents = self.parser(self.files).invoke()
         return documents
 
+    def iter_contents(self) -> Iterator[str]:
+        """从解析器流式读取文本块"""
+        parser = self.parser(self.files)
+        for doc in itertools.islice(parser.iter_documents(), self.max_chunks):
+            # 按部分切分的文本块正文中没有化学品名称, 抽取实体时放在正文前
+            if parser.split_mode == "section":
+                yield (
+                    f"<{doc.metadata['chemical']}> {doc.metadata['section']}\n"
+                    f"{doc.page_content}"
+                )
+            else:
+                yield doc.page_content
+
     def _get_hint_prompt(self, input_text: str) -> str:
         prompt = Prompt.get_prompt("entity_extraction").format(
             tuple_delimiter=Prompt.get_default_tuple_delimiter(),
@@ -116,13 +151,17 @@ class Msds2GraphDB:
         hint_prompt = self._get_hint_prompt(context)
         memory_view.add_user_message(hint_prompt)
 
-        result = await chat_model.ainvoke(memory_view.get_messages())
+        result = await self.scheduler.ainvoke(
+            self.chat_model, memory_view.get_messages()
+        )
         memory_view.add_ai_message(result)
 
         for idx in range(hp.max_retry):
             memory_view.add_user_message(self.continue_prompt)
 
-            glean_result = await chat_model.ainvoke(memory_view.get_messages())
+            glean_result = await self.scheduler.ainvoke(
+                self.chat_model, memory_view.get_messages()
+            )
             memory_view.add_ai_message(glean_result)
 
             if idx == hp.max_retry - 1:
@@ -130,9 +169,13 @@ class Msds2GraphDB:
 
             memory_view.add_user_message(self.if_loop_prompt)
 
-            if_loop_result = await chat_model.ainvoke(memory_view)
+            if_loop_result = await self.scheduler.ainvoke(
+                self.chat_model, memory_view.get_messages()
+            )
 
-            if_loop_result: bool = if_loop_result.strip().strip('"').strip("'").lower()
+            if_loop_result = (
+                str(if_loop_result.content).strip().strip('"').strip("'").lower()
+            )
             if if_loop_result != "yes":
                 break
 
@@ -169,12 +212,16 @@ class Msds2GraphDB:
 
         return dict(maybe_nodes), dict(maybe_edges)
 
-    async def invoke(self):
-        contents = [doc.page_content for doc in self.documents][:10]
+    async def extract(self, content: str) -> tuple[dict, dict]:
+        """优先复用已保存的抽取结果, 否则调用模型解析并保存"""
+        result = self.store.get(content)
+        if result is None:
+            result = await self.parse_single_document(content)
+            self.store.put(content, *result)
+        return result
 
-        results = await asyncio.gather(
-            *[self.parse_single_document(c) for c in contents]
-        )
+    def write_results(self, results: Iterable[tuple[dict, dict]]) -> None:
+        """合并各文本块的抽取结果并批量写入图数据库"""
         maybe_nodes = defaultdict(list)
         maybe_edges = defaultdict(list)
         for m_nodes, m_edges in results:
@@ -185,25 +232,51 @@ class Msds2GraphDB:
 
         maybe_nodes = list(itertools.chain.from_iterable(maybe_nodes.values()))
         maybe_edges = list(itertools.chain.from_iterable(maybe_edges.values()))
-
+        # 节点名称只在节点类别内唯一, 边的端点按首次抽取到的类别匹配
+        node_labels = {}
         for node in maybe_nodes:
-            self.graph.create_node(
-                label=node["entity_type"],
-                name=node["entity_label"],
-                content=node["context"],
-                context=node["context"],
-            )
+            node_labels.setdefault(node["entity_label"], node["entity_type"])
 
-        for edge in maybe_edges:
-            self.graph.create_edge(
-                start_node_name=edge["start_node_name"],
-                end_node_name=edge["end_node_name"],
-                rel_type=edge["keywords"],
-            )
+        self.graph.create_nodes(
+            [
+                dict(
+                    label=node["entity_type"],
+                    name=node["entity_label"],
+                    content=node["context"],
+                    context=node["context"],
+                )
+                for node in maybe_nodes
+            ]
+        )
+
+        self.graph.create_edges(
+            [
+                dict(
+                    start_node_name=edge["start_node_name"],
+                    end_node_name=edge["end_node_name"],
+                    start_node_label=node_labels.get(edge["start_node_name"]),
+                    end_node_label=node_labels.get(edge["end_node_name"]),
+                    rel_type=edge["keywords"],
+                )
+                for edge in maybe_edges
+            ]
+        )
+        # 向量索引在构建时创建, 检索时只检查状态
+        self.graph.create_vector_index()
+
+    async def invoke(self):
+        results = [
+            result
+            async for result in self.scheduler.map(self.extract, self.iter_contents())
+        ]
+        self.write_results(results)
 
+    def replay(self) -> None:
+        """将已保存的全部抽取结果写入图数据库, 不调用模型"""
+        logging.info(f"回放 {self.store.count()} 个文本块的抽取结果")
+        self.write_results(self.store.iter_results())
 
 if __name__ == "__main__":
-    from src.config import hp
     from src.model import GeminiClient, OllamaClient, SiliconflowClient
     from src.toolkits import get_files_from_kb_space
 
@@ -1,10 +1,12 @@
 import os
+from typing import Callable, Iterator, Optional
 
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings
 
-from src.db import FaissDB
+from src.config import hp
+from src.db import ChemFactStore, FaissDB, ShardedFaissDB
 from src.parser import MsdsParser
 
 
@@ -15,28 +17,52 @@ class Msds2DB:
         files: list[str] | str,
         embed_model: Embeddings,
         db_path: str = "/root/Documents/msds-qa/kb",
+        embed_model_factory: Optional[Callable[[], Embeddings]] = None,
     ) -> None:
         self.files: list[str] = files if isinstance(files, list) else [files]
         self.parser = MsdsParser
+        self.embed_model: Embeddings = embed_model
+        # 分片构建时在子进程中创建嵌入模型
+        self.embed_model_factory = embed_model_factory
         self.db_path: str = db_path
         self.db = self.get_db()
+        self.fact_store = self.get_fact_store()
 
-    def get_documents(self) -> list[Document]:
-        documents = self.parser(self.files).invoke()
+    def get_documents(self) -> Iterator[Document]:
+        """流式解析全部文件, 文档边解析边嵌入入库"""
+        return self.parser(self.files).iter_documents()
 
-        return documents
+    def get_fact_store(self) -> ChemFactStore:
+        """抽取说明书中的结构化字段, 逐页文本已在构建向量库时缓存, 不需要重新解码PDF"""
+        fact_store = ChemFactStore(hp.chem_fact_store_path)
+        fact_store.sync(self.files)
+        return fact_store
 
-    def get_db(self) -> FAISS:
-        if os.path.exists(self.db_path) and os.path.isdir(self.db_path):
-            documents = []
-        else:
-            documents = self.get_documents()
+    def get_db(self) -> FAISS | ShardedFaissDB:
+        """
+        数据库已存在时按文件清单增量同步, 否则解析全部文件创建数据库;
+        分片数大于1时各分片在独立进程中构建
+        """
+        if hp.faiss_num_shards > 1:
+            db = ShardedFaissDB(
+                self.db_path,
+                self.embed_model,
+                embed_model_factory=self.embed_model_factory,
+            )
+            db.sync(self.files)
+            return db
+
+        db_exists = os.path.exists(self.db_path) and os.path.isdir(self.db_path)
+        documents = None if db_exists else self.get_documents()
 
         db = FaissDB(
             db_path=self.db_path,
-            embed_model=client.get_embed_model(),
+            embed_model=self.embed_model,
             documents=documents,
+            files=self.files,
         )
+        if db_exists:
+            db.sync(self.files)
         return db.get_db()
 
 
@@ -1,3 +1,5 @@
+import hashlib
+
 from src.prompt import (
     EntityContinueExtraction,
     EntityExtractionPrompt,
@@ -40,3 +42,19 @@ class Prompt:
     @staticmethod
     def get_default_entity_types() -> list[str]:
         return ["organization", "person", "location", "event"]
+
+    @staticmethod
+    def get_extraction_prompt_version() -> str:
+        """实体抽取提示词的版本号, 提示词或分隔符变化时随之变化"""
+        content = "\0".join(
+            [
+                EntityExtractionPrompt,
+                EntityContinueExtraction,
+                EntityIfLoopExtraction,
+                Prompt.get_default_tuple_delimiter(),
+                Prompt.get_default_record_delimiter(),
+                Prompt.get_default_completion_delimiter(),
+                ",".join(Prompt.get_default_entity_types()),
+            ]
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
@@ -1,2 +1,4 @@
+from .chem_fact_retriever import ChemFactRetriever
+from .faiss_retriever import FaissRetriever
 from .neo4j_retriever import Neo4jRetriever
 from .nrcc_cheminfo_retriever import ChemInfoRetriever
@@ -0,0 +1,34 @@
+from typing import Optional, Type
+
+from langchain.callbacks.manager import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from src.db import ChemFactStore
+from src.toolkits import ChemInfoModel
+
+
+class ChemFactQuery(BaseModel):
+    chem_name: str = Field(..., description="要查询的化学品名称或CAS号")
+
+
+class ChemFactRetriever(BaseTool):
+    name: str = "ChemFactRetriever"
+    description: str = (
+        "从本地说明书事实表中按化学品名称或CAS号直接查询闪点、熔点、沸点、爆炸极限、自燃温度、"
+        "急救措施、泄漏应急措施、灭火方法、危险性类别等字段的工具，速度快，优先使用。"
+    )
+    args_schema: Type[BaseModel] = ChemFactQuery
+
+    def __init__(self, store: ChemFactStore, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._store = store
+
+    def _run(
+        self, chem_name: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> dict[str, str] | None:
+        """执行化学品事实查询, 返回格式与ChemInfoRetriever一致"""
+        fields = self._store.resolve(chem_name)
+        if fields:
+            return ChemInfoModel(**fields).get_formated_info()
+        return None
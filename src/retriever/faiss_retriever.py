@@ -0,0 +1,35 @@
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.db import FaissDB, ShardedFaissDB
+from src.db.metadata_index import MetadataIndex
+
+
+class FaissRetriever(BaseRetriever):
+    """FAISS知识库检索器, 支持向量、BM25与混合检索"""
+
+    db: FaissDB | ShardedFaissDB
+    search_mode: str = "hybrid"
+    k: int = 10
+    score_threshold: float = 0.15
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        docs = self.db.search(
+            query,
+            search_mode=self.search_mode,
+            k=self.k,
+            score_threshold=self.score_threshold,
+        )
+        # 按部分切分的文本块正文中没有化学品名称, 补全元数据以便展示时使用,
+        # 旧版文档没有标注时从来源与正文推断
+        for doc in docs:
+            doc.metadata = {
+                "chemical": "",
+                "section": "",
+                **doc.metadata,
+                **MetadataIndex.get_tags(doc),
+            }
+        return docs
@@ -29,7 +29,7 @@ class Neo4jRetriever(BaseTool):
     ) -> list[Document]:
         return self._db.get_relevant_chunks(query=query)
 
-    # async def _arun(
-    #     self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    # ) -> list[Document]:
-    #     return self._db.get_relevant_chunks(query=query)
+    async def _arun(
+        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
+    ) -> list[Document]:
+        return await self._db.aget_relevant_chunks(query=query)
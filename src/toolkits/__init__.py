@@ -1,9 +1,17 @@
 from .chem_search_engine import ChemicalsDataSearchEngine, ChemInfoModel
+from .embedding_cache import EmbeddingCache
 from .funcs import (
     check_db_exists,
+    file_lock,
+    fuse_rankings,
+    get_file_hash,
     get_files_from_kb_space,
     get_json_from_str,
     parallel_map,
+    pipelined_map,
+    process_map,
     test_it,
+    top_k_indices,
     GHSS,
+    TokenBucket,
 )
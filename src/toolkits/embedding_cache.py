@@ -0,0 +1,141 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    嵌入向量缓存
+
+    以 (命名空间, 文本) 的sha256为键, 内存中保留最近使用的向量(LRU淘汰),
+    磁盘上以SQLite持久化全部向量, 重启或重建图谱时可直接复用.
+    """
+
+    def __init__(
+        self,
+        cache_path: str | None = None,
+        namespace: str = "",
+        max_size: int = 100_000,
+    ) -> None:
+        """
+        :param cache_path: SQLite缓存文件路径, None表示仅使用内存缓存
+        :param namespace: 命名空间, 一般为嵌入模型名称, 不同模型的向量互不干扰
+        :param max_size: 内存中最多保留的向量数
+        """
+        self.cache_path: str | None = cache_path
+        self.namespace: str = namespace
+        self.max_size: int = max_size
+        self.connect()
+
+    def connect(self) -> None:
+        """初始化内存缓存与SQLite连接"""
+        self.memory: OrderedDict[str, list[float]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.conn: sqlite3.Connection | None = None
+        if self.cache_path is not None:
+            cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(cache_dir, exist_ok=True)
+            self.conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embed BLOB)"
+            )
+            self.conn.commit()
+
+    def __getstate__(self) -> dict:
+        """跨进程传递时只传递配置, 在子进程中重新连接"""
+        return {
+            "cache_path": self.cache_path,
+            "namespace": self.namespace,
+            "max_size": self.max_size,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.connect()
+
+    def get_key(self, text: str) -> str:
+        """计算文本的缓存键"""
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def remember(self, key: str, embed: list[float]) -> None:
+        """写入内存缓存并按LRU淘汰"""
+        self.memory[key] = embed
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """
+        批量查询缓存
+
+        :param texts: 文本列表
+        :return: 与输入顺序一致的向量, 未命中的位置为None
+        """
+        keys = [self.get_key(text) for text in texts]
+        with self.lock:
+            found = {key: self.memory[key] for key in keys if key in self.memory}
+            for key in found:
+                self.memory.move_to_end(key)
+
+            missing = list({key for key in keys if key not in found})
+            if self.conn is not None and missing:
+                for idx in range(0, len(missing), 500):
+                    batch = missing[idx : idx + 500]
+                    rows = self.conn.execute(
+                        "SELECT key, embed FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        embed = np.frombuffer(blob, dtype=np.float32).tolist()
+                        found[key] = embed
+                        self.remember(key, embed)
+
+            results = [found.get(key) for key in keys]
+            hits = sum(embed is not None for embed in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: list[str], embeds: list[list[float]]) -> None:
+        """
+        批量写入缓存
+
+        :param texts: 文本列表
+        :param embeds: 与文本一一对应的向量
+        """
+        keys = [self.get_key(text) for text in texts]
+        with self.lock:
+            for key, embed in zip(keys, embeds):
+                self.remember(key, embed)
+            if self.conn is not None:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, embed) VALUES (?, ?)",
+                    [
+                        (key, np.asarray(embed, dtype=np.float32).tobytes())
+                        for key, embed in zip(keys, embeds)
+                    ],
+                )
+                self.conn.commit()
+
+    def get_hit_rate(self) -> float:
+        """缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_stats(self) -> dict[str, float]:
+        """缓存统计信息"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.get_hit_rate(),
+            "memory_size": len(self.memory),
+        }
@@ -1,11 +1,21 @@
+import asyncio
+import fcntl
+import hashlib
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
-from typing import Callable
+from typing import Callable, Iterable, Iterator
 
+import numpy as np
 from json_repair import json_repair
 from tqdm import tqdm
 
@@ -94,6 +104,200 @@ def parallel_map(
     return results
 
 
+def pipelined_map(
+    func: Callable,
+    container: Iterable,
+    max_workers: int = 10,
+    max_in_flight: int | None = None,
+) -> Iterator:
+    """
+    流水线映射函数, 使用线程池执行函数并按输入顺序惰性产出结果
+
+    与parallel_map不同, 输入可以是生成器, 同时在途的任务数不超过max_in_flight,
+    因此内存占用与输入规模无关.
+
+    :param func: 要执行的函数
+
+    :param container: 要处理的可迭代对象
+
+    :param max_workers: 最大工作线程数
+
+    :param max_in_flight: 最大在途任务数, 默认为max_workers的两倍
+
+    :return: 函数执行结果的迭代器
+    """
+    max_in_flight = max_in_flight or max_workers * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in container:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def apply_to_chunk(func: Callable, chunk: list) -> list:
+    """在子进程中对一组输入依次执行函数"""
+    return [func(item) for item in chunk]
+
+
+def process_map(
+    func: Callable,
+    container: Iterable,
+    max_workers: int | None = None,
+    chunk_size: int = 1,
+    max_in_flight: int | None = None,
+    initializer: Callable | None = None,
+    initargs: tuple = (),
+) -> Iterator:
+    """
+    进程池映射函数, 按输入顺序惰性产出结果, 用于受GIL限制的CPU密集任务
+
+    输入按chunk_size分组提交, 减少进程间的往返次数; 同时在途的分组数不超过max_in_flight,
+    内存占用与输入规模无关. func需为模块级函数, 输入与结果需可序列化.
+    faiss等库使用OpenMP, fork出的子进程可能死锁, 因此以spawn方式启动子进程.
+
+    :param func: 要执行的函数
+
+    :param container: 要处理的可迭代对象
+
+    :param max_workers: 最大进程数, 默认为CPU核数
+
+    :param chunk_size: 每个任务包含的输入数
+
+    :param max_in_flight: 最大在途任务数, 默认为max_workers的两倍
+
+    :param initializer: 每个子进程启动时执行一次的函数, 用于创建进程内复用的对象
+
+    :param initargs: initializer的参数
+
+    :return: 函数执行结果的迭代器
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 2
+    iterator = iter(container)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers, mp_context=context, initializer=initializer, initargs=initargs
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(apply_to_chunk, func, chunk))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    按最后一维选出得分最高的k个位置, 先用argpartition取出候选再对候选排序
+
+    :param scores: 得分数组, 一维或二维
+    :param k: 选出的个数
+    :return: 按得分降序排列的位置
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(
+        -np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable"
+    )
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def fuse_rankings(
+    ids: list[np.ndarray],
+    scores: list[np.ndarray],
+    limit: int,
+    method: str = "rrf",
+    rrf_k: int = 60,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    融合多路排序结果, 去重后返回全局top-k
+
+    :param ids: 每一路按得分降序排列的id
+    :param scores: 每一路与id对应的得分
+    :param limit: 返回的结果数
+    :param method: rrf(倒数排名融合) | max(取各路最高分)
+    :param rrf_k: 倒数排名融合的平滑常数
+    :return: 融合后的(id, 得分), 按得分降序排列
+    """
+    ids = [np.asarray(x) for x in ids if len(x)]
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    scores = [np.asarray(x, dtype=np.float64) for x in scores if len(x)]
+
+    all_ids = np.concatenate(ids)
+    unique_ids, inverse = np.unique(all_ids, return_inverse=True)
+
+    if method == "rrf":
+        ranks = np.concatenate([np.arange(len(x)) for x in ids])
+        fused = np.bincount(
+            inverse, weights=1.0 / (rrf_k + ranks + 1), minlength=len(unique_ids)
+        )
+    elif method == "max":
+        fused = np.full(len(unique_ids), -np.inf)
+        np.maximum.at(fused, inverse, np.concatenate(scores))
+    else:
+        raise ValueError(f"不支持的融合方式: {method}")
+
+    top = top_k_indices(fused, limit)
+    return unique_ids[top], fused[top]
+
+
+class TokenBucket:
+    """
+    令牌桶限流器, 线程安全, 同时提供同步和异步的获取接口
+
+    令牌不足时先预支再等待, 等待时长由欠下的令牌数和补充速率决定,
+    因此并发调用方按到达顺序依次放行.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        """
+        :param rate: 每秒补充的令牌数
+        :param capacity: 令牌桶容量, 即允许的突发量, 默认等于rate
+        """
+        self.rate: float = rate
+        self.capacity: float = capacity if capacity is not None else rate
+        self.tokens: float = self.capacity
+        self.updated_at: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        扣除令牌并返回需要等待的秒数
+
+        :param tokens: 需要的令牌数
+        :return: 等待秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """阻塞直到获得令牌"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1.0) -> None:
+        """异步等待直到获得令牌"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
 def get_files_from_kb_space(kb_path: str) -> list[str]:
     """
     获取指定路径下的所有PDF文件
@@ -117,6 +321,37 @@ def get_files_from_kb_space(kb_path: str) -> list[str]:
     return files
 
 
+def get_file_hash(file_path: str) -> str:
+    """
+    计算文件内容的sha256哈希
+
+    :param file_path: 文件路径
+
+    :return: 十六进制哈希值
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+@contextmanager
+def file_lock(lock_path: str) -> Iterator[None]:
+    """
+    跨进程的排他文件锁, 多个服务进程同时维护同一份磁盘文件时使用
+
+    :param lock_path: 锁文件路径, 不存在时创建
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def get_json_from_str(text: str) -> dict | None:
     """
     从字符串中提取JSON数据
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashEmbeddings(Embeddings):
+    """以文本哈希为种子生成确定性向量的嵌入模型, 测试时不访问嵌入接口"""
+
+    def __init__(self, dimensions: int = 8) -> None:
+        self.dimensions: int = dimensions
+
+    def embed_query(self, text: str) -> list[float]:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).random(self.dimensions).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture
+def embed_model() -> HashEmbeddings:
+    return HashEmbeddings()
+
+
+@pytest.fixture
+def make_source(tmp_path):
+    """在临时目录中写入源文件, 向量库的文件清单按文件内容哈希判断是否变化"""
+
+    def make(name: str, content: str = "") -> str:
+        path = tmp_path / "assets" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(content or name, encoding="utf-8")
+        return str(path)
+
+    return make
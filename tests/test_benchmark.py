@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+from src.eval.benchmark import HashEmbeddings, benchmark_neo4j, build_corpus
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_run_benchmark_skip_neo4j_writes_report(tmp_path):
+    output = tmp_path / "bench.json"
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "src.eval.benchmark",
+            "--output",
+            str(output),
+            "--num-chemicals",
+            "4",
+            "--num-queries",
+            "12",
+            "-k",
+            "3",
+            "--dimensions",
+            "32",
+            "--skip-neo4j",
+        ],
+        cwd=REPO_DIR,
+        check=True,
+        capture_output=True,
+    )
+    report = json.loads(output.read_text(encoding="utf-8"))
+
+    assert report["corpus"] == {
+        "chemicals": 4,
+        "chunks": 64,
+        "queries": 12,
+        "k": 3,
+        "dimensions": 32,
+        "seed": 0,
+    }
+    assert "skipped" in report["neo4j"]
+    assert report["faiss"]
+    for result in report["faiss"]:
+        assert result["search_mode"] in ("vector", "bm25", "hybrid")
+        for key in ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "build_s"):
+            assert result[key] >= 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert 0 <= result["recall@3"] <= 1
+        assert result["index_bytes"] == sum(result["files"].values()) > 0
+        assert not any(name.endswith(("-wal", "-shm")) for name in result["files"])
+
+
+def test_benchmark_neo4j_skips_unreachable_server(tmp_path):
+    embed_model = HashEmbeddings(16)
+    documents, labels = build_corpus(str(tmp_path / "corpus"), num_chemicals=1)
+
+    result = benchmark_neo4j(
+        str(tmp_path),
+        documents,
+        labels,
+        [("查询", documents[0].page_content)],
+        embed_model,
+        "bolt://127.0.0.1:1",
+        k=3,
+    )
+
+    assert set(result) == {"skipped"}
@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.db.embedding_mirror import EmbeddingMirror
+from src.db.neo4j_db import (
+    MIRROR_BACKFILL_CYPHER,
+    MIRROR_COUNT_CYPHER,
+    MIRROR_FULL_SYNC_CYPHER,
+    MIRROR_IDS_CYPHER,
+    MIRROR_INCREMENTAL_SYNC_CYPHER,
+    Neo4jDB,
+)
+
+
+def make_record(node_id: int, updated_at: float | None, seed: int = 0) -> dict:
+    embed = np.random.default_rng(node_id * 100 + seed).random(4).tolist()
+    return {"id": node_id, "embed": embed, "updated_at": updated_at}
+
+
+def list_versions(mirror_path: str) -> list[str]:
+    return [name for name in os.listdir(mirror_path) if name.startswith("v")]
+
+
+class FakeCursor:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+
+    def data(self) -> list[dict]:
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeGraph:
+    """按镜像同步使用的Cypher模拟图数据库, 节点以 id -> (embed, updated_at) 保存"""
+
+    def __init__(self) -> None:
+        self.nodes: dict[int, tuple[list[float], float | None]] = {}
+        self.clock = 1000.0
+
+    def put(self, node_id: int, seed: int = 0) -> None:
+        self.clock += 1
+        self.nodes[node_id] = (make_record(node_id, None, seed)["embed"], self.clock)
+
+    def rows(self, since: float | None = None) -> list[dict]:
+        return [
+            {"id": node_id, "embed": embed, "updated_at": updated_at}
+            for node_id, (embed, updated_at) in self.nodes.items()
+            if since is None or (updated_at is not None and updated_at >= since)
+        ]
+
+    def run(self, cypher: str, **parameters) -> FakeCursor:
+        if cypher == MIRROR_BACKFILL_CYPHER:
+            self.nodes = {
+                node_id: (embed, self.clock if updated_at is None else updated_at)
+                for node_id, (embed, updated_at) in self.nodes.items()
+            }
+            return FakeCursor([])
+        if cypher == MIRROR_FULL_SYNC_CYPHER:
+            return FakeCursor(self.rows())
+        if cypher == MIRROR_INCREMENTAL_SYNC_CYPHER:
+            return FakeCursor(self.rows(parameters["since"]))
+        if cypher == MIRROR_IDS_CYPHER:
+            return FakeCursor([{"id": node_id} for node_id in self.nodes])
+        raise AssertionError(f"unexpected cypher: {cypher}")
+
+    def evaluate(self, cypher: str) -> int:
+        assert cypher == MIRROR_COUNT_CYPHER
+        return len(self.nodes)
+
+
+@pytest.fixture
+def graph_db(tmp_path) -> Neo4jDB:
+    """只用于镜像同步的Neo4jDB, 不连接数据库"""
+    db = Neo4jDB.__new__(Neo4jDB)
+    db.graph = FakeGraph()
+    db.mirror = None
+    db.mirror_path = str(tmp_path / "mirror")
+    db.mirror_quantization = "none"
+    db.mirror_truncate_dim = None
+    return db
+
+
+def test_apply_merges_and_skips_unchanged(tmp_path):
+    mirror = EmbeddingMirror(str(tmp_path / "mirror"))
+    records = [make_record(node_id, 10.0 + node_id) for node_id in (3, 1, 2)]
+
+    assert mirror.apply(records) == 3
+    assert mirror.ids.tolist() == [1, 2, 3]
+    assert mirror.watermark == 13.0
+    # 按 >= 水位线重复拉取的节点不触发写盘
+    assert mirror.apply(records) == 0
+
+    updated = make_record(2, 20.0, seed=1)
+    assert mirror.apply([updated]) == 1
+    ids, scores = mirror.score([updated["embed"]])
+    assert ids[np.argmax(scores[0])] == 2
+    assert np.isclose(scores[0].max(), 1.0, atol=1e-5)
+
+
+def test_apply_removes_deleted_nodes_and_reloads(tmp_path):
+    mirror_path = str(tmp_path / "mirror")
+    mirror = EmbeddingMirror(mirror_path)
+    mirror.apply([make_record(node_id, 10.0) for node_id in (1, 2, 3)])
+
+    assert mirror.apply([make_record(2, 12.0, seed=1)], live_ids=[2, 3]) == 2
+    assert mirror.ids.tolist() == [2, 3]
+    assert mirror.stamps.tolist() == [12.0, 10.0]
+    # 只保留当前与上一个版本
+    mirror.apply([make_record(4, 13.0)])
+    assert len(list_versions(mirror_path)) == 2
+
+    reloaded = EmbeddingMirror(mirror_path)
+    assert reloaded.ids.tolist() == [2, 3, 4]
+    assert reloaded.watermark == 13.0
+    assert np.allclose(reloaded.embeds, mirror.embeds)
+
+
+@pytest.mark.parametrize("quantization", ["fp16", "int8"])
+def test_compact_mirror_deletes(tmp_path, quantization):
+    mirror = EmbeddingMirror(str(tmp_path / "mirror"), quantization=quantization)
+    records = [make_record(node_id, 10.0) for node_id in (1, 2, 3)]
+    mirror.apply(records)
+    mirror.apply([], live_ids=[1, 3])
+
+    ids, scores = mirror.score([records[2]["embed"]])
+    assert ids.tolist() == [1, 3]
+    assert ids[np.argmax(scores[0])] == 3
+    assert np.isclose(scores[0].max(), 1.0, atol=0.05)
+
+
+def test_sync_mirror_incremental_and_deletes(graph_db):
+    graph = graph_db.graph
+    for node_id in (1, 2, 3):
+        graph.put(node_id)
+    # 旧数据没有updated_at, 首次同步前回填
+    graph.nodes[3] = (graph.nodes[3][0], None)
+
+    mirror = graph_db.sync_mirror()
+    assert mirror.ids.tolist() == [1, 2, 3]
+
+    graph.put(2, seed=1)
+    graph.put(4)
+    del graph.nodes[3]
+    mirror = graph_db.sync_mirror()
+    assert mirror.ids.tolist() == [1, 2, 4]
+
+    ids, scores = mirror.score([graph.nodes[2][0]])
+    assert ids[np.argmax(scores[0])] == 2
+    assert np.isclose(scores[0].max(), 1.0, atol=1e-5)
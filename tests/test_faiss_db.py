@@ -0,0 +1,160 @@
+import os
+
+import pytest
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+import src.db.faiss_db
+from src.db.faiss_db import (
+    BUILD_INFO_FILE,
+    DOCSTORE_FILE,
+    LEGACY_DOCSTORE_FILE,
+    LEXICAL_INDEX_FILE,
+    FaissDB,
+)
+
+
+def make_documents(source: str, count: int) -> list[Document]:
+    chemical = os.path.splitext(os.path.basename(source))[0]
+    return [
+        Document(
+            page_content=f"{chemical} 急救措施 第{idx}条",
+            metadata={"source": source, "chemical": chemical},
+        )
+        for idx in range(count)
+    ]
+
+
+def test_empty_document_stream_is_rejected(tmp_path, embed_model):
+    db_path = tmp_path / "db"
+    with pytest.raises(ValueError, match="未解析出任何文档"):
+        FaissDB(str(db_path), embed_model, documents=(doc for doc in []))
+    assert not db_path.exists()
+
+
+def test_legacy_db_is_migrated_on_load(tmp_path, embed_model):
+    db_path = str(tmp_path / "db")
+    texts = [f"氢化钙 文本{idx}" for idx in range(5)]
+    FAISS.from_texts(
+        texts, embed_model, metadatas=[{"source": "氢化钙.pdf"}] * len(texts)
+    ).save_local(db_path)
+
+    db = FaissDB(db_path, embed_model, mmap=True)
+
+    assert os.path.exists(os.path.join(db_path, DOCSTORE_FILE))
+    assert not os.path.exists(os.path.join(db_path, LEGACY_DOCSTORE_FILE))
+    assert db.index_mapped
+    docs = db.search(texts[2], search_mode="vector", k=1, score_threshold=0.0)
+    assert docs[0].page_content == texts[2]
+
+
+def test_sync_removes_files_and_rebuilds_indexes(tmp_path, embed_model, make_source):
+    db_path = str(tmp_path / "db")
+    first, second = make_source("氢化钙.pdf"), make_source("乙醇.pdf")
+    documents = make_documents(first, 3) + make_documents(second, 2)
+    db = FaissDB(db_path, embed_model, documents=documents, index_type="flat")
+    assert db.db.index.ntotal == 5
+
+    # 词法索引缺失时加载只检查不重建, 同步时重建
+    os.remove(os.path.join(db_path, LEXICAL_INDEX_FILE))
+    db = FaissDB(db_path, embed_model)
+    assert not db.indexes_ready
+
+    stats = db.sync([first])
+    assert stats == {"added": 0, "modified": 0, "removed": 1}
+    assert db.indexes_ready
+    assert db.db.index.ntotal == 3
+    assert db.lexical_index.count() == db.metadata_index.count() == 3
+    docs = db.search("氢化钙 急救措施", search_mode="bm25", k=5)
+    assert {doc.metadata["source"] for doc in docs} == {first}
+
+
+def test_ivf_index_rejects_deletes(tmp_path, embed_model, make_source):
+    db_path = str(tmp_path / "db")
+    source = make_source("氢化钙.pdf")
+    db = FaissDB(
+        db_path,
+        embed_model,
+        documents=make_documents(source, 80),
+        index_type="ivf_flat",
+        nlist=2,
+        train_size=80,
+    )
+    ntotal = db.db.index.ntotal
+
+    with open(source, "w", encoding="utf-8") as f:
+        f.write("modified")
+    with pytest.raises(ValueError, match="不支持删除向量"):
+        db.sync([source])
+    assert FaissDB(db_path, embed_model).db.index.ntotal == ntotal
+
+
+class FakeParser:
+    """按文件生成文档的解析器, 记录同步时使用的切分方式"""
+
+    split_modes: list[str] = []
+
+    def __init__(self, files: list[str], max_workers=None, split_mode="section"):
+        self.files = files
+        self.split_modes.append(split_mode)
+
+    def iter_documents(self):
+        for file in self.files:
+            yield from make_documents(file, 4)
+
+
+def test_sync_resplits_db_built_with_other_split_mode(
+    tmp_path, embed_model, make_source, monkeypatch
+):
+    monkeypatch.setattr(src.db.faiss_db, "MsdsParser", FakeParser)
+    monkeypatch.setattr(FakeParser, "split_modes", [])
+    db_path = str(tmp_path / "db")
+    source = make_source("氢化钙.pdf")
+    FaissDB(
+        db_path, embed_model, documents=make_documents(source, 2), split_mode="recursive"
+    )
+
+    db = FaissDB(db_path, embed_model, split_mode="section")
+    assert db.load_split_mode() == "recursive"
+    # 文件内容未变化, 但切分方式不同, 按当前切分方式重新切分
+    assert db.sync([source]) == {"added": 0, "modified": 1, "removed": 0}
+    assert FakeParser.split_modes == ["section"]
+    assert db.db.index.ntotal == 4
+    assert db.load_split_mode() == "section"
+    assert db.sync([source]) == {"added": 0, "modified": 0, "removed": 0}
+
+
+def test_db_without_split_mode_record_is_resplit(
+    tmp_path, embed_model, make_source, monkeypatch
+):
+    monkeypatch.setattr(src.db.faiss_db, "MsdsParser", FakeParser)
+    db_path = str(tmp_path / "db")
+    source = make_source("氢化钙.pdf")
+    FaissDB(db_path, embed_model, documents=make_documents(source, 2))
+    # 旧版数据库没有记录切分方式
+    os.remove(os.path.join(db_path, BUILD_INFO_FILE))
+
+    db = FaissDB(db_path, embed_model)
+    assert db.sync([source])["modified"] == 1
+    assert db.load_split_mode() == db.split_mode
+
+
+def test_manifest_records_sources_without_documents(
+    tmp_path, embed_model, make_source, monkeypatch
+):
+    db_path = str(tmp_path / "db")
+    source, scanned = make_source("氢化钙.pdf"), make_source("扫描版.pdf")
+    db = FaissDB(
+        db_path,
+        embed_model,
+        documents=make_documents(source, 2),
+        files=[source, scanned],
+    )
+
+    manifest = db.load_manifest()
+    assert set(manifest) == {source, scanned}
+    assert manifest[scanned]["ids"] == []
+    assert os.path.exists(os.path.join(db_path, "files", "扫描版.pdf"))
+    # 文件均未变化, 同步时不重新解析未切分出文档的文件
+    monkeypatch.setattr(src.db.faiss_db, "MsdsParser", None)
+    assert db.sync([source, scanned]) == {"added": 0, "modified": 0, "removed": 0}
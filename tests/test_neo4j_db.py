@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from src.db.neo4j_db import SCAN_CYPHER, VECTOR_INDEX_STATE_CYPHER, Neo4jDB
+
+
+class FakeCursor:
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = rows
+
+    def data(self) -> list[dict]:
+        return self.rows
+
+
+class FakeGraph:
+    """记录执行的Cypher, 向量索引状态可由测试修改"""
+
+    def __init__(self, state: str | None) -> None:
+        self.state = state
+        self.statements: list[str] = []
+
+    def evaluate(self, cypher: str, **parameters):
+        self.statements.append(cypher)
+        assert cypher == VECTOR_INDEX_STATE_CYPHER
+        return self.state
+
+    def run(self, cypher: str, **parameters) -> FakeCursor:
+        self.statements.append(cypher)
+        if cypher == SCAN_CYPHER:
+            return FakeCursor([{"id": 7, "embed": [1.0, 0.0]}])
+        if cypher.startswith("CALL db.index.vector.queryNodes"):
+            return FakeCursor([{"id": 8, "score": 0.9}])
+        raise AssertionError(f"unexpected cypher: {cypher}")
+
+
+@pytest.fixture
+def graph_db() -> Neo4jDB:
+    """只用于节点检索的Neo4jDB, 不连接数据库"""
+    db = Neo4jDB.__new__(Neo4jDB)
+    db.graph = FakeGraph("POPULATING")
+    db.search_mode = "vector_index"
+    db.vector_index_ready = False
+    db.fusion_method = "rrf"
+    return db
+
+
+def test_offline_vector_index_falls_back_to_scan_for_one_call(graph_db):
+    query = np.array([[1.0, 0.0]]).tolist()
+
+    assert graph_db.search_nodes(query, limit=1) == [7]
+    # 检索时只读取索引状态, 不创建索引、不回填标签, 也不永久切换检索方式
+    assert graph_db.graph.statements == [VECTOR_INDEX_STATE_CYPHER, SCAN_CYPHER]
+    assert graph_db.search_mode == "vector_index"
+
+    graph_db.graph.state = "ONLINE"
+    assert graph_db.search_nodes(query, limit=1) == [8]
+    graph_db.graph.statements.clear()
+    assert graph_db.search_nodes(query, limit=1) == [8]
+    assert VECTOR_INDEX_STATE_CYPHER not in graph_db.graph.statements
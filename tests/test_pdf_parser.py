@@ -0,0 +1,79 @@
+from langchain.schema import Document
+
+from src.parser import MsdsSectionSplitter
+
+PAGES = [
+    "氢化钙安全技术说明书\n"
+    "第一部分 化学品及企业标识\n"
+    "化学品中文名：氢化钙\n"
+    "CAS号：7789-78-8\n"
+    "第二部分 危险性概述\n"
+    "危险性类别：遇水放出易燃气体的物质\n"
+    "急救措施：见第四部分\n",
+    "第三部分 成分/组成信息\n"
+    "纯品\n"
+    "第四部分 急救措施\n"
+    "皮肤接触：立即脱去污染的衣着，用大量流动清水冲洗。\n"
+    "眼睛接触：提起眼睑，用流动清水或生理盐水冲洗。\n",
+]
+
+
+def make_pages(texts: list[str]) -> list[Document]:
+    return [
+        Document(page_content=text, metadata={"source": "氢化钙.pdf", "page": page})
+        for page, text in enumerate(texts)
+    ]
+
+
+def test_find_sections_ignores_field_references():
+    text = "\n".join(PAGES)
+    sections = MsdsSectionSplitter.find_sections(text)
+
+    assert [name for _, name in sections] == [
+        "化学品及企业标识",
+        "危险性概述",
+        "成分/组成信息",
+        "急救措施",
+    ]
+    # 起始位置为标题的首个字符
+    assert all(text[start] == "第" for start, _ in sections)
+
+
+def test_split_documents_by_section():
+    docs = MsdsSectionSplitter(max_section_size=1500).split_documents(
+        make_pages(PAGES)
+    )
+
+    assert [doc.metadata["section"] for doc in docs] == [
+        "化学品及企业标识",
+        "危险性概述",
+        "成分/组成信息",
+        "急救措施",
+    ]
+    assert [doc.metadata["page"] for doc in docs] == [0, 0, 1, 1]
+    # 第一个部分标题之前的说明书标题并入第一个部分
+    assert docs[0].page_content.startswith("氢化钙安全技术说明书")
+    assert "急救措施：见第四部分" in docs[1].page_content
+    assert docs[3].page_content.startswith("第四部分 急救措施")
+
+
+def test_long_section_is_split_by_subsection():
+    skin = "皮肤接触：" + "用大量流动清水冲洗。" * 30 + "\n"
+    eyes = "眼睛接触：" + "用生理盐水冲洗。" * 30 + "\n"
+    text = "第四部分 急救措施\n" + skin + eyes
+    splitter = MsdsSectionSplitter(max_section_size=len(skin) + 20)
+
+    chunks = splitter.split_section(text)
+
+    assert [name for name, _ in chunks] == ["皮肤接触", "眼睛接触"]
+    assert all(len(chunk) <= splitter.max_section_size for _, chunk in chunks)
+    assert "".join(chunk for _, chunk in chunks) == text
+
+
+def test_document_without_headings_falls_back_to_characters():
+    pages = make_pages(["没有部分标题的文本。" * 100])
+    docs = MsdsSectionSplitter(max_section_size=300).split_documents(pages)
+
+    assert len(docs) > 1
+    assert all(len(doc.page_content) <= 300 for doc in docs)
+    assert all("section" not in doc.metadata for doc in docs)
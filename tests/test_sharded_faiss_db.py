@@ -0,0 +1,35 @@
+import json
+import os
+
+from langchain.schema import Document
+
+from src.db.faiss_db import FaissDB
+from src.db.sharded_faiss_db import LAYOUT_FILE, ShardedFaissDB
+
+
+def build_shard(db: ShardedFaissDB, shard_id: int, source: str, texts: list[str]):
+    documents = [
+        Document(page_content=text, metadata={"source": source}) for text in texts
+    ]
+    FaissDB(db.get_shard_path(shard_id), db.embed_model, documents=documents)
+
+
+def test_lexical_scores_use_corpus_wide_statistics(tmp_path, embed_model, make_source):
+    db_path = str(tmp_path / "db")
+    os.makedirs(db_path)
+    with open(os.path.join(db_path, LAYOUT_FILE), "w", encoding="utf-8") as f:
+        json.dump({"num_shards": 4}, f)
+    db = ShardedFaissDB(db_path, embed_model, num_shards=4, prefilter=False)
+
+    # 前三个分片都是与查询只有 "急救措施" 重叠的无关文本块, 相关文本块位于很小的分片中
+    for shard_id in range(3):
+        source = make_source(f"通用{shard_id}.pdf")
+        texts = [f"急救措施 第{idx}行 用清水冲洗" for idx in range(20)]
+        build_shard(db, shard_id, source, texts)
+    relevant = "氢化钙的急救措施：脱离接触后用干燥砂土覆盖"
+    build_shard(db, 3, make_source("氢化钙.pdf"), [relevant])
+    db.shards = db.load_shards()
+
+    docs = db.search("氢化钙的急救措施", search_mode="bm25", k=3)
+
+    assert docs[0].page_content == relevant